@@ -0,0 +1,105 @@
+"""
+Compares mapping collections to categories by walking the disease ontology for every
+category with the precomputed category bitmasks of the CategoryMapper, and mapping
+the collections one by one with mapping them in a batch. Also shows that mapping
+with many more rules takes about as long as mapping with the default rules.
+Usage: python benchmark_categories.py [number of collections]
+"""
+
+import random
+import sys
+import time
+from copy import deepcopy
+from typing import List
+
+from benchmark_data import generate_disease_ontology
+
+from molgenis.bbmri_eric.categories import (
+    DISEASE_CATEGORIES,
+    Category,
+    CategoryMapper,
+    CategoryRules,
+)
+
+collection_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+diseases = generate_disease_ontology()
+print(f"Disease ontology with {len(diseases.rows_by_id)} terms")
+
+rng = random.Random(42)
+term_ids = list(diseases.rows_by_id)
+collections = [
+    {
+        "diagnosis_available": rng.sample(term_ids, rng.randint(1, 10)),
+        "type": rng.sample(["RD", "CASE_CONTROL", "BIRTH_COHORT", "OTHER"], 2),
+        "age_low": rng.randint(0, 40),
+        "age_high": rng.randint(40, 90),
+        "age_unit": rng.choice(["YEAR", "MONTH"]),
+    }
+    for _ in range(collection_count)
+]
+
+
+def map_diseases_by_walking(collection: dict) -> List[str]:
+    """The category mapping before the bitmasks: a walk per diagnosis and category."""
+    categories = []
+    diagnoses = deepcopy(collection.get("diagnosis_available", []))
+    diagnoses.extend(diseases.get_matching_ontologies(diagnoses))
+    diagnoses = set(diagnoses)
+    for category, terms in DISEASE_CATEGORIES:
+        if any(diseases.is_descendant_of_any(d, terms) for d in diagnoses):
+            categories.append(category.value)
+    for diagnosis in diagnoses:
+        if diseases.rows_by_id[diagnosis].get("ontology", "") == "orphanet":
+            categories.append(Category.RARE_DISEASE.value)
+            break
+    return categories
+
+
+def map_diseases_by_masks(mapper: CategoryMapper, collection: dict) -> List[str]:
+    return mapper.map({"diagnosis_available": collection["diagnosis_available"]})
+
+
+start = time.perf_counter()
+walked = [map_diseases_by_walking(collection) for collection in collections]
+walking_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+mapper = CategoryMapper(diseases)
+mapper.term_masks
+build_seconds = time.perf_counter() - start
+masked = [map_diseases_by_masks(mapper, collection) for collection in collections]
+mask_seconds = time.perf_counter() - start
+
+assert walked == masked
+print(f"{'walking the ontology':<40}{walking_seconds * 1000:>10.1f} ms")
+print(f"{'bitmasks (including the table)':<40}{mask_seconds * 1000:>10.1f} ms")
+print(f"{'  of which building the table':<40}{build_seconds * 1000:>10.1f} ms")
+
+start = time.perf_counter()
+one_by_one = [mapper.map(collection) for collection in collections]
+one_by_one_seconds = time.perf_counter() - start
+
+start = time.perf_counter()
+batch = mapper.map_many(collections)
+batch_seconds = time.perf_counter() - start
+
+assert [sorted(c) for c in one_by_one] == [sorted(c) for c in batch]
+print(f"{'map (one by one)':<40}{one_by_one_seconds * 1000:>10.1f} ms")
+print(f"{'map_many':<40}{batch_seconds * 1000:>10.1f} ms")
+
+# rules that collections rarely match, so that the number of categories in the
+# results (and the time to create those lists) stays about the same
+rules = CategoryRules.default()
+for i in range(200):
+    rules.term_roots[f"extra{i}"] = set(rng.sample(term_ids, 5))
+    rules.age_limits[f"extra{i}"] = {"DAY": rng.randint(1, 90), "YEAR": 0}
+    rules.collection_types[f"EXTRA{i}"] = {f"extra{i}"}
+many_rules_mapper = CategoryMapper(diseases, rules)
+many_rules_mapper.term_masks
+
+start = time.perf_counter()
+many_rules_mapper.map_many(collections)
+many_rules_seconds = time.perf_counter() - start
+print(
+    f"{'map_many with 200 extra categories':<40}{many_rules_seconds * 1000:>10.1f} ms"
+)
@@ -0,0 +1,200 @@
+"""
+Generates synthetic node data for the benchmark scripts in this folder.
+"""
+
+import random
+from typing import List
+
+from molgenis.bbmri_eric.categories import DISEASE_CATEGORIES
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    OntologyTable,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+
+ATTRIBUTES = {
+    TableType.PERSONS: {"first_name": "string", "last_name": "string"},
+    TableType.NETWORKS: {"name": "string", "contact": "xref", "url": "hyperlink"},
+    TableType.ALSO_KNOWN: {"name_system": "string", "url": "hyperlink"},
+    TableType.BIOBANKS: {
+        "name": "string",
+        "contact": "xref",
+        "network": "mref",
+        "also_known_in": "mref",
+        "url": "hyperlink",
+        "collaboration_commercial": "bool",
+    },
+    TableType.COLLECTIONS: {
+        "name": "string",
+        "biobank": "xref",
+        "contact": "xref",
+        "network": "mref",
+        "also_known_in": "mref",
+        "type": "mref",
+        "diagnosis_available": "mref",
+        "age_low": "int",
+        "age_high": "int",
+        "age_unit": "categorical",
+        "url": "hyperlink",
+    },
+    TableType.FACTS: {"collection": "xref", "number_of_samples": "int"},
+}
+
+
+def create_meta(node: Node, table_type: TableType) -> TableMeta:
+    items = [{"data": {"name": "id", "idAttribute": True, "type": "string"}}]
+    for name, type_ in ATTRIBUTES[table_type].items():
+        items.append({"data": {"name": name, "idAttribute": False, "type": type_}})
+    return TableMeta(
+        meta={"id": node.get_staging_id(table_type), "attributes": {"items": items}}
+    )
+
+
+def generate_node_data(
+    node: Node, biobanks: int, collections_per_biobank: int, diagnoses: List[str] = None
+) -> NodeData:
+    """
+    Generates a node with the requested number of biobanks and collections. Every
+    collection has a few facts.
+    """
+    rng = random.Random(42)
+    diagnoses = diagnoses if diagnoses else ["urn:miriam:icd:C97"]
+
+    def id_(table_type: TableType, i) -> str:
+        return f"{node.get_id_prefix(table_type)}{table_type.value}{i}"
+
+    persons = [
+        {"id": id_(TableType.PERSONS, i), "first_name": f"F{i}", "last_name": f"L{i}"}
+        for i in range(biobanks)
+    ]
+    networks = [
+        {
+            "id": id_(TableType.NETWORKS, i),
+            "name": f"Network {i}",
+            "contact": persons[i]["id"],
+            "url": f"https://network{i}.org",
+        }
+        for i in range(max(1, biobanks // 10))
+    ]
+    also_known_in = [
+        {
+            "id": id_(TableType.ALSO_KNOWN, i),
+            "name_system": "BBMRI",
+            "url": f"https://aki{i}.org",
+        }
+        for i in range(max(1, biobanks // 10))
+    ]
+    biobank_rows = []
+    collections = []
+    facts = []
+    for i in range(biobanks):
+        biobank = {
+            "id": id_(TableType.BIOBANKS, i),
+            "name": f"Biobank {i}",
+            "contact": persons[i]["id"],
+            "network": [rng.choice(networks)["id"]],
+            "also_known_in": [rng.choice(also_known_in)["id"]],
+            "url": f"https://biobank{i}.org",
+            "collaboration_commercial": rng.random() < 0.5,
+        }
+        biobank_rows.append(biobank)
+        for j in range(collections_per_biobank):
+            collection = {
+                "id": f"{biobank['id']}:collection{j}",
+                "name": f"Collection {i}.{j}",
+                "biobank": biobank["id"],
+                "contact": persons[i]["id"],
+                "network": [rng.choice(networks)["id"]],
+                "also_known_in": [],
+                "type": rng.sample(["RD", "CASE_CONTROL", "BIRTH_COHORT", "OTHER"], 2),
+                "diagnosis_available": rng.sample(diagnoses, min(3, len(diagnoses))),
+                "age_low": rng.randint(0, 40),
+                "age_high": rng.randint(40, 90),
+                "age_unit": "YEAR",
+                "url": f"https://biobank{i}.org/collection{j}",
+            }
+            collections.append(collection)
+            for k in range(3):
+                facts.append(
+                    {
+                        "id": f"{node.get_id_prefix(TableType.FACTS)}{i}_{j}_{k}",
+                        "collection": collection["id"],
+                        "number_of_samples": rng.randint(1, 10000),
+                    }
+                )
+
+    rows = {
+        TableType.PERSONS: persons,
+        TableType.NETWORKS: networks,
+        TableType.ALSO_KNOWN: also_known_in,
+        TableType.BIOBANKS: biobank_rows,
+        TableType.COLLECTIONS: collections,
+        TableType.FACTS: facts,
+    }
+    tables = {
+        type_.value: Table.of(type_, create_meta(node, type_), rows[type_])
+        for type_ in TableType.get_import_order()
+    }
+    return NodeData.from_dict(node=node, source=Source.STAGING, tables=tables)
+
+
+def generate_disease_ontology(
+    blocks_per_chapter: int = 20, terms_per_block: int = 40, orphanet_terms: int = 10000
+) -> OntologyTable:
+    """
+    Generates a disease ontology with about the size and depth of the real one: the
+    22 ICD-10 chapters with blocks, categories and subcategories, the root terms of
+    the categories and a set of Orphanet terms that are mapped to ICD-10 terms.
+    """
+    rng = random.Random(42)
+    icd = "urn:miriam:icd:"
+    chapters = [
+        "I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI",
+        "XII", "XIII", "XIV", "XV", "XVI", "XVII", "XVIII", "XIX", "XX", "XXI", "XXII",
+    ]  # fmt: skip
+    rows = []
+    for chapter in chapters:
+        rows.append({"id": f"{icd}{chapter}", "ontology": "ICD-10"})
+        for b in range(blocks_per_chapter):
+            block = f"{icd}{chapter}.B{b}"
+            rows.append({"id": block, "parentId": f"{icd}{chapter}"})
+            for t in range(terms_per_block):
+                term = f"{block}.T{t}"
+                rows.append({"id": term, "parentId": block})
+                for s in range(3):
+                    rows.append({"id": f"{term}.{s}", "parentId": term})
+
+    # place the root terms of the categories that aren't chapters in the hierarchy
+    ids = {row["id"] for row in rows}
+    leaves = [row for row in rows if row["id"].count(".") == 3]
+    for _, terms in DISEASE_CATEGORIES:
+        for term in sorted(terms - ids):
+            rows.append({"id": term, "parentId": rng.choice(leaves)["id"]})
+            rows.append({"id": f"{term}.0", "parentId": term})
+            ids.add(term)
+
+    icd_terms = [row["id"] for row in rows]
+    for o in range(orphanet_terms):
+        rows.append({"id": f"ORPHA:{o}", "ontology": "orphanet"})
+        if o % 2 == 0:
+            rng.choice(rows[: len(icd_terms)]).setdefault("exact_mapping", []).append(
+                f"ORPHA:{o}"
+            )
+
+    return OntologyTable.of(
+        TableMeta(
+            meta={
+                "id": "eu_bbmri_eric_disease_types",
+                "attributes": {
+                    "items": [{"data": {"name": "id", "idAttribute": True}}]
+                },
+            }
+        ),
+        rows,
+        "parentId",
+        ["exact_mapping", "ntbt_mapping"],
+    )
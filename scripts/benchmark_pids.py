@@ -0,0 +1,73 @@
+"""
+Compares the ways of managing PIDs against a local handle server with a fixed latency
+per request: one biobank at a time, with a pool of worker threads, with the changes
+deferred to one request per handle and on an event loop with the AsyncPidManager.
+Half of the biobanks are new (half of those are withdrawn) and the other half have a
+new name.
+Usage, from the root of the repository:
+python -m scripts.benchmark_pids [number of biobanks] [latency in ms]
+"""
+
+import sys
+import time
+from unittest.mock import MagicMock
+
+from molgenis.bbmri_eric.model import Table, TableType
+from molgenis.bbmri_eric.pid_manager import AsyncPidManager, PidManager
+from tests.local_handle_server import LocalHandleServer
+
+biobank_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 10) / 1000
+
+
+def create_tables(server: LocalHandleServer, base_url: str):
+    existing = []
+    for i in range(biobank_count // 2):
+        pid = f"{server.prefix}/existing-{i}"
+        server.add_handle(
+            pid,
+            [
+                {"index": 1, "type": "URL", "data": f"{base_url}#/biobank/b{i}"},
+                {"index": 2, "type": "NAME", "data": f"biobank{i}"},
+            ],
+        )
+        existing.append({"id": f"b{i}", "name": f"biobank{i}", "pid": pid})
+
+    rows = [dict(row, name=f"renamed{row['id']}") for row in existing]
+    rows += [
+        {"id": f"b{i}", "name": f"biobank{i}", "withdrawn": i % 2 == 0}
+        for i in range(len(rows), biobank_count)
+    ]
+    for row in existing:
+        row["withdrawn"] = False
+    return (
+        Table.of(TableType.BIOBANKS, MagicMock(), rows),
+        Table.of(TableType.BIOBANKS, MagicMock(), existing),
+    )
+
+
+def run(name: str, **kwargs):
+    with LocalHandleServer(latency=latency) as server:
+        pid_service = server.create_pid_service()
+        biobanks, existing = create_tables(server, pid_service.base_url)
+        if kwargs.pop("asynchronous", False):
+            pid_manager = AsyncPidManager(pid_service, MagicMock(), **kwargs)
+        else:
+            pid_manager = PidManager(pid_service, MagicMock(), **kwargs)
+
+        start = time.perf_counter()
+        pid_manager.assign_biobank_pids(biobanks)
+        pid_manager.update_biobank_pids(biobanks, existing)
+        pid_manager.flush()
+        duration = time.perf_counter() - start
+
+        requests = sum(server.request_counts.values())
+        print(f"{name:<28}{duration * 1000:>8.0f} ms {requests:>6} requests")
+
+
+print(f"{biobank_count} biobanks, {latency * 1000:.0f} ms latency")
+run("sequential")
+run("8 workers", workers=8)
+run("deferred", deferred=True)
+run("deferred, 8 workers", deferred=True, workers=8)
+run("async, 8 concurrent", asynchronous=True)
@@ -0,0 +1,70 @@
+"""
+Compares saving and loading NodeData as a snapshot with pickle and JSON.
+Usage: python benchmark_snapshot.py [number of biobanks]
+"""
+
+import json
+import pickle
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+from benchmark_data import generate_node_data
+
+from molgenis.bbmri_eric.model import Node, TableType
+from molgenis.bbmri_eric.snapshot import load_snapshot, save_snapshot
+
+biobanks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+node_data = generate_node_data(Node("NL", "Netherlands"), biobanks, 10)
+print(f"Node with {len(node_data.collections.rows_by_id)} collections")
+
+directory = Path(tempfile.mkdtemp())
+pickle_path = directory / "node.pkl"
+json_path = directory / "node.json"
+snapshot_path = directory / "node.snapshot"
+
+
+def save_pickle():
+    with open(pickle_path, "wb") as file:
+        pickle.dump(node_data, file)
+
+
+def load_pickle():
+    with open(pickle_path, "rb") as file:
+        return pickle.load(file)
+
+
+def save_json():
+    tables = {
+        table.type.value: {"meta": table.meta.meta, "rows": table.rows}
+        for table in node_data.import_order
+    }
+    with open(json_path, "w") as file:
+        json.dump(tables, file)
+
+
+def load_json():
+    with open(json_path, "r") as file:
+        return json.load(file)
+
+
+benchmarks = [
+    ("pickle save", save_pickle),
+    ("pickle load", load_pickle),
+    ("json save", save_json),
+    ("json load", load_json),
+    ("snapshot save", lambda: save_snapshot(node_data, snapshot_path)),
+    ("snapshot load", lambda: load_snapshot(snapshot_path)),
+    (
+        "snapshot load (biobanks only)",
+        lambda: load_snapshot(snapshot_path, table_types=[TableType.BIOBANKS]),
+    ),
+]
+
+for name, function in benchmarks:
+    seconds = min(timeit.repeat(function, number=1, repeat=5))
+    print(f"{name:<32}{seconds * 1000:>10.1f} ms")
+
+for path in [pickle_path, json_path, snapshot_path]:
+    print(f"{path.name:<32}{path.stat().st_size / 1024:>10.0f} KiB")
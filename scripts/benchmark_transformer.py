@@ -0,0 +1,88 @@
+"""
+Compares the pass-by-pass and the fused execution of the Transformer.
+Usage: python benchmark_transformer.py [number of biobanks]
+"""
+
+import gc
+import sys
+import time
+from copy import deepcopy
+from typing import List, Tuple
+from unittest.mock import MagicMock
+
+from benchmark_data import generate_node_data
+
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    Table,
+    TableType,
+)
+from molgenis.bbmri_eric.transformer import Transformer
+
+biobanks = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+node_data = generate_node_data(Node("NL", "Netherlands"), biobanks, 10)
+eu_node_data = generate_node_data(Node("EU", "Europe"), 1, 1)
+print(f"Node with {len(node_data.collections.rows_by_id)} collections")
+
+quality = QualityInfo(
+    biobanks={id_: ["q"] for id_ in list(node_data.biobanks.rows_by_id)[::2]},
+    biobank_levels={id_: ["eric"] for id_ in list(node_data.biobanks.rows_by_id)[::2]},
+    collections={},
+    collection_levels={},
+)
+diseases = OntologyTable.of(
+    MagicMock(id_attribute="id"),
+    [
+        {"id": "urn:miriam:icd:II"},
+        {"id": "urn:miriam:icd:C97", "parentId": "urn:miriam:icd:II"},
+    ],
+    "parentId",
+)
+existing_biobanks = Table.of_empty(TableType.BIOBANKS, MagicMock())
+
+
+class NoCategoryMapper:
+    @staticmethod
+    def map(collection: dict):
+        return []
+
+    @staticmethod
+    def map_many(collections: List[dict]):
+        return [[] for _ in collections]
+
+
+def transform(fused: bool, map_categories: bool = True) -> Tuple[NodeData, float]:
+    data = deepcopy(node_data)
+    transformer = Transformer(
+        node_data=data,
+        quality=quality,
+        printer=MagicMock(),
+        existing_biobanks=existing_biobanks,
+        eu_node_data=eu_node_data,
+        diseases=diseases,
+        fused=fused,
+    )
+    if not map_categories:
+        transformer.category_mapper = NoCategoryMapper()
+
+    gc.disable()
+    start = time.perf_counter()
+    transformer.transform()
+    seconds = time.perf_counter() - start
+    gc.enable()
+    return data, seconds
+
+
+for map_categories in [True, False]:
+    for fused in [False, True]:
+        seconds = min(transform(fused, map_categories)[1] for _ in range(5))
+        mode = "fused" if fused else "pass-by-pass"
+        if not map_categories:
+            mode += " (without categories)"
+        print(f"{mode:<40}{seconds * 1000:>10.1f} ms")
+
+passes, fused_ = transform(False)[0], transform(True)[0]
+assert [t.rows for t in passes.import_order] == [t.rows for t in fused_.import_order]
@@ -0,0 +1,35 @@
+"""
+Measures the validation of a large node with some invalid ids and hyperlinks.
+Usage: python benchmark_validation.py [number of biobanks]
+"""
+
+import sys
+import time
+from unittest.mock import MagicMock
+
+from benchmark_data import generate_node_data
+
+from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.validation import Validator
+
+biobanks = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+node_data = generate_node_data(Node("NL", "Netherlands"), biobanks, 10)
+for i, person in enumerate(node_data.persons.rows):
+    if i % 100 == 0:
+        node_data.persons.rows_by_id.pop(person["id"])
+        person["id"] = person["id"].replace("NL_", "BE_")
+        node_data.persons.rows_by_id[person["id"]] = person
+for i, biobank in enumerate(node_data.biobanks.rows):
+    if i % 50 == 0:
+        biobank["url"] = "www.invalid@url.nl"
+rows = sum(len(table.rows_by_id) for table in node_data.import_order)
+print(f"Node with {rows} rows")
+
+seconds = []
+for _ in range(5):
+    start = time.perf_counter()
+    warnings = Validator(node_data, MagicMock()).validate()
+    seconds.append(time.perf_counter() - start)
+
+print(f"{len(warnings)} warnings")
+print(f"{'validation':<40}{min(seconds) * 1000:>10.1f} ms")
@@ -2,8 +2,10 @@ import os
 from collections import defaultdict
 from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import List
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
 
+from molgenis.bbmri_eric.categories import CategoryRules
 from molgenis.bbmri_eric.model import (
     EricData,
     ExternalServerNode,
@@ -30,6 +32,11 @@ class AttributesRequest:
     facts: List[str]
 
 
+PageHandler = Callable[[TableType, TableMeta, List[dict], int], None]
+"""Function that is called with every page of rows that is retrieved, with the type
+and metadata of the table and the index of the page's first row"""
+
+
 class MolgenisImportError(MolgenisRequestError):
     pass
 
@@ -52,14 +59,32 @@ class ImportMetadataAction(Enum):
     IGNORE = "ignore"
 
 
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_DELETE_BATCH_SIZE = 1000
+
+
 class EricSession(Session):
     """
     A session with a BBMRI ERIC directory. Contains methods to get national nodes,
     their (staging) data and quality information.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        delete_batch_size: int = DEFAULT_DELETE_BATCH_SIZE,
+        **kwargs,
+    ):
+        """
+        :param batch_size: the number of rows that are retrieved per request
+        :param delete_batch_size: the number of rows that are deleted per request
+        """
         super().__init__(*args, **kwargs)
+        if batch_size < 1 or delete_batch_size < 1:
+            raise ValueError("Batch sizes must be at least 1")
+        self.batch_size = batch_size
+        self.delete_batch_size = delete_batch_size
 
     NODES_TABLE = "eu_bbmri_eric_national_nodes"
 
@@ -81,7 +106,7 @@ class EricSession(Session):
 
         rows = self.get(
             entity_type_id,
-            batch_size=10000,
+            batch_size=self.batch_size,
             attributes=f"id,{parent_attr},ontology,{','.join(matching_attrs)}",
             uploadable=True,
         )
@@ -96,13 +121,13 @@ class EricSession(Session):
 
         biobank_qualities = self.get(
             "eu_bbmri_eric_bio_qual_info",
-            batch_size=10000,
+            batch_size=self.batch_size,
             attributes="id,biobank,assess_level_bio",
             uploadable=True,
         )
         collection_qualities = self.get(
             "eu_bbmri_eric_col_qual_info",
-            batch_size=10000,
+            batch_size=self.batch_size,
             attributes="id,collection,assess_level_col",
             uploadable=True,
         )
@@ -125,6 +150,23 @@ class EricSession(Session):
             collection_levels=coll_level,
         )
 
+    def get_category_rules(
+        self, entity_type_id: str = "eu_bbmri_eric_category_rules"
+    ) -> CategoryRules:
+        """
+        Retrieves the rules that derive the categories of collections from a table with
+        one rule per row. (See CategoryRules.from_rows)
+        :param entity_type_id: the identifier of the rules table
+        :return: a CategoryRules object
+        """
+        rows = self.get(
+            entity_type_id,
+            batch_size=self.batch_size,
+            attributes="id,category,rule,value,unit",
+            uploadable=True,
+        )
+        return CategoryRules.from_rows(rows)
+
     def get_node(self, code: str) -> Node:
         """
         Retrieves a single Node object from the national nodes table.
@@ -210,11 +252,16 @@ class EricSession(Session):
                 )
         return result
 
-    def get_staging_node_data(self, node: Node) -> NodeData:
+    def get_staging_node_data(
+        self, node: Node, page_handler: Optional[PageHandler] = None
+    ) -> NodeData:
         """
         Gets the six tables that belong to a single node's staging area.
 
         :param Node node: the node to get the staging data for
+        :param page_handler: a function that is called with every page of rows as
+        soon as it's retrieved, for example to validate the rows. It can stop the
+        retrieval by raising an exception.
         :return: a NodeData object
         """
         tables = dict()
@@ -222,10 +269,18 @@ class EricSession(Session):
             id_ = node.get_staging_id(table_type)
             meta = TableMeta(meta=self.get_meta(id_))
 
+            if page_handler:
+                rows = []
+                for page in self.get_pages(id_):
+                    page_handler(table_type, meta, page, len(rows))
+                    rows.extend(page)
+            else:
+                rows = self.get(id_, batch_size=self.batch_size, uploadable=True)
+
             tables[table_type.value] = Table.of(
                 table_type=table_type,
                 meta=meta,
-                rows=self.get(id_, batch_size=10000, uploadable=True),
+                rows=rows,
             )
 
         return NodeData.from_dict(node=node, source=Source.STAGING, tables=tables)
@@ -249,7 +304,7 @@ class EricSession(Session):
                 meta=meta,
                 rows=self.get(
                     id_,
-                    batch_size=10000,
+                    batch_size=self.batch_size,
                     q=f"national_node=={node.code}",
                     uploadable=True,
                 ),
@@ -258,52 +313,139 @@ class EricSession(Session):
         return NodeData.from_dict(node=node, source=Source.PUBLISHED, tables=tables)
 
     def get_published_data(
-        self, nodes: List[Node], attributes: AttributesRequest
+        self, nodes: List[Node], attributes: Optional[AttributesRequest] = None
     ) -> MixedData:
         """
         Gets the six tables that belong to one or more nodes from the published tables.
         Filters the rows based on the national_node field.
 
         :param List[Node] nodes: the node(s) to get the published data for
-        :param AttributesRequest attributes: the attributes to get for each table
+        :param AttributesRequest attributes: the attributes to get for each table,
+        defaults to all attributes
         :return: an EricData object
         """
 
         if len(nodes) == 0:
             raise ValueError("No nodes provided")
 
-        attributes = asdict(attributes)
+        attributes = asdict(attributes) if attributes else dict()
         codes = [node.code for node in nodes]
         tables = dict()
         for table_type in TableType.get_import_order():
             id_ = table_type.base_id
             meta = TableMeta(self.get_meta(id_))
-            attrs = attributes[table_type.value]
+            attrs = attributes.get(table_type.value)
 
             tables[table_type.value] = Table.of(
                 table_type=table_type,
                 meta=meta,
                 rows=self.get(
                     id_,
-                    batch_size=10000,
+                    batch_size=self.batch_size,
                     q=f"national_node=in=({','.join(codes)})",
-                    attributes=",".join(attrs),
+                    attributes=",".join(attrs) if attrs else None,
                     uploadable=True,
                 ),
             )
 
         return MixedData.from_mixed_dict(source=Source.PUBLISHED, tables=tables)
 
+    def get_pages(
+        self,
+        entity_type_id: str,
+        batch_size: Optional[int] = None,
+        q: str | None = None,
+        attributes: str | None = None,
+    ) -> Iterator[List[dict]]:
+        """
+        Retrieves the rows of a table page by page. Does the same as
+        get(..., uploadable=True), but yields each page in the uploadable format as
+        soon as it's retrieved. The metadata that's needed for the conversion is
+        retrieved once, not for every page.
+
+        :param entity_type_id: the identifier of the table
+        :param batch_size: the number of rows per page, defaults to self.batch_size
+        :param q: an optional RSQL query
+        :param attributes: the attributes to retrieve, defaults to all
+        :return: an iterator of pages of rows
+        """
+        sort_column = self.get_entity_meta_data(entity_type_id)["idAttribute"]
+        reference_ids = self._get_reference_ids(entity_type_id)
+        start = 0
+        while True:
+            response = self._get_batch(
+                entity=entity_type_id,
+                q=q,
+                attributes=attributes,
+                batch_size=batch_size if batch_size else self.batch_size,
+                start=start,
+                sort_column=sort_column,
+                raw=True,
+            )
+            yield self._to_upload_format(response["items"], reference_ids)
+
+            if "nextHref" not in response:
+                return
+            start = parse_qs(urlparse(response["nextHref"]).query)["start"][0]
+
+    def _get_reference_ids(self, entity_type_id: str) -> Dict[str, str]:
+        """
+        Returns the id attributes of the tables that the reference attributes of a
+        table refer to, by the name of the reference attribute.
+        """
+        meta = self.get_meta(entity_type_id, expand=True, abstract=True)
+        reference_ids = dict()
+        for attribute in meta["attributes"]["items"]:
+            if "refEntityType" in attribute["data"]:
+                ref_attributes = attribute["data"]["refEntityType"]["attributes"]
+                for ref_attribute in ref_attributes["items"]:
+                    if ref_attribute["data"]["idAttribute"] is True:
+                        name = attribute["data"]["name"]
+                        reference_ids[name] = ref_attribute["data"]["name"]
+        return reference_ids
+
+    @staticmethod
+    def _to_upload_format(
+        rows: List[dict], reference_ids: Dict[str, str]
+    ) -> List[dict]:
+        """
+        Does the same as Session.to_upload_format, with the id attributes of the
+        referenced tables given: removes the non-data fields and replaces references
+        with their ids.
+        """
+        for row in rows:
+            row.pop("_href", None)
+            row.pop("_meta", None)
+            for attribute, value in row.items():
+                if type(value) is dict:
+                    row[attribute] = value[reference_ids[attribute]]
+                elif type(value) is list and len(value) > 0:
+                    id_attribute = reference_ids[attribute]
+                    row[attribute] = [ref[id_attribute] for ref in value]
+        return rows
+
+    def delete_list(self, entity: str, entities: List[str]):
+        """
+        Deletes rows by id, in batches of at most delete_batch_size ids, because the
+        directory limits the number of rows that can be deleted with one request.
+        """
+        for i in range(0, len(entities), self.delete_batch_size):
+            super().delete_list(entity, entities[i : i + self.delete_batch_size])
+
     def upload_data(self, data: EricData):
         """
         Converts the six tables of an EricData object to CSV, bundles them in
-        a ZIP archive and imports them through the import API.
+        a ZIP archive and imports them through the import API. The rows are not
+        changed, so the data can still be used after it's uploaded.
         :param data: an EricData object
         """
 
         importable_data = dict()
         for table in data.import_order:
-            importable_data[table.full_name] = table.rows
+            # the CSV writer joins lists in the rows it's given, so give it copies
+            importable_data[table.full_name] = (
+                dict(row) for row in table.rows_by_id.values()
+            )
 
         self.import_data(
             importable_data,
@@ -317,9 +459,13 @@ class ExternalServerSession(Session):
     A session with a national node's external server (for example BBMRI-NL).
     """
 
-    def __init__(self, node: ExternalServerNode):
+    def __init__(self, node: ExternalServerNode, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        :param batch_size: the number of rows that are retrieved per request
+        """
         super().__init__(url=node.url, token=node.token)
         self.node = node
+        self.batch_size = batch_size
 
     def get_node_data(self) -> NodeData:
         """
@@ -338,7 +484,7 @@ class ExternalServerSession(Session):
                 tables[table_type.value] = Table.of(
                     table_type=table_type,
                     meta=meta,
-                    rows=self.get(id_, batch_size=10000, uploadable=True),
+                    rows=self.get(id_, batch_size=self.batch_size, uploadable=True),
                 )
 
         return NodeData.from_dict(
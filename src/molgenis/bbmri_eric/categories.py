@@ -1,6 +1,11 @@
-from copy import deepcopy
+import json
+import weakref
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
 from enum import Enum
-from typing import List, Set
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
 
 from molgenis.bbmri_eric.model import OntologyTable
 
@@ -140,9 +145,321 @@ POPULATION_TERMS = {
 }
 
 
+DISEASE_CATEGORIES = [
+    (Category.AUTOIMMUNE, AUTOIMMUNE_TERMS),
+    (Category.CARDIOVASCULAR, CARDIOVASCULAR_TERMS),
+    (Category.COVID19, COVID_TERMS),
+    (Category.INFECTIOUS, INFECTIOUS_TERMS),
+    (Category.METABOLIC, METABOLIC_TERMS),
+    (Category.NERVOUS_SYSTEM, NERVOUS_SYSTEM_TERMS),
+    (Category.ONCOLOGY, ONCOLOGY_TERMS),
+    (Category.POPULATION, POPULATION_TERMS),
+]
+"""The categories that are derived from the disease ontology and their root terms"""
+
+
+@dataclass(frozen=True)
+class CategoryRules:
+    """
+    The rules that derive the categories of a collection from its diagnoses, its
+    types and its age range. The default rules are the constants in this module, but
+    rules can also be loaded from a configuration file or from a table in the
+    directory.
+    """
+
+    term_roots: Dict[str, Set[str]]
+    """Per category the disease terms that it's derived from, including children"""
+
+    ontologies: Dict[str, str]
+    """Per ontology the category of its terms, excluding children"""
+
+    collection_types: Dict[str, Set[str]]
+    """Per collection type the categories that it's derived from"""
+
+    age_limits: Dict[str, Dict[str, int]]
+    """Per category and age unit the age below which a collection belongs to it"""
+
+    RULE_TYPES = ["term_root", "ontology", "collection_type", "age_limit"]
+
+    @staticmethod
+    def default() -> "CategoryRules":
+        return CategoryRules(
+            term_roots={
+                category.value: set(terms) for category, terms in DISEASE_CATEGORIES
+            },
+            ontologies={"orphanet": Category.RARE_DISEASE.value},
+            collection_types={
+                "RD": {Category.RARE_DISEASE.value},
+                "BIRTH_COHORT": {Category.PAEDIATRICS.value},
+                "CASE_CONTROL": {Category.POPULATION.value},
+                "POPULATION_BASED": {Category.POPULATION.value},
+            },
+            age_limits={
+                Category.PAEDIATRICS.value: {
+                    unit.value: limit for unit, limit in PAEDIATRIC_AGE_LIMIT.items()
+                }
+            },
+        )
+
+    @staticmethod
+    def from_dict(rules: dict) -> "CategoryRules":
+        """
+        Creates rules from a dictionary in the format of to_dict, for example:
+        {
+            "term_roots": {"oncology": ["urn:miriam:icd:II"]},
+            "ontologies": {"orphanet": "rare_disease"},
+            "collection_types": {"RD": ["rare_disease"]},
+            "age_limits": {"paediatrics": {"YEAR": 18, "MONTH": 216}}
+        }
+        """
+        return CategoryRules(
+            term_roots={
+                category: set(terms)
+                for category, terms in rules.get("term_roots", {}).items()
+            },
+            ontologies=dict(rules.get("ontologies", {})),
+            collection_types={
+                type_: set(categories)
+                for type_, categories in rules.get("collection_types", {}).items()
+            },
+            age_limits={
+                category: dict(limits)
+                for category, limits in rules.get("age_limits", {}).items()
+            },
+        )
+
+    @staticmethod
+    def from_file(path: Union[str, Path]) -> "CategoryRules":
+        """Loads rules from a JSON file in the format of to_dict."""
+        return CategoryRules.from_dict(json.loads(Path(path).read_text()))
+
+    @staticmethod
+    def from_rows(rows: List[dict]) -> "CategoryRules":
+        """
+        Creates rules from the rows of a rules table. Every row is a single rule with a
+        category, a rule type (see RULE_TYPES), a value and, for age limits, a unit.
+
+        :raise: ValueError if a row has an unknown rule type
+        """
+        rules = {rule_type: defaultdict(dict) for rule_type in CategoryRules.RULE_TYPES}
+        for row in rows:
+            category = row["category"]
+            rule_type = row["rule"]
+            value = row["value"]
+            if rule_type == "term_root":
+                rules[rule_type][category][value] = None
+            elif rule_type == "ontology":
+                rules[rule_type][value] = category
+            elif rule_type == "collection_type":
+                rules[rule_type][value][category] = None
+            elif rule_type == "age_limit":
+                rules[rule_type][category][row["unit"]] = int(value)
+            else:
+                raise ValueError(f"Unknown category rule type: {rule_type}")
+
+        return CategoryRules.from_dict(
+            {
+                "term_roots": rules["term_root"],
+                "ontologies": rules["ontology"],
+                "collection_types": rules["collection_type"],
+                "age_limits": rules["age_limit"],
+            }
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "term_roots": {
+                category: sorted(terms) for category, terms in self.term_roots.items()
+            },
+            "ontologies": dict(self.ontologies),
+            "collection_types": {
+                type_: sorted(categories)
+                for type_, categories in self.collection_types.items()
+            },
+            "age_limits": {
+                category: dict(limits) for category, limits in self.age_limits.items()
+            },
+        }
+
+    @property
+    def categories(self) -> List[str]:
+        """
+        All categories of the rules. The categories of the Category enum come first,
+        in the order of the enum, followed by other categories in alphabetical order.
+        """
+        categories = set(self.term_roots)
+        categories.update(self.ontologies.values())
+        for type_categories in self.collection_types.values():
+            categories.update(type_categories)
+        categories.update(self.age_limits)
+
+        known = [
+            category.value for category in Category if category.value in categories
+        ]
+        return known + sorted(categories.difference(known))
+
+
+class CategoryMatcher:
+    """
+    CategoryRules compiled into lookup tables. Every category is a bit in a category
+    bitmask. The rules are indexed by what they match on: the root terms and
+    ontologies by term, the collection types by type and the age limits by unit.
+    Matching a collection takes one lookup per diagnosis and per type, and a binary
+    search in the age limits of its unit, regardless of the number of rules.
+    """
+
+    def __init__(self, rules: CategoryRules):
+        self.rules = rules
+        self.categories = rules.categories
+        self.bits = {category: 1 << i for i, category in enumerate(self.categories)}
+
+        self.root_masks: Dict[str, int] = defaultdict(int)
+        for category, terms in rules.term_roots.items():
+            for term in terms:
+                self.root_masks[term] |= self.bits[category]
+
+        self.ontology_masks: Dict[str, int] = {
+            ontology: self.bits[category]
+            for ontology, category in rules.ontologies.items()
+        }
+
+        self.type_masks: Dict[str, int] = defaultdict(int)
+        for type_, categories in rules.collection_types.items():
+            for category in categories:
+                self.type_masks[type_] |= self.bits[category]
+
+        self.age_limits: Dict[str, Tuple[List[int], List[int]]] = dict()
+        limits_by_unit = defaultdict(list)
+        for category, limits in rules.age_limits.items():
+            for unit, limit in limits.items():
+                limits_by_unit[unit].append((limit, self.bits[category]))
+        for unit, limits in limits_by_unit.items():
+            limits.sort()
+            masks = [0] * (len(limits) + 1)
+            for i in range(len(limits) - 1, -1, -1):
+                masks[i] = masks[i + 1] | limits[i][1]
+            self.age_limits[unit] = ([limit for limit, _ in limits], masks)
+
+        self._categories_by_mask: Dict[int, List[str]] = dict()
+
+    def get_age_mask(self, collection: dict) -> int:
+        """
+        Returns the categories of the age range of a collection. A collection matches
+        an age limit if its lower or upper age is below the limit. Collections without
+        a valid age range don't match.
+        """
+        unit = collection.get("age_unit", None)
+        if not unit or unit not in self.age_limits:
+            return 0
+
+        low = collection.get("age_low", None)
+        high = collection.get("age_high", None)
+        if low is not None and high is not None:
+            if (low == 0 and high == 0) or (low > high):
+                return 0
+            age = low
+        elif low is not None:
+            age = low
+        elif high is not None:
+            age = high
+        else:
+            return 0
+
+        limits, masks = self.age_limits[unit]
+        return masks[bisect_right(limits, age)]
+
+    def get_type_mask(self, collection: dict) -> int:
+        mask = 0
+        for type_ in collection.get("type", []):
+            mask |= self.type_masks.get(type_, 0)
+        return mask
+
+    def get_categories(self, mask: int) -> List[str]:
+        """Returns a new list with the categories of a bitmask."""
+        categories = self._categories_by_mask.get(mask)
+        if categories is None:
+            categories = []
+            remaining = mask
+            while remaining:
+                bit = remaining & -remaining
+                categories.append(self.categories[bit.bit_length() - 1])
+                remaining ^= bit
+            self._categories_by_mask[mask] = categories
+        return list(categories)
+
+
+_term_masks_cache: Dict[int, Dict[str, Dict[str, int]]] = dict()
+"""The term bitmasks per disease ontology (by id) and per rules (by their JSON),
+shared by the mappers of all nodes. The entries of an ontology are removed when it's
+garbage collected."""
+
+
 class CategoryMapper:
-    def __init__(self, diseases: OntologyTable):
+    def __init__(self, diseases: OntologyTable, rules: Optional[CategoryRules] = None):
+        """
+        :param diseases: the disease ontology
+        :param rules: the category rules, defaults to CategoryRules.default()
+        """
+        rules = rules if rules else CategoryRules.default()
         self.diseases = diseases
+        self.matcher = CategoryMatcher(rules)
+        self._rules_key = json.dumps(rules.to_dict(), sort_keys=True)
+        self._term_masks: Optional[Tuple[OntologyTable, Dict[str, int]]] = None
+
+    @property
+    def term_masks(self) -> Dict[str, int]:
+        """
+        A category bitmask for every term of the disease ontology. Built on first use
+        with a single top-down traversal of the ontology: a term inherits the bits of
+        its parent and gets the bit of every category it's a root term of. Terms also
+        get the category of their ontology, which their children don't inherit.
+
+        Mappers with the same ontology and equal rules share the bitmasks, because
+        equal rules are compiled to the same bits.
+        """
+        if self._term_masks is None or self._term_masks[0] is not self.diseases:
+            self._term_masks = (self.diseases, self._get_shared_term_masks())
+        return self._term_masks[1]
+
+    def _get_shared_term_masks(self) -> Dict[str, int]:
+        key = id(self.diseases)
+        masks_by_rules = _term_masks_cache.get(key)
+        if masks_by_rules is None:
+            masks_by_rules = dict()
+            _term_masks_cache[key] = masks_by_rules
+            weakref.finalize(self.diseases, _term_masks_cache.pop, key, None)
+
+        term_masks = masks_by_rules.get(self._rules_key)
+        if term_masks is None:
+            term_masks = self._build_term_masks()
+            masks_by_rules[self._rules_key] = term_masks
+        return term_masks
+
+    def _build_term_masks(self) -> Dict[str, int]:
+        root_masks = self.matcher.root_masks
+        ontology_masks = self.matcher.ontology_masks
+        rows_by_id = self.diseases.rows_by_id
+        parent_attr = self.diseases.parent_attr
+        children = defaultdict(list)
+        roots = []
+        for id_, row in rows_by_id.items():
+            parent = row.get(parent_attr)
+            if parent in rows_by_id:
+                children[parent].append(id_)
+            else:
+                roots.append(id_)
+
+        masks = dict()
+        stack = [(id_, 0) for id_ in roots]
+        while stack:
+            id_, parent_mask = stack.pop()
+            mask = parent_mask | root_masks.get(id_, 0)
+            stack.extend((child, mask) for child in children[id_])
+            ontology = rows_by_id[id_].get("ontology", None)
+            if ontology:
+                mask |= ontology_masks.get(ontology, 0)
+            masks[id_] = mask
+        return masks
 
     def map(self, collection: dict) -> List[str]:
         """
@@ -151,88 +468,42 @@ class CategoryMapper:
         :param collection: the collection to map
         :return: a list of categories
         """
-        categories = []
-
-        self._map_paediatric(collection, categories)
-        self._map_diseases(collection, categories)
-        self._map_collection_types(collection, categories)
+        return self.map_many([collection])[0]
 
-        return list(set(categories))
-
-    @classmethod
-    def _map_paediatric(cls, collection: dict, categories: List[str]):
-        unit = collection.get("age_unit", None)
-        if unit:
-            low = collection.get("age_low", None)
-            high = collection.get("age_high", None)
-
-            if (
-                low is not None
-                and high is not None
-                and ((low == 0 and high == 0) or (low > high))
-            ):
-                return
-
-            age_limit = PAEDIATRIC_AGE_LIMIT[AgeUnit[unit]]
-            if high is not None and (high < age_limit):
-                categories.append(Category.PAEDIATRICS.value)
-            if low is not None and (low < age_limit):
-                # categories.append(Category.PAEDIATRIC_INCLUDED.value)
-                categories.append(Category.PAEDIATRICS.value)
-
-    @classmethod
-    def _map_collection_types(cls, collection: dict, categories: List[str]):
-        if "RD" in collection.get("type", []):
-            categories.append(Category.RARE_DISEASE.value)
-        if "BIRTH_COHORT" in collection.get("type", []):
-            categories.append(Category.PAEDIATRICS.value)
-        if "CASE_CONTROL" in collection.get(
-            "type", []
-        ) or "POPULATION_BASED" in collection.get("type", []):
-            categories.append(Category.POPULATION.value)
-
-    def _map_diseases(self, collection: dict, categories: List[str]):
-        diagnoses = deepcopy(collection.get("diagnosis_available", []))
-        if diagnoses:
-            if self.diseases.matching_attrs:
-                matching_diagnoses = self.diseases.get_matching_ontologies(diagnoses)
-                diagnoses.extend(matching_diagnoses)
-                diagnoses = set(diagnoses)
-
-            if self._contains_descendant_of(diagnoses, AUTOIMMUNE_TERMS):
-                categories.append(Category.AUTOIMMUNE.value)
-
-            if self._contains_descendant_of(diagnoses, CARDIOVASCULAR_TERMS):
-                categories.append(Category.CARDIOVASCULAR.value)
-
-            if self._contains_descendant_of(diagnoses, COVID_TERMS):
-                categories.append(Category.COVID19.value)
-
-            if self._contains_descendant_of(diagnoses, INFECTIOUS_TERMS):
-                categories.append(Category.INFECTIOUS.value)
-
-            if self._contains_descendant_of(diagnoses, METABOLIC_TERMS):
-                categories.append(Category.METABOLIC.value)
-
-            if self._contains_descendant_of(diagnoses, NERVOUS_SYSTEM_TERMS):
-                categories.append(Category.NERVOUS_SYSTEM.value)
-
-            if self._contains_descendant_of(diagnoses, ONCOLOGY_TERMS):
-                categories.append(Category.ONCOLOGY.value)
-
-            if self._contains_descendant_of(diagnoses, POPULATION_TERMS):
-                categories.append(Category.POPULATION.value)
-
-            if self._contains_orphanet(diagnoses):
-                categories.append(Category.RARE_DISEASE.value)
-
-    def _contains_orphanet(self, diagnoses: List[str]) -> bool:
-        for diagnosis in diagnoses:
-            term = self.diseases.rows_by_id.get(diagnosis, None)
-            if term and term.get("ontology", "") == "orphanet":
-                return True
-
-    def _contains_descendant_of(self, diagnoses: List[str], terms: Set[str]):
-        for diagnosis in diagnoses:
-            if self.diseases.is_descendant_of_any(diagnosis, terms):
-                return True
+    def map_many(self, collections: Iterable[dict]) -> List[List[str]]:
+        """
+        Maps a batch of collections to the lists of categories that they belong to.
+        Every distinct diagnosis is expanded with its matching ontologies and looked up
+        in the term bitmasks only once per batch. The categories of a collection are
+        combined in a bitmask.
+
+        :param collections: the collections to map
+        :return: for each collection, in input order, a list of categories ordered
+        like CategoryRules.categories
+        """
+        matcher = self.matcher
+        diagnosis_masks = dict()
+
+        results = []
+        for collection in collections:
+            mask = matcher.get_age_mask(collection) | matcher.get_type_mask(collection)
+
+            for diagnosis in collection.get("diagnosis_available", None) or []:
+                diagnosis_mask = diagnosis_masks.get(diagnosis)
+                if diagnosis_mask is None:
+                    diagnosis_mask = self._get_diagnosis_mask(diagnosis)
+                    diagnosis_masks[diagnosis] = diagnosis_mask
+                mask |= diagnosis_mask
+
+            results.append(matcher.get_categories(mask))
+        return results
+
+    def _get_diagnosis_mask(self, diagnosis: str) -> int:
+        """Returns the bitmask of a diagnosis and its matching ontologies."""
+        term_masks = self.term_masks
+        mask = term_masks[diagnosis]
+        row = self.diseases.rows_by_id[diagnosis]
+        for attr in self.diseases.matching_attrs or []:
+            for matching_diagnosis in row.get(attr, None) or []:
+                mask |= term_masks[matching_diagnosis]
+        return mask
@@ -0,0 +1,212 @@
+import json
+import secrets
+import shutil
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from molgenis.bbmri_eric.categories import CategoryRules
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    TableMeta,
+)
+from molgenis.bbmri_eric.publisher import PublishingState
+from molgenis.bbmri_eric.snapshot import load_snapshot, save_snapshot
+
+
+class PublishingCheckpoint:
+    """
+    Records the progress of a publishing run in a run directory, so that a run that
+    was interrupted can be resumed without redoing the work that was finished.
+
+    The run directory contains:
+    1. run.json: the nodes of the run, the outcome of each node that was prepared and
+       the publishing phases that were completed
+    2. existing.snapshot, eu_node.snapshot, quality.json and diseases.json: the data
+       that was retrieved to prepare the nodes
+    3. nodes/<code>.snapshot: the prepared data of each node
+
+    The run directory is removed when the run finishes.
+    """
+
+    PUBLISHED = "published"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+    def __init__(self, directory: Path, run: dict):
+        self.directory = Path(directory)
+        self.run = run
+
+    @property
+    def run_id(self) -> str:
+        return self.run["run_id"]
+
+    @staticmethod
+    def create(runs_dir: Path, state: PublishingState) -> "PublishingCheckpoint":
+        """
+        Starts a new run and stores the data that was retrieved to prepare the nodes.
+
+        :param runs_dir: the directory to create the run directory in
+        :param state: the publishing state before any node is prepared
+        """
+        run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(3)}"
+        checkpoint = PublishingCheckpoint(
+            Path(runs_dir) / run_id,
+            {
+                "run_id": run_id,
+                "nodes": [node.code for node in state.nodes],
+                "prepared": dict(),
+                "phases": [],
+            },
+        )
+        (checkpoint.directory / "nodes").mkdir(parents=True)
+        save_snapshot(state.existing_data, checkpoint.directory / "existing.snapshot")
+        save_snapshot(state.eu_node_data, checkpoint.directory / "eu_node.snapshot")
+        checkpoint._write_json("quality.json", asdict(state.quality_info))
+        checkpoint._write_json(
+            "diseases.json",
+            {
+                "meta": state.diseases.meta.meta,
+                "rows": state.diseases.rows,
+                "parent_attr": state.diseases.parent_attr,
+                "matching_attrs": state.diseases.matching_attrs,
+            },
+        )
+        checkpoint._save_run()
+        return checkpoint
+
+    @staticmethod
+    def load(runs_dir: Path, run_id: str) -> "PublishingCheckpoint":
+        """
+        :raise: ValueError if the run doesn't exist, for example because it finished
+        """
+        directory = Path(runs_dir) / run_id
+        if not (directory / "run.json").exists():
+            raise ValueError(f"Unknown publishing run: {run_id}")
+
+        run = json.loads((directory / "run.json").read_text())
+        return PublishingCheckpoint(directory, run)
+
+    def load_state(
+        self, nodes: List[Node], report: ErrorReport, category_rules: CategoryRules
+    ) -> PublishingState:
+        """
+        Restores the publishing state of the run, with the data of the nodes that were
+        prepared added to the data to publish and their warnings and errors added to
+        the report.
+
+        :raise: ValueError if the nodes are not the nodes of the run
+        """
+        if [node.code for node in nodes] != self.run["nodes"]:
+            raise ValueError(
+                f"Publishing run {self.run_id} was started with nodes "
+                f"{', '.join(self.run['nodes'])}"
+            )
+
+        diseases = self._read_json("diseases.json")
+        state = PublishingState(
+            existing_data=load_snapshot(self.directory / "existing.snapshot"),
+            eu_node_data=load_snapshot(self.directory / "eu_node.snapshot"),
+            quality_info=QualityInfo(**self._read_json("quality.json")),
+            diseases=OntologyTable.of(
+                TableMeta(diseases["meta"]),
+                diseases["rows"],
+                diseases["parent_attr"],
+                diseases["matching_attrs"],
+            ),
+            category_rules=category_rules,
+            nodes=nodes,
+            report=report,
+        )
+
+        for node in nodes:
+            prepared = self.run["prepared"].get(node.code)
+            if not prepared:
+                continue
+
+            report.add_node_warnings(
+                node, [EricWarning(message) for message in prepared["warnings"]]
+            )
+            if prepared["status"] == self.PUBLISHED:
+                state.data_to_publish.merge(
+                    load_snapshot(self._get_node_path(node), node=node)
+                )
+            else:
+                state.existing_data.remove_node_rows(node)
+            if prepared["status"] == self.FAILED:
+                report.add_node_error(node, EricError(prepared["error"]))
+        return state
+
+    def is_prepared(self, node: Node) -> bool:
+        return node.code in self.run["prepared"]
+
+    def get_fingerprints(self, nodes: List[Node]) -> Dict[Node, str]:
+        """Returns the fingerprints of the nodes that were prepared for publishing."""
+        fingerprints = dict()
+        for node in nodes:
+            prepared = self.run["prepared"].get(node.code)
+            if prepared and prepared["fingerprint"]:
+                fingerprints[node] = prepared["fingerprint"]
+        return fingerprints
+
+    def set_prepared(
+        self,
+        node: Node,
+        node_data: NodeData,
+        report: ErrorReport,
+        fingerprint: Optional[str] = None,
+    ):
+        """Stores the prepared data of a node."""
+        save_snapshot(node_data, self._get_node_path(node))
+        self._set_node(node, self.PUBLISHED, report, fingerprint=fingerprint)
+
+    def set_skipped(self, node: Node, report: ErrorReport):
+        """Records that a node is skipped because it hasn't changed."""
+        self._set_node(node, self.SKIPPED, report)
+
+    def set_failed(self, node: Node, error: EricError, report: ErrorReport):
+        """Records that a node couldn't be prepared."""
+        self._set_node(node, self.FAILED, report, error=str(error))
+
+    def is_done(self, phase: str) -> bool:
+        return phase in self.run["phases"]
+
+    def set_done(self, phase: str):
+        """Records that a publishing phase is completed."""
+        self.run["phases"].append(phase)
+        self._save_run()
+
+    def finish(self):
+        """Removes the run directory, a finished run can't be resumed."""
+        shutil.rmtree(self.directory)
+
+    def _set_node(self, node: Node, status: str, report: ErrorReport, **kwargs):
+        self.run["prepared"][node.code] = {
+            "status": status,
+            "warnings": [w.message for w in report.node_warnings.get(node, [])],
+            "error": None,
+            "fingerprint": None,
+            **kwargs,
+        }
+        self._save_run()
+
+    def _get_node_path(self, node: Node) -> Path:
+        return self.directory / "nodes" / f"{node.code}.snapshot"
+
+    def _save_run(self):
+        # Write to a temporary file first, so an interruption can't corrupt the run
+        path = self.directory / "run.json"
+        temporary_path = path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(self.run, indent=2))
+        temporary_path.replace(path)
+
+    def _write_json(self, name: str, value):
+        (self.directory / name).write_text(json.dumps(value, default=str))
+
+    def _read_json(self, name: str):
+        return json.loads((self.directory / name).read_text())
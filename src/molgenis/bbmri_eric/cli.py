@@ -0,0 +1,393 @@
+"""
+The bbmri-eric command line interface, to stage, publish and plan the publishing of
+nodes without writing a script.
+
+Only the standard library is imported when the module is loaded. The rest of the
+library, and pyhandle, are imported when a command runs, so that `bbmri-eric --help`
+and invalid arguments are handled quickly.
+"""
+
+import argparse
+import getpass
+import os
+import sys
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+from molgenis.bbmri_eric import __version__
+
+if TYPE_CHECKING:
+    from molgenis.bbmri_eric.bbmri_client import EricSession
+    from molgenis.bbmri_eric.eric import Eric
+    from molgenis.bbmri_eric.model import Node
+    from molgenis.bbmri_eric.pid_service import BasePidService
+    from molgenis.bbmri_eric.printer import Printer
+
+PID_SERVICES = ["handle", "dummy", "noop"]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Runs a command and returns the exit code: 0 if all nodes succeeded, 1 if a node
+    or the run failed and 2 if the arguments are invalid.
+    """
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    with _create_printer(args.trace) as printer, _profiling(args.profile, printer):
+        try:
+            return args.run(args, printer)
+        except UsageError as e:
+            parser.error(str(e))
+
+
+class UsageError(Exception):
+    """Raised for invalid options and unknown node codes or runs."""
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="bbmri-eric",
+        description="Stages and publishes the data of the national nodes of the "
+        "BBMRI-ERIC directory.",
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    commands = parser.add_subparsers(title="commands", metavar="COMMAND")
+    commands.required = True
+
+    common = _create_common_parser()
+    publishing = _create_publishing_parser()
+
+    stage = commands.add_parser(
+        "stage",
+        parents=[common],
+        help="copy the data of nodes with an external server to their staging areas",
+    )
+    _add_nodes_argument(stage)
+    stage.set_defaults(run=_stage)
+
+    publish = commands.add_parser(
+        "publish",
+        parents=[common, publishing],
+        help="publish the staged data of nodes to the combined tables",
+    )
+    _add_nodes_argument(publish)
+    publish.add_argument(
+        "--cache-dir",
+        help="directory for the fingerprints of published nodes and the checkpoints "
+        "of publishing runs",
+    )
+    publish.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip nodes that haven't changed since they were last published "
+        "(requires --cache-dir)",
+    )
+    publish.add_argument(
+        "--checkpoints",
+        action="store_true",
+        help="write checkpoints, so a run that doesn't finish can be resumed "
+        "(requires --cache-dir)",
+    )
+    publish.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="resume a publishing run that didn't finish (requires --cache-dir)",
+    )
+    publish.set_defaults(run=_publish)
+
+    plan = commands.add_parser(
+        "plan",
+        parents=[common, publishing],
+        help="show what publishing nodes would change, without changing anything",
+    )
+    _add_nodes_argument(plan)
+    plan.set_defaults(run=_plan)
+    return parser
+
+
+def _create_common_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+
+    directory = parser.add_argument_group("directory")
+    directory.add_argument(
+        "--url",
+        default=os.getenv("TARGET"),
+        help="URL of the directory (default: $TARGET)",
+    )
+    directory.add_argument(
+        "--username",
+        default=os.getenv("DIRECTORY_USERNAME"),
+        help="username to log in with (default: $DIRECTORY_USERNAME). The password "
+        "is read from $PASSWORD or asked for.",
+    )
+    directory.add_argument(
+        "--batch-size",
+        type=_positive_int,
+        default=10000,
+        help="number of rows retrieved per request (default: %(default)s)",
+    )
+    directory.add_argument(
+        "--delete-batch-size",
+        type=_positive_int,
+        default=1000,
+        help="number of rows deleted per request (default: %(default)s)",
+    )
+
+    profiling = parser.add_argument_group("profiling")
+    profiling.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="profile the run with cProfile and write the statistics to FILE, to "
+        "read with pstats or snakeviz",
+    )
+    profiling.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="write the output to FILE with the number of seconds since the start "
+        "before each line",
+    )
+    return parser
+
+
+def _create_publishing_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
+
+    performance = parser.add_argument_group("performance")
+    performance.add_argument(
+        "-j",
+        "--jobs",
+        type=_positive_int,
+        default=1,
+        help="number of processes that prepare nodes (default: %(default)s)",
+    )
+    performance.add_argument(
+        "--pipeline-depth",
+        type=_non_negative_int,
+        default=0,
+        help="number of nodes that are staged and retrieved ahead while a node is "
+        "prepared, when --jobs is 1 (default: %(default)s)",
+    )
+    performance.add_argument(
+        "--max-errors",
+        type=_non_negative_int,
+        help="fail a node as soon as its staged data has more than this number of "
+        "invalid ids and hyperlinks",
+    )
+
+    pids = parser.add_argument_group("PIDs")
+    pids.add_argument(
+        "--pid-service",
+        choices=PID_SERVICES,
+        default="handle",
+        help="handle: the handle server in the credentials file, dummy: PIDs that "
+        "are only kept in memory, noop: no PIDs (default: %(default)s)",
+    )
+    pids.add_argument(
+        "--pid-credentials",
+        metavar="FILE",
+        default="pyhandle_creds.json",
+        help="credentials file of the handle server (default: %(default)s)",
+    )
+    pids.add_argument(
+        "--pid-workers",
+        type=_positive_int,
+        default=1,
+        help="number of biobanks of which the PIDs are managed concurrently "
+        "(default: %(default)s)",
+    )
+    pids.add_argument(
+        "--pid-requests-per-second",
+        type=_positive_float,
+        help="maximum number of requests per second to the handle server",
+    )
+    pids.add_argument(
+        "--defer-pids",
+        action="store_true",
+        help="send the changes to PIDs to the handle server after the data is "
+        "published",
+    )
+    pids.add_argument(
+        "--async-pids",
+        action="store_true",
+        help="manage the PIDs on an event loop, with --pid-workers concurrent "
+        "requests",
+    )
+    return parser
+
+
+def _add_nodes_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "nodes",
+        nargs="*",
+        metavar="NODE",
+        help="codes of the nodes, all nodes if none are given",
+    )
+
+
+def _stage(args: argparse.Namespace, printer: "Printer") -> int:
+    session = _create_session(args)
+    nodes = _get_nodes(session.get_external_nodes, args.nodes)
+    report = _create_eric(args, session, printer).stage_external_nodes(nodes)
+    return 1 if report.has_errors() else 0
+
+
+def _publish(args: argparse.Namespace, printer: "Printer") -> int:
+    if (args.incremental or args.checkpoints or args.resume) and not args.cache_dir:
+        raise UsageError(
+            "--incremental, --checkpoints and --resume require --cache-dir"
+        )
+
+    pid_service = _create_pid_service(args)
+    session = _create_session(args)
+    nodes = _get_nodes(session.get_nodes, args.nodes)
+    eric = _create_eric(args, session, printer, pid_service)
+    if args.resume:
+        _check_run(eric, args.resume)
+    report = eric.publish_nodes(nodes, args.incremental, args.resume)
+    return 1 if report.has_errors() else 0
+
+
+def _plan(args: argparse.Namespace, printer: "Printer") -> int:
+    pid_service = _create_pid_service(args)
+    session = _create_session(args)
+    nodes = _get_nodes(session.get_nodes, args.nodes)
+    eric = _create_eric(args, session, printer, pid_service)
+    plan = eric.plan_nodes(nodes)
+    return 1 if plan.report.has_errors() else 0
+
+
+def _get_nodes(get_nodes: Callable[[List[str]], List["Node"]], codes: List[str]):
+    try:
+        return get_nodes(codes)
+    except KeyError as e:
+        # an unknown node code
+        raise UsageError(e.args[0]) from e
+
+
+def _check_run(eric: "Eric", run_id: str):
+    from molgenis.bbmri_eric.checkpoints import PublishingCheckpoint
+
+    try:
+        PublishingCheckpoint.load(eric.runs_dir, run_id)
+    except ValueError as e:
+        # an unknown or finished run
+        raise UsageError(str(e)) from e
+
+
+def _create_session(args: argparse.Namespace) -> "EricSession":
+    from molgenis.bbmri_eric.bbmri_client import EricSession
+
+    if not args.url:
+        raise UsageError("No directory URL, use --url or set $TARGET")
+    if not args.username:
+        raise UsageError("No username, use --username or set $DIRECTORY_USERNAME")
+
+    session = EricSession(
+        url=args.url,
+        batch_size=args.batch_size,
+        delete_batch_size=args.delete_batch_size,
+    )
+    password = os.getenv("PASSWORD") or getpass.getpass(
+        f"Password of {args.username}: "
+    )
+    session.login(args.username, password)
+    return session
+
+
+def _create_pid_service(args: argparse.Namespace) -> "BasePidService":
+    # imports pyhandle, so only when a command needs a PID service
+    from molgenis.bbmri_eric.pid_service import (
+        DummyPidService,
+        NoOpPidService,
+        PidService,
+    )
+
+    if args.pid_service == "dummy":
+        return DummyPidService()
+    if args.pid_service == "noop":
+        return NoOpPidService()
+    if not os.path.exists(args.pid_credentials):
+        raise UsageError(f"PID credentials file not found: {args.pid_credentials}")
+    return PidService.from_credentials(args.pid_credentials)
+
+
+def _create_eric(
+    args: argparse.Namespace,
+    session: "EricSession",
+    printer: "Printer",
+    pid_service: Optional["BasePidService"] = None,
+) -> "Eric":
+    from molgenis.bbmri_eric.eric import Eric
+
+    if pid_service is None:
+        return Eric(session, printer=printer)
+    return Eric(
+        session,
+        pid_service,
+        jobs=args.jobs,
+        cache_dir=getattr(args, "cache_dir", None),
+        max_errors=args.max_errors,
+        pid_workers=args.pid_workers,
+        pid_requests_per_second=args.pid_requests_per_second,
+        defer_pids=args.defer_pids,
+        async_pids=args.async_pids,
+        pipeline_depth=args.pipeline_depth,
+        checkpoints=getattr(args, "checkpoints", False),
+        printer=printer,
+    )
+
+
+@contextmanager
+def _create_printer(trace: Optional[str]) -> Iterator["Printer"]:
+    from molgenis.bbmri_eric.printer import Printer, TracingPrinter
+
+    if not trace:
+        yield Printer()
+        return
+
+    with open(trace, "w", encoding="utf-8") as trace_file:
+        yield TracingPrinter(trace_file)
+
+
+@contextmanager
+def _profiling(profile: Optional[str], printer: "Printer") -> Iterator[None]:
+    if not profile:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile)
+        printer.print(f"⏱️ Wrote the profile to {profile}")
+
+
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+def _non_negative_int(value: str) -> int:
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be at least 0: {value}")
+    return number
+
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0: {value}")
+    return number
+
+
+if __name__ == "__main__":
+    sys.exit(main())
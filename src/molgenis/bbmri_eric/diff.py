@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from molgenis.bbmri_eric.model import MixedData, Table, TableType
+
+
+@dataclass
+class TableDiff:
+    """
+    The differences between the rows to publish in a table and the published rows.
+    Rows are compared by the values of the attributes in the table's metadata, after
+    normalizing them to the form they have after an import.
+    """
+
+    table_type: TableType
+    inserted: List[dict] = field(default_factory=list)
+    changed: List[dict] = field(default_factory=list)
+    unchanged: int = 0
+
+    @staticmethod
+    def of(table: Table, published_rows: Dict[str, dict]) -> "TableDiff":
+        """
+        :param table: the rows to publish
+        :param published_rows: the published rows by id, with all their attributes
+        """
+        one_to_manys = set(table.meta.one_to_manys)
+        attributes = [
+            attr for attr in table.meta.attributes if attr not in one_to_manys
+        ]
+
+        diff = TableDiff(table.type)
+        for id_, row in table.rows_by_id.items():
+            published_row = published_rows.get(id_)
+            if published_row is None:
+                diff.inserted.append(row)
+            elif normalize_row(row, attributes) != normalize_row(
+                published_row, attributes
+            ):
+                diff.changed.append(row)
+            else:
+                diff.unchanged += 1
+        return diff
+
+    @property
+    def upserted(self) -> List[dict]:
+        return self.inserted + self.changed
+
+
+def normalize_row(row: dict, attributes: List[str]) -> Dict[str, object]:
+    """
+    Normalizes the values of a row the way an import does: empty values are left
+    out, booleans and numbers become strings and the order of references is ignored.
+    """
+    normalized = dict()
+    for attribute in attributes:
+        value = normalize_value(row.get(attribute))
+        if value is not None:
+            normalized[attribute] = value
+    return normalized
+
+
+def normalize_value(value) -> Optional[object]:
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, list):
+        return tuple(sorted(str(item) for item in value))
+    if isinstance(value, bool):
+        return str(value).lower()
+    return str(value)
+
+
+def diff_data(data: MixedData, published: MixedData) -> List[TableDiff]:
+    """
+    Returns the differences per table, in import order, between the data to publish
+    and the published data.
+    """
+    return [
+        TableDiff.of(table, published.table_by_type[table.type].rows_by_id)
+        for table in data.import_order
+    ]
@@ -1,11 +1,22 @@
-from typing import List, Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 from molgenis.bbmri_eric.bbmri_client import AttributesRequest, EricSession
-from molgenis.bbmri_eric.errors import EricError, ErrorReport, requests_error_handler
-from molgenis.bbmri_eric.model import ExternalServerNode, Node
-from molgenis.bbmri_eric.pid_manager import PidManagerFactory
+from molgenis.bbmri_eric.categories import CategoryRules
+from molgenis.bbmri_eric.checkpoints import PublishingCheckpoint
+from molgenis.bbmri_eric.errors import (
+    EricError,
+    EricWarning,
+    ErrorReport,
+    requests_error_handler,
+)
+from molgenis.bbmri_eric.fingerprints import Fingerprinter, FingerprintStore
+from molgenis.bbmri_eric.model import ExternalServerNode, Node, NodeData
+from molgenis.bbmri_eric.pid_manager import PidManager, PidManagerFactory
 from molgenis.bbmri_eric.pid_service import BasePidService
-from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.pipeline import prefetch
+from molgenis.bbmri_eric.plan import PublishingPlan
+from molgenis.bbmri_eric.printer import BufferedPrinter, Printer
 from molgenis.bbmri_eric.publication_preparer import PublicationPreparer
 from molgenis.bbmri_eric.publisher import Publisher, PublishingState
 from molgenis.bbmri_eric.stager import Stager
@@ -17,21 +28,94 @@ class Eric:
     """
 
     def __init__(
-        self, session: EricSession, pid_service: Optional[BasePidService] = None
+        self,
+        session: EricSession,
+        pid_service: Optional[BasePidService] = None,
+        jobs: int = 1,
+        cache_dir: Optional[Path] = None,
+        category_rules: Optional[CategoryRules] = None,
+        max_errors: Optional[int] = None,
+        pid_workers: int = 1,
+        pid_requests_per_second: Optional[float] = None,
+        defer_pids: bool = False,
+        async_pids: bool = False,
+        pipeline_depth: int = 0,
+        checkpoints: bool = False,
+        fused_transform: bool = True,
+        printer: Optional[Printer] = None,
     ):
         """
         :param session: an authenticated session with an ERIC directory
         :param pid_service: a configured PidService, required for publishing. When no
         PidService is provided, nodes can only be staged.
+        :param jobs: the number of processes used to prepare nodes for publishing.
+        When higher than 1, the nodes are validated, fitted and transformed in
+        parallel.
+        :param cache_dir: a directory to store the fingerprints of published nodes and
+        the checkpoints of publishing runs in, required for incremental publishing,
+        checkpoints and resuming runs
+        :param category_rules: the rules to derive the categories of collections with,
+        for example from CategoryRules.from_file or EricSession.get_category_rules.
+        Defaults to CategoryRules.default().
+        :param max_errors: if set, a node's staging data is validated while it's
+        retrieved for publishing. The node fails as soon as the number of invalid ids
+        and hyperlinks exceeds this maximum.
+        :param pid_workers: the number of biobanks of which the PIDs are managed
+        concurrently
+        :param pid_requests_per_second: the maximum number of requests per second to
+        the handle server, unlimited if not set
+        :param defer_pids: record the changes to PIDs while preparing the nodes and
+        only send them to the handle server, coalesced per handle, after the data is
+        published. When checkpoints are written, the changes of a node are sent before
+        its checkpoint is.
+        :param async_pids: manage the PIDs on an event loop (see AsyncPidManager),
+        with at most pid_workers concurrent requests to the handle server
+        :param pipeline_depth: if higher than 0, the next nodes are staged and
+        retrieved in a background thread while a node is prepared, up to this number of
+        nodes ahead. Only used when jobs is 1.
+        :param checkpoints: write checkpoints while publishing, so a run that didn't
+        finish can be resumed. Requires a cache directory.
+        :param fused_transform: transform the data of a node in a single pass over
+        its tables instead of one pass per transformation step. The result is the same.
+        :param printer: the printer to print the progress to, defaults to a Printer
+        that prints to stdout
         """
+        if checkpoints and not cache_dir:
+            raise ValueError("A cache directory is required to write checkpoints")
+
         self.session = session
-        self.printer = Printer()
+        self.jobs = jobs
+        self.checkpoints = checkpoints
+        self.pipeline_depth = pipeline_depth
+        self.max_errors = max_errors
+        self.fused_transform = fused_transform
+        self.category_rules = (
+            category_rules if category_rules else CategoryRules.default()
+        )
+        self.cache_dir: Optional[Path] = Path(cache_dir) if cache_dir else None
+        self.fingerprint_store: Optional[FingerprintStore] = None
+        if cache_dir:
+            self.fingerprint_store = FingerprintStore(
+                Path(cache_dir) / "fingerprints.json"
+            )
+        self.printer = printer if printer else Printer()
         self.stager = Stager(self.session, self.printer)
         self.pid_service: Optional[BasePidService] = pid_service
         if pid_service:
-            self.pid_manager = PidManagerFactory.create(self.pid_service, self.printer)
+            self.pid_manager = PidManagerFactory.create(
+                self.pid_service,
+                self.printer,
+                pid_workers,
+                pid_requests_per_second,
+                defer_pids,
+                async_pids,
+            )
             self.preparator = PublicationPreparer(
-                self.printer, self.pid_manager, self.session
+                self.printer,
+                self.pid_manager,
+                self.session,
+                max_errors,
+                fused_transform,
             )
             self.publisher = Publisher(self.session, self.printer, self.pid_manager)
 
@@ -54,30 +138,146 @@ class Eric:
         self.printer.print_summary(report)
         return report
 
-    def publish_nodes(self, nodes: List[Node]) -> ErrorReport:
+    def publish_nodes(
+        self, nodes: List[Node], incremental: bool = False, resume: Optional[str] = None
+    ) -> ErrorReport:
         """
         Publishes data from the provided nodes to the production tables in the ERIC
         directory.
 
+        When a cache directory is configured, the fingerprints of the nodes that are
+        published are stored. In incremental mode, nodes whose staging data and other
+        inputs haven't changed since they were last published are skipped: their
+        published rows are left as they are. Otherwise, all nodes are published.
+
+        When checkpoints are enabled, the run writes them to the cache directory: the
+        retrieved data, the prepared data of each node and the completed publishing
+        phases are stored in the directory runs/<run id>, which is removed when the run
+        finishes. A run that didn't finish can be resumed with its run id. The nodes
+        that were prepared and the phases that were completed are then not done again.
+
         Parameters:
             nodes (List[Node]): The list of nodes to publish
+            incremental (bool): Skip nodes that haven't changed
+            resume (str): The id of the run to resume, with the same nodes
         """
         if not self.pid_service:
             raise ValueError("A PID service is required to publish nodes")
+        if incremental and not self.fingerprint_store:
+            raise ValueError("A cache directory is required to publish incrementally")
+        if resume and not self.cache_dir:
+            raise ValueError("A cache directory is required to resume a run")
 
         report = ErrorReport(nodes)
+        checkpoint = None
         try:
-            state = self._init_state(nodes, report)
+            if resume:
+                checkpoint = PublishingCheckpoint.load(self.runs_dir, resume)
+                self.printer.print_header("⚙️ Preparation")
+                self.printer.print(f"⏯️ Resuming publishing run {resume}")
+                state = checkpoint.load_state(nodes, report, self.category_rules)
+            else:
+                state = self._init_state(nodes, report)
+                if self.checkpoints:
+                    checkpoint = PublishingCheckpoint.create(self.runs_dir, state)
+                    self.printer.print(
+                        f"💾 Writing checkpoints of publishing run {checkpoint.run_id}"
+                    )
         except EricError as e:
             self.printer.print_error(e)
             report.set_global_error(e)
         else:
-            self._prepare_nodes(nodes, state)
-            self._publish_nodes(state)
+            fingerprints = checkpoint.get_fingerprints(nodes) if checkpoint else dict()
+            remaining = [
+                node
+                for node in nodes
+                if not checkpoint or not checkpoint.is_prepared(node)
+            ]
+            fingerprints.update(
+                self._prepare_nodes(remaining, state, incremental, checkpoint)
+            )
+            self._publish_nodes(state, checkpoint)
+            self._store_fingerprints(fingerprints, state)
+            if checkpoint and not state.report.error:
+                checkpoint.finish()
+        finally:
+            self.pid_manager.close()
 
         self.printer.print_summary(report)
         return report
 
+    def plan_nodes(self, nodes: List[Node]) -> PublishingPlan:
+        """
+        Determines what publishing the provided nodes would change, without changing
+        anything: nodes with an external server are not staged, the directory's
+        tables are not changed and the changes to PIDs are only recorded.
+
+        The nodes are prepared one by one, the way publish_nodes prepares them. The
+        plan lists per combined table the rows that would be inserted, changed and
+        deleted, the PIDs that would be registered, updated and terminated, and an
+        estimate of the number of requests that publishing would make.
+
+        Parameters:
+            nodes (List[Node]): The list of nodes to plan the publishing of
+        """
+        if not self.pid_service:
+            raise ValueError("A PID service is required to plan publishing")
+
+        report = ErrorReport(nodes)
+        plan = PublishingPlan(report, delete_batch_size=self.session.delete_batch_size)
+        try:
+            state = self._init_state(nodes, report)
+        except EricError as e:
+            self.printer.print_error(e)
+            report.set_global_error(e)
+            self.printer.print_summary(report)
+            return plan
+
+        pid_manager = PidManagerFactory.create(
+            self.pid_service, self.printer, deferred=True
+        )
+        preparer = PublicationPreparer(
+            self.printer,
+            pid_manager,
+            self.session,
+            self.max_errors,
+            self.fused_transform,
+        )
+        try:
+            for node in nodes:
+                self.printer.print_node_title(node)
+                try:
+                    staged_data = None
+                    if isinstance(node, ExternalServerNode):
+                        staged_data = self._fetch_external_node(node, report)
+                    node_data = preparer.retrieve(node, staged_data=staged_data)
+                    node_data = preparer.prepare(node, state, node_data)
+                    state.data_to_publish.merge(node_data)
+                except EricError as e:
+                    self.printer.print_error(e)
+                    state.existing_data.remove_node_rows(node)
+                    report.add_node_error(node, e)
+
+            try:
+                plan.tables = self.publisher.plan(state)
+                if isinstance(pid_manager, PidManager):
+                    plan.pid_changes = pid_manager.outbox.take()
+            except EricError as e:
+                self.printer.print_error(e)
+                report.set_global_error(e)
+            else:
+                self.printer.print_plan(plan)
+        finally:
+            pid_manager.close()
+
+        self.printer.print_summary(report)
+        return plan
+
+    @property
+    def runs_dir(self) -> Path:
+        """The directory with the checkpoints of publishing runs."""
+        return self.cache_dir / "runs"
+
     @requests_error_handler
     def _init_state(self, nodes: List[Node], report: ErrorReport) -> PublishingState:
         self.printer.print_header("⚙️ Preparation")
@@ -112,37 +312,297 @@ class Eric:
             quality_info=quality_info,
             eu_node_data=eu_node_data,
             diseases=diseases,
+            category_rules=self.category_rules,
             nodes=nodes,
             report=report,
         )
 
-    def _prepare_nodes(self, nodes, state):
+    def _prepare_nodes(
+        self,
+        nodes: List[Node],
+        state: PublishingState,
+        incremental: bool,
+        checkpoint: Optional[PublishingCheckpoint] = None,
+    ) -> Dict[Node, str]:
+        """
+        Prepares the nodes and adds them to the data to publish. Returns the
+        fingerprints of the prepared nodes if a cache directory is configured.
+        """
+        fingerprinter = Fingerprinter(state) if self.fingerprint_store else None
+        fingerprints = dict()
+        if self.jobs > 1:
+            self._prepare_nodes_in_parallel(
+                nodes, state, fingerprinter, fingerprints, incremental, checkpoint
+            )
+            return fingerprints
+        if self.pipeline_depth > 0:
+            self._prepare_nodes_pipelined(
+                nodes, state, fingerprinter, fingerprints, incremental, checkpoint
+            )
+            return fingerprints
+
         for node in nodes:
             self.printer.print_node_title(node)
             try:
-                if isinstance(node, ExternalServerNode):
-                    self._stage_node(node, state.report)
-                node_data = self.preparator.prepare(node, state)
+                node_data = self._retrieve_node(node, state)
+                if fingerprinter:
+                    node_data = self._check_changed_node(
+                        node, node_data, state, fingerprinter, fingerprints, incremental
+                    )
+                    if not node_data:
+                        self._set_skipped(node, state, checkpoint)
+                        continue
+                node_data = self.preparator.prepare(node, state, node_data)
                 state.data_to_publish.merge(node_data)
+                self._set_prepared(node, node_data, state, fingerprints, checkpoint)
             except EricError as e:
-                self.printer.print_error(e)
-                state.existing_data.remove_node_rows(node)
-                state.report.add_node_error(node, e)
+                self._handle_node_error(node, e, state, checkpoint)
+                fingerprints.pop(node, None)
+        return fingerprints
 
-    def _publish_nodes(self, state: PublishingState):
+    def _prepare_nodes_in_parallel(
+        self,
+        nodes: List[Node],
+        state: PublishingState,
+        fingerprinter: Optional[Fingerprinter],
+        fingerprints: Dict[Node, str],
+        incremental: bool,
+        checkpoint: Optional[PublishingCheckpoint] = None,
+    ):
+        """
+        Stages and retrieves the nodes one by one and then prepares them in parallel.
+        The output of retrieving a node is printed with the output of preparing it, so
+        it's the same as when the nodes are prepared one by one.
+        """
+        retrieved_nodes = []
+        nodes_data = []
+        for node in nodes:
+            printer = BufferedPrinter()
+            node_data = None
+            try:
+                node_data, staging_warnings = self._fetch_node(node, printer)
+                state.report.add_node_warnings(node, staging_warnings)
+                if fingerprinter:
+                    node_data = self._check_changed_node(
+                        node,
+                        node_data,
+                        state,
+                        fingerprinter,
+                        fingerprints,
+                        incremental,
+                        printer,
+                    )
+                    if not node_data:
+                        self._set_skipped(node, state, checkpoint)
+            except EricError as e:
+                node_data = None
+                self._handle_node_error(node, e, state, checkpoint, printer)
+            if node_data:
+                nodes_data.append(node_data)
+            retrieved_nodes.append((node, printer.lines, bool(node_data)))
+
+        results = self.preparator.prepare_in_parallel(nodes_data, state, self.jobs)
+        for node, lines, retrieved in retrieved_nodes:
+            self.printer.print_node_title(node)
+            for line in lines:
+                self.printer.print(line)
+            if not retrieved:
+                continue
+
+            _, node_data, error = next(results)
+            if error:
+                self._handle_node_error(node, error, state, checkpoint)
+                fingerprints.pop(node, None)
+            else:
+                state.data_to_publish.merge(node_data)
+                self._set_prepared(node, node_data, state, fingerprints, checkpoint)
+
+    def _prepare_nodes_pipelined(
+        self,
+        nodes: List[Node],
+        state: PublishingState,
+        fingerprinter: Optional[Fingerprinter],
+        fingerprints: Dict[Node, str],
+        incremental: bool,
+        checkpoint: Optional[PublishingCheckpoint] = None,
+    ):
+        """
+        Prepares the nodes one by one, while the next nodes are staged and retrieved
+        in a background thread. The output of a node is printed when it's prepared, so
+        it's the same as when the nodes are prepared without a pipeline.
+        """
+        fetched_nodes = prefetch(self._fetch_node, nodes, self.pipeline_depth)
+        for node, fetched, error, lines in fetched_nodes:
+            self.printer.print_node_title(node)
+            for line in lines:
+                self.printer.print(line)
+            try:
+                if error:
+                    raise error
+                node_data, staging_warnings = fetched
+                state.report.add_node_warnings(node, staging_warnings)
+                if fingerprinter:
+                    node_data = self._check_changed_node(
+                        node, node_data, state, fingerprinter, fingerprints, incremental
+                    )
+                    if not node_data:
+                        self._set_skipped(node, state, checkpoint)
+                        continue
+                node_data = self.preparator.prepare(node, state, node_data)
+                state.data_to_publish.merge(node_data)
+                self._set_prepared(node, node_data, state, fingerprints, checkpoint)
+            except EricError as e:
+                self._handle_node_error(node, e, state, checkpoint)
+                fingerprints.pop(node, None)
+
+    def _fetch_node(
+        self, node: Node, printer: Printer
+    ) -> Tuple[NodeData, List[EricWarning]]:
+        """
+        Does the same as _retrieve_node, in the background thread of the pipeline. It
+        prints to its own printer and returns the staging warnings instead of adding
+        them to the report.
+        """
+        staged_data = None
+        warnings = []
+        if isinstance(node, ExternalServerNode):
+            stager = Stager(self.session, printer)
+            staged_data = self._stage_node_with(node, stager, printer)
+            warnings = stager.warnings
+        return self.preparator.retrieve(node, printer, staged_data), warnings
+
+    def _retrieve_node(self, node: Node, state: PublishingState) -> NodeData:
+        """
+        Retrieves the staged data of a node. A node with an external server is staged
+        first, and the data that was staged is used instead of retrieving it again.
+        """
+        staged_data = None
+        if isinstance(node, ExternalServerNode):
+            staged_data = self._stage_node(node, state.report)
+        return self.preparator.retrieve(node, staged_data=staged_data)
+
+    def _check_changed_node(
+        self,
+        node: Node,
+        node_data: NodeData,
+        state: PublishingState,
+        fingerprinter: Fingerprinter,
+        fingerprints: Dict[Node, str],
+        incremental: bool,
+        printer: Optional[Printer] = None,
+    ) -> Optional[NodeData]:
+        """
+        Calculates the fingerprint of a node's retrieved data. In incremental mode,
+        returns None if the node hasn't changed since it was last published. Its
+        published rows are then removed from the existing data so they won't be
+        deleted.
+        """
+        printer = printer if printer else self.printer
+        fingerprint = fingerprinter.get_fingerprint(node_data)
+        published = Fingerprinter.get_published_fingerprint(state.existing_data, node)
+        if incremental and self.fingerprint_store.is_unchanged(
+            node, fingerprint, published
+        ):
+            printer.print(
+                f"⏩ Node {node.code} hasn't changed since it was last published, "
+                f"skipping"
+            )
+            state.existing_data.remove_node_rows(node)
+            return None
+
+        fingerprints[node] = fingerprint
+        return node_data
+
+    def _handle_node_error(
+        self,
+        node: Node,
+        error: EricError,
+        state: PublishingState,
+        checkpoint: Optional[PublishingCheckpoint] = None,
+        printer: Optional[Printer] = None,
+    ):
+        printer = printer if printer else self.printer
+        printer.print_error(error)
+        state.existing_data.remove_node_rows(node)
+        state.report.add_node_error(node, error)
+        if checkpoint:
+            checkpoint.set_failed(node, error, state.report)
+
+    def _set_prepared(
+        self,
+        node: Node,
+        node_data: NodeData,
+        state: PublishingState,
+        fingerprints: Dict[Node, str],
+        checkpoint: Optional[PublishingCheckpoint],
+    ):
+        """
+        Writes the checkpoint of a prepared node. Deferred changes to its PIDs are sent
+        first, because its prepared data refers to them.
+        """
+        if checkpoint:
+            self.pid_manager.flush()
+            checkpoint.set_prepared(
+                node, node_data, state.report, fingerprints.get(node)
+            )
+
+    @staticmethod
+    def _set_skipped(
+        node: Node, state: PublishingState, checkpoint: Optional[PublishingCheckpoint]
+    ):
+        if checkpoint:
+            checkpoint.set_skipped(node, state.report)
+
+    def _publish_nodes(
+        self, state: PublishingState, checkpoint: Optional[PublishingCheckpoint] = None
+    ):
         self.printer.print_header(
             f"🎁 Publishing node{'s' if len(state.nodes) > 1 else ''}"
         )
         try:
-            self.publisher.publish(state)
+            self.publisher.publish(state, checkpoint)
         except EricError as e:
             self.printer.print_error(e)
             state.report.set_global_error(e)
 
-    @requests_error_handler
-    def _stage_node(self, node: ExternalServerNode, report: ErrorReport):
-        self.printer.print(f"📥 Staging data of node {node.code}")
+    def _store_fingerprints(
+        self, fingerprints: Dict[Node, str], state: PublishingState
+    ):
+        """
+        Stores the fingerprints of the nodes that were prepared, if they were
+        published successfully.
+        """
+        if not self.fingerprint_store or state.report.error:
+            return
+
+        for node, fingerprint in fingerprints.items():
+            published = Fingerprinter.get_published_fingerprint(
+                state.data_to_publish, node
+            )
+            self.fingerprint_store.set(node, fingerprint, published)
+        self.fingerprint_store.save()
+
+    def _stage_node(self, node: ExternalServerNode, report: ErrorReport) -> NodeData:
+        staged_data = self._stage_node_with(node, self.stager, self.printer)
+        if self.stager.warnings:
+            report.add_node_warnings(node, self.stager.warnings)
+        return staged_data
+
+    def _fetch_external_node(
+        self, node: ExternalServerNode, report: ErrorReport
+    ) -> NodeData:
+        self.printer.print(f"📥 Fetching data of node {node.code} without staging it")
         with self.printer.indentation():
-            warnings = self.stager.stage(node)
-            if warnings:
-                report.add_node_warnings(node, warnings)
+            node_data = self.stager.fetch(node)
+        if self.stager.warnings:
+            report.add_node_warnings(node, self.stager.warnings)
+        return node_data
+
+    @staticmethod
+    @requests_error_handler
+    def _stage_node_with(
+        node: ExternalServerNode, stager: Stager, printer: Printer
+    ) -> NodeData:
+        printer.print(f"📥 Staging data of node {node.code}")
+        with printer.indentation():
+            return stager.stage(node)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+
+from molgenis.bbmri_eric.model import EricData, Node, NodeData, TableType
+from molgenis.bbmri_eric.publisher import PublishingState
+
+
+def _digest(value) -> str:
+    content = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class Fingerprinter:
+    """
+    Calculates fingerprints of nodes for incremental publishing. A node's fingerprint
+    changes when its staging data changes or when one of the other inputs of the
+    preparation changes: the quality information, the EU node's data, the disease
+    ontology and the category rules.
+    """
+
+    def __init__(self, state: PublishingState):
+        eu_node_data = state.eu_node_data
+        self.inputs = _digest(
+            {
+                "quality": [
+                    state.quality_info.biobanks,
+                    state.quality_info.biobank_levels,
+                    state.quality_info.collections,
+                    state.quality_info.collection_levels,
+                ],
+                "eu_persons": eu_node_data.persons.rows,
+                "eu_networks": eu_node_data.networks.rows,
+                "diseases": state.diseases.rows,
+                "category_rules": state.category_rules.to_dict(),
+            }
+        )
+
+    def get_fingerprint(self, node_data: NodeData) -> str:
+        """
+        Returns the fingerprint of a node's staging data and the other inputs. Must be
+        called before the data is prepared.
+        """
+        node = node_data.node
+        withdrawn = bool(
+            node.date_end and node.date_end <= date.today().strftime("%Y-%m-%d")
+        )
+        return _digest(
+            {
+                "inputs": self.inputs,
+                "node": [node.code, withdrawn],
+                "tables": [
+                    [table.full_name, table.rows] for table in node_data.import_order
+                ],
+            }
+        )
+
+    @staticmethod
+    def get_published_fingerprint(data: EricData, node: Node) -> str:
+        """
+        Returns the fingerprint of a node's published rows, based on the attributes
+        that are retrieved as existing data when publishing (see Eric._init_state).
+        Can be calculated from the existing data and from the prepared data.
+        """
+        tables = dict()
+        for table in data.import_order:
+            rows = [
+                row
+                for row in table.rows_by_id.values()
+                if row.get("national_node") == node.code
+            ]
+            if table.type == TableType.BIOBANKS:
+                tables[table.type.value] = sorted(
+                    [
+                        row["id"],
+                        row.get("pid"),
+                        row.get("name"),
+                        row.get("withdrawn", False),
+                    ]
+                    for row in rows
+                )
+            else:
+                tables[table.type.value] = sorted(row["id"] for row in rows)
+        return _digest(tables)
+
+
+class FingerprintStore:
+    """
+    Stores the fingerprints of the nodes that were published successfully in a JSON
+    file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.fingerprints: Dict[str, Dict[str, str]] = dict()
+        if self.path.exists():
+            self.fingerprints = json.loads(self.path.read_text())
+
+    def is_unchanged(self, node: Node, fingerprint: str, published: str) -> bool:
+        """
+        Returns True if the node's fingerprint and the fingerprint of its published
+        rows are the same as when it was last published.
+        """
+        stored = self.fingerprints.get(node.code)
+        return bool(
+            stored
+            and stored["fingerprint"] == fingerprint
+            and stored["published"] == published
+        )
+
+    def get(self, node: Node) -> Optional[Dict[str, str]]:
+        return self.fingerprints.get(node.code)
+
+    def set(self, node: Node, fingerprint: str, published: str):
+        self.fingerprints[node.code] = {
+            "fingerprint": fingerprint,
+            "published": published,
+        }
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_text(json.dumps(self.fingerprints, indent=2, sort_keys=True))
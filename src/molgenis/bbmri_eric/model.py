@@ -1,12 +1,11 @@
 import typing
 from abc import ABC
 from collections import OrderedDict
-from copy import deepcopy
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
-from molgenis.bbmri_eric.utils import to_ordered_dict
+from molgenis.bbmri_eric.utils import SegmentedDict, to_ordered_dict
 
 
 class TableType(Enum):
@@ -33,9 +32,14 @@ class TableMeta:
     """Convenient wrapper for the output of the metadata API."""
 
     meta: dict
-    id_attribute: str = field(init=False)
+    id_attribute: Optional[str] = None
+    """The name of the id attribute, looked up in the attributes if not given"""
+
+    REFERENCE_TYPES = {"xref", "mref", "categorical", "categorical_mref"}
 
     def __post_init__(self):
+        if self.id_attribute is not None:
+            return
         for attribute in self.meta["attributes"]["items"]:
             if attribute["data"]["idAttribute"] is True:
                 object.__setattr__(self, "id_attribute", attribute["data"]["name"])
@@ -44,6 +48,17 @@ class TableMeta:
     def id(self):
         return self.meta["id"]
 
+    def with_id(self, id_: str) -> "TableMeta":
+        """
+        Returns a TableMeta that is identical to this one except for its identifier.
+        Only the top level of the metadata is copied, the attribute metadata and the
+        id attribute are shared with this TableMeta.
+
+        :param id_: the identifier of the new TableMeta
+        :return: a TableMeta with the new identifier
+        """
+        return replace(self, meta={**self.meta, "id": id_})
+
     @property
     def attributes(self):
         return [attr["data"]["name"] for attr in self.meta["attributes"]["items"]]
@@ -64,6 +79,24 @@ class TableMeta:
                 hyperlinks.append(attribute["data"]["name"])
         return hyperlinks
 
+    @property
+    def references(self) -> Dict[str, str]:
+        """
+        Returns the xref, mref, categorical and categorical_mref attributes and the
+        ids of the tables they refer to.
+        """
+        references = dict()
+        for attribute in self.meta["attributes"]["items"]:
+            data = attribute["data"]
+            if data["type"] in self.REFERENCE_TYPES and "refEntityType" in data:
+                ref_entity_type = data["refEntityType"]
+                if "data" in ref_entity_type:
+                    ref_id = ref_entity_type["data"]["id"]
+                else:
+                    ref_id = ref_entity_type["self"].rstrip("/").rsplit("/", 1)[-1]
+                references[data["name"]] = ref_id
+        return references
+
 
 @dataclass(frozen=True)
 class BaseTable(ABC):
@@ -102,6 +135,12 @@ class Table(BaseTable):
     def of_empty(table_type: TableType, meta: TableMeta):
         return Table(rows_by_id=OrderedDict(), meta=meta, type=table_type)
 
+    @staticmethod
+    def of_segmented(table_type: TableType, meta: TableMeta):
+        """Factory method for an empty table of which the rows are stored as a
+        SegmentedDict. Rows can be added by adding segments, which won't be copied."""
+        return Table(rows_by_id=SegmentedDict(), meta=meta, type=table_type)
+
     @staticmethod
     def of_placeholder(table_type: TableType):
         meta = {
@@ -307,18 +346,16 @@ class NodeData(EricData):
         """
         The metadata of an external node is the same as the metadata of its staging
         area. This method copies an external server's NodeData and changes only the
-        table identifiers to point to the staging area's identifiers.
+        table identifiers to point to the staging area's identifiers. The rows and
+        attribute metadata are shared with the original NodeData.
         """
         if self.source != Source.EXTERNAL_SERVER:
             raise ValueError("data isn't from an external server")
 
         tables = dict()
         for table in self.import_order:
-            metadata = deepcopy(table.meta.meta)
-            metadata["id"] = self.node.get_staging_id(table.type)
-            tables[table.type.value] = Table(
-                table.rows_by_id, TableMeta(metadata), table.type
-            )
+            meta = table.meta.with_id(self.node.get_staging_id(table.type))
+            tables[table.type.value] = Table(table.rows_by_id, meta, table.type)
 
         return NodeData(node=self.node, source=Source.STAGING, **tables)
 
@@ -332,12 +369,17 @@ class MixedData(EricData):
         return MixedData(source=source, **tables)
 
     def merge(self, other_data: EricData):
-        self.persons.rows_by_id.update(other_data.persons.rows_by_id)
-        self.networks.rows_by_id.update(other_data.networks.rows_by_id)
-        self.also_known_in.rows_by_id.update(other_data.also_known_in.rows_by_id)
-        self.biobanks.rows_by_id.update(other_data.biobanks.rows_by_id)
-        self.collections.rows_by_id.update(other_data.collections.rows_by_id)
-        self.facts.rows_by_id.update(other_data.facts.rows_by_id)
+        """
+        Adds the rows of another EricData object to this one. Tables that are
+        segmented (see copy_empty) only store a reference to the other table's rows,
+        other tables copy the rows.
+        """
+        for table in self.import_order:
+            other_rows = other_data.table_by_type[table.type].rows_by_id
+            if isinstance(table.rows_by_id, SegmentedDict):
+                table.rows_by_id.add_segment(other_rows)
+            else:
+                table.rows_by_id.update(other_rows)
 
     def remove_node_rows(self, node: Node):
         for table in self.import_order:
@@ -346,15 +388,22 @@ class MixedData(EricData):
             ]
             all(table.rows_by_id.pop(id_) for id_ in ids_to_remove)
 
-    def copy_empty(self) -> "MixedData":
+    def copy_empty(self, segmented: bool = False) -> "MixedData":
+        """
+        Returns a MixedData object with the same metadata but without rows.
+
+        :param segmented: if True, the tables will keep merged data as segments
+        instead of copying the rows into a single dict
+        """
+        of = Table.of_segmented if segmented else Table.of_empty
         return MixedData(
             source=self.source,
-            persons=Table.of_empty(TableType.PERSONS, self.persons.meta),
-            networks=Table.of_empty(TableType.NETWORKS, self.networks.meta),
-            also_known_in=Table.of_empty(TableType.ALSO_KNOWN, self.also_known_in.meta),
-            biobanks=Table.of_empty(TableType.BIOBANKS, self.biobanks.meta),
-            collections=Table.of_empty(TableType.COLLECTIONS, self.collections.meta),
-            facts=Table.of_empty(TableType.FACTS, self.facts.meta),
+            persons=of(TableType.PERSONS, self.persons.meta),
+            networks=of(TableType.NETWORKS, self.networks.meta),
+            also_known_in=of(TableType.ALSO_KNOWN, self.also_known_in.meta),
+            biobanks=of(TableType.BIOBANKS, self.biobanks.meta),
+            collections=of(TableType.COLLECTIONS, self.collections.meta),
+            facts=of(TableType.FACTS, self.facts.meta),
         )
 
 
@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from typing import Dict, Optional, Tuple
 
 from unidecode import unidecode
 
@@ -25,6 +26,7 @@ class ModelFitter:
     ):
         self.node_data = node_data
         self.printer = printer
+        self._person_index: Optional[Dict[Tuple[str, str], dict]] = None
 
         self.warnings = []
 
@@ -131,24 +133,39 @@ class ModelFitter:
 
         return None
 
+    @staticmethod
+    def _get_name_key(last_name: str, first_name: str) -> Tuple[str, str]:
+        return last_name.lower().replace(" ", ""), first_name.lower().strip()
+
+    def _get_person_index(self) -> Dict[Tuple[str, str], dict]:
+        """
+        Returns an index of the persons by their normalized last and first name. If
+        multiple persons have the same name, the first one is indexed. Built on first
+        use.
+        """
+        if self._person_index is None:
+            self._person_index = dict()
+            for person in self.node_data.persons.rows:
+                key = self._get_name_key(
+                    person.get("last_name", "NN"), person.get("first_name", "NN")
+                )
+                self._person_index.setdefault(key, person)
+        return self._person_index
+
     def _check_person(self, data):
         # A head exists if the combination of first- and last name exists in persons
-        for person in self.node_data.persons.rows:
-            if (
-                person.get("last_name", "NN").lower().replace(" ", "")
-                == data["head_lastname"].lower().replace(" ", "")
-                and person.get("first_name", "NN").lower().strip()
-                == data["head_firstname"].lower().strip()
-            ):
-                if "role" in person and person["role"] and data.get("head_role"):
-                    roles = person["role"].split(" and ")
-                    roles.append(data.get("head_role").strip())
-                    person["role"] = " and ".join(set(roles))
-                else:
-                    person["role"] = data.get("head_role")
-                return person["id"]
-
-        return None
+        key = self._get_name_key(data["head_lastname"], data["head_firstname"])
+        person = self._get_person_index().get(key)
+        if not person:
+            return None
+
+        if "role" in person and person["role"] and data.get("head_role"):
+            roles = person["role"].split(" and ")
+            roles.append(data.get("head_role").strip())
+            person["role"] = " and ".join(set(roles))
+        else:
+            person["role"] = data.get("head_role")
+        return person["id"]
 
     def _create_person(self, data):
         prefix = self.node_data.node.get_id_prefix(TableType.PERSONS)
@@ -163,6 +180,13 @@ class ModelFitter:
         person["email"] = "UNKNOWN@" + self.node_data.node.code
         person["country"] = data.get("country")
         person["national_node"] = self.node_data.node.code
+
+        if person["id"] in self.node_data.persons.rows_by_id:
+            # the new person replaces an existing one, so the index is rebuilt
+            self._person_index = None
+        elif self._person_index is not None:
+            key = self._get_name_key(person["last_name"], person["first_name"])
+            self._person_index.setdefault(key, person)
         self.node_data.persons.rows_by_id.update(to_ordered_dict([person]))
 
         return person["id"]
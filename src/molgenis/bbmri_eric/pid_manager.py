@@ -1,10 +1,23 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
 
 from molgenis.bbmri_eric.errors import EricWarning
 from molgenis.bbmri_eric.model import Table
-from molgenis.bbmri_eric.pid_service import BasePidService, NoOpPidService, Status
-from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.pid_service import (
+    AsyncPidService,
+    BasePidService,
+    HandleMutation,
+    NoOpPidService,
+    PidOutbox,
+    RateLimitedPidService,
+    Status,
+)
+from molgenis.bbmri_eric.printer import BufferedPrinter, Printer
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 class BasePidManager(ABC):
@@ -20,16 +33,57 @@ class BasePidManager(ABC):
     def terminate_biobanks(self, biobank_pids: List[str]):
         pass
 
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def discard(self):
+        pass
+
+    def close(self):
+        """Releases the resources of the manager. It can still be used afterwards."""
+        pass
+
 
 class PidManager(BasePidManager):
     """
     This class is responsible for managing PIDs of BBMRI-ERIC entities: assignment,
     updates en status changes are done here.
+
+    The PIDs of multiple biobanks can be managed concurrently by a pool of worker
+    threads. The output, warnings and results are always in the order of the
+    biobanks.
+
+    In deferred mode, changes to handles are recorded in a PidOutbox and only sent to
+    the handle server when flush() is called, one request per handle.
     """
 
-    def __init__(self, pid_service: BasePidService, printer: Printer):
+    def __init__(
+        self,
+        pid_service: BasePidService,
+        printer: Printer,
+        workers: int = 1,
+        requests_per_second: Optional[float] = None,
+        deferred: bool = False,
+    ):
+        """
+        :param pid_service: the PID service to manage the PIDs with
+        :param printer: the printer
+        :param workers: the number of biobanks that are handled concurrently
+        :param requests_per_second: the maximum number of requests per second to the
+        handle server, unlimited if not set
+        :param deferred: record the changes to handles and send them on flush()
+        """
+        if requests_per_second:
+            pid_service = RateLimitedPidService(pid_service, requests_per_second)
+        self.outbox: Optional[PidOutbox] = None
+        if deferred:
+            self.outbox = PidOutbox(pid_service)
+            pid_service = self.outbox
         self.pid_service = pid_service
         self.printer = printer
+        self.workers = workers
         self.biobank_url_prefix = pid_service.base_url + "#/biobank/"
 
     def assign_biobank_pids(self, biobanks: Table) -> List[EricWarning]:
@@ -37,48 +91,158 @@ class PidManager(BasePidManager):
         Registers and assigns a new PID for biobanks that have an empty "pid" attribute.
         Make sure to enrich the table with existing PIDs before using this method.
         """
-        warnings = []
-        for biobank in biobanks.rows:
-            if "pid" not in biobank:
-                biobank["pid"] = self._register_biobank_pid(
-                    biobank["id"], biobank["name"], warnings
-                )
-                if biobank.get("withdrawn", False):
-                    self.pid_service.set_status(biobank["pid"], Status.WITHDRAWN)
-                    self.printer.print(
-                        f"Set STATUS of {biobank['pid']} to {Status.WITHDRAWN.value}"
-                    )
-
-        return warnings
+        new_biobanks = [biobank for biobank in biobanks.rows if "pid" not in biobank]
+        savepoint = len(self.outbox) if self.outbox else 0
+        try:
+            results = self._run_all(self._assign_biobank_pid, new_biobanks)
+        except Exception:
+            if self.outbox:
+                self.outbox.rollback(savepoint)
+            raise
+        return self._set_pids(new_biobanks, results)
 
     def update_biobank_pids(self, biobanks: Table, existing_biobanks: Table):
         """
-        Detects changes in biobanks and updates their PIDs accordingly.
+        Detects changes in biobanks and updates their PIDs accordingly. If the PID
+        service knows the current values of a handle, the biobank is compared to those
+        instead of to the published biobank, so only values that differ are sent.
         """
-        existing_biobanks = existing_biobanks.rows_by_id
-        for biobank in biobanks.rows:
-            id_ = biobank["id"]
-            if id_ in existing_biobanks:
-                if biobank["name"] != existing_biobanks.get(biobank["id"])["name"]:
-                    self._update_biobank_name(biobank["pid"], biobank["name"])
-                if (
-                    biobank.get("withdrawn", False)
-                    != existing_biobanks.get(biobank["id"])["withdrawn"]
-                ):
-                    self._update_withdrawn_status(biobank["pid"], biobank["withdrawn"])
+        changes = self._get_pid_changes(biobanks, existing_biobanks)
+        self._run_all(self._update_biobank_pid, changes)
 
     def terminate_biobanks(self, biobank_pids: List[str]):
         """
         Sets the STATUS of a PID to TERMINATED.
         """
-        for biobank_pid in biobank_pids:
-            self.pid_service.set_status(biobank_pid, Status.TERMINATED)
-            self.printer.print(
-                f"Set STATUS of {biobank_pid} to {Status.TERMINATED.value}"
+        self._run_all(self._terminate_biobank, biobank_pids)
+
+    def flush(self):
+        """
+        Sends the deferred changes to the handle server. Does nothing if the changes
+        aren't deferred.
+        """
+        if not self.outbox:
+            return
+
+        mutations = self.outbox.take()
+        if mutations:
+            self._run_all(self._apply_mutation, mutations)
+            self.printer.print(f"Sent the changes of {len(mutations)} handle(s)")
+
+    def discard(self):
+        """
+        Discards the deferred changes, for example when the data they belong to
+        couldn't be published.
+        """
+        if self.outbox:
+            self.outbox.take()
+
+    def _run_all(self, func: Callable[[T, Printer], R], items: List[T]) -> List[R]:
+        """
+        Calls a function for each item and returns the results in the order of the
+        items. With more than one worker, the calls are done concurrently and each
+        call prints to a buffer that is printed when its result is collected. If a
+        call fails, the calls that haven't started yet are cancelled and the error is
+        raised.
+        """
+        if self.workers <= 1 or len(items) <= 1:
+            return [func(item, self.printer) for item in items]
+
+        results = []
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            tasks = []
+            for item in items:
+                printer = BufferedPrinter()
+                tasks.append((executor.submit(func, item, printer), printer))
+
+            for future, printer in tasks:
+                try:
+                    results.append(future.result())
+                finally:
+                    for line in printer.lines:
+                        self.printer.print(line)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def _assign_biobank_pid(
+        self, biobank: dict, printer: Printer
+    ) -> Tuple[str, List[EricWarning]]:
+        warnings = []
+        pid = self._register_biobank_pid(
+            biobank["id"], biobank["name"], warnings, printer
+        )
+        if biobank.get("withdrawn", False):
+            self.pid_service.set_status(pid, Status.WITHDRAWN)
+            printer.print(f"Set STATUS of {pid} to {Status.WITHDRAWN.value}")
+        return pid, warnings
+
+    @staticmethod
+    def _set_pids(
+        biobanks: List[dict], results: List[Tuple[str, List[EricWarning]]]
+    ) -> List[EricWarning]:
+        warnings = []
+        for biobank, (pid, biobank_warnings) in zip(biobanks, results):
+            biobank["pid"] = pid
+            warnings.extend(biobank_warnings)
+        return warnings
+
+    def _get_pid_changes(
+        self, biobanks: Table, existing_biobanks: Table
+    ) -> List[HandleMutation]:
+        existing_biobanks = existing_biobanks.rows_by_id
+        changes = []
+        for biobank in biobanks.rows:
+            existing_biobank = existing_biobanks.get(biobank["id"])
+            if existing_biobank:
+                change = self._get_pid_change(biobank, existing_biobank)
+                if change:
+                    changes.append(change)
+        return changes
+
+    def _get_pid_change(
+        self, biobank: dict, existing_biobank: dict
+    ) -> Optional[HandleMutation]:
+        withdrawn = biobank.get("withdrawn", False)
+        record = self.pid_service.get_cached_record(biobank["pid"])
+        if record is None:
+            name_changed = biobank["name"] != existing_biobank["name"]
+            withdrawn_changed = withdrawn != existing_biobank["withdrawn"]
+        else:
+            name_changed = biobank["name"] != record.get("NAME")
+            withdrawn_changed = withdrawn != (
+                record.get("STATUS") == Status.WITHDRAWN.value
             )
 
+        if not name_changed and not withdrawn_changed:
+            return None
+        return HandleMutation(
+            biobank["pid"],
+            name=biobank["name"] if name_changed else None,
+            status=Status.WITHDRAWN if withdrawn_changed and withdrawn else None,
+            remove_status=withdrawn_changed and not withdrawn,
+        )
+
+    def _update_biobank_pid(self, change: HandleMutation, printer: Printer):
+        if change.name is not None:
+            self._update_biobank_name(change.pid, change.name, printer)
+        if change.status or change.remove_status:
+            self._update_withdrawn_status(change.pid, bool(change.status), printer)
+
+    def _apply_mutation(self, mutation: HandleMutation, _printer: Printer):
+        self.outbox.pid_service.apply(mutation)
+
+    def _terminate_biobank(self, biobank_pid: str, printer: Printer):
+        self.pid_service.set_status(biobank_pid, Status.TERMINATED)
+        printer.print(f"Set STATUS of {biobank_pid} to {Status.TERMINATED.value}")
+
     def _register_biobank_pid(
-        self, biobank_id: str, biobank_name: str, warnings: List[EricWarning]
+        self,
+        biobank_id: str,
+        biobank_name: str,
+        warnings: List[EricWarning],
+        printer: Printer,
     ) -> str:
         """
         Registers a PID for a new biobank. If one or more PIDs for this biobank already
@@ -89,29 +253,199 @@ class PidManager(BasePidManager):
 
         if existing_pids:
             pid = existing_pids[0]
-            warning = EricWarning(
-                f'PID(s) already exist for new biobank "{biobank_name}": '
-                f"{str(existing_pids)}. Please check the PID's contents!"
-            )
-            self.printer.print_warning(warning)
+            warning = self._existing_pids_warning(biobank_name, existing_pids)
+            printer.print_warning(warning)
             warnings.append(warning)
         else:
             pid = self.pid_service.register_pid(url=url, name=biobank_name)
-            self.printer.print(f'Registered {pid} for new biobank "{biobank_name}"')
+            printer.print(f'Registered {pid} for new biobank "{biobank_name}"')
 
         return pid
 
-    def _update_biobank_name(self, pid: str, name: str):
+    @staticmethod
+    def _existing_pids_warning(biobank_name: str, pids: List[str]) -> EricWarning:
+        return EricWarning(
+            f'PID(s) already exist for new biobank "{biobank_name}": '
+            f"{str(pids)}. Please check the PID's contents!"
+        )
+
+    def _update_biobank_name(self, pid: str, name: str, printer: Printer):
         self.pid_service.set_name(pid, name)
-        self.printer.print(f'Updated NAME of {pid} to "{name}"')
+        printer.print(f'Updated NAME of {pid} to "{name}"')
 
-    def _update_withdrawn_status(self, pid: str, withdrawn: bool):
+    def _update_withdrawn_status(self, pid: str, withdrawn: bool, printer: Printer):
         if withdrawn:
             self.pid_service.set_status(pid, Status.WITHDRAWN)
-            self.printer.print(f"Set STATUS of {pid} to {Status.WITHDRAWN.value}")
+            printer.print(f"Set STATUS of {pid} to {Status.WITHDRAWN.value}")
         if not withdrawn:
             self.pid_service.remove_status(pid)
-            self.printer.print(f"Remove WITHDRAWN STATUS of {pid}")
+            printer.print(f"Remove WITHDRAWN STATUS of {pid}")
+
+
+class AsyncPidManager(PidManager):
+    """
+    A PidManager that gathers the handle operations of all biobanks concurrently on
+    an event loop, with an AsyncPidService. The output, warnings and results are in
+    the order of the biobanks.
+
+    The handle operations go through the same rate limit and outbox as those of a
+    PidManager. From a running event loop, use the *_async methods. The other methods
+    run them with asyncio.run, in a thread of their own when they're called from a
+    running event loop. Call close() when done.
+    """
+
+    def __init__(
+        self,
+        pid_service: BasePidService,
+        printer: Printer,
+        concurrency: int = 8,
+        requests_per_second: Optional[float] = None,
+        deferred: bool = False,
+    ):
+        """
+        :param pid_service: the PID service to manage the PIDs with
+        :param printer: the printer
+        :param concurrency: the maximum number of concurrent handle operations
+        :param requests_per_second: the maximum number of requests per second to the
+        handle server, unlimited if not set
+        :param deferred: record the changes to handles and send them on flush()
+        """
+        super().__init__(
+            pid_service, printer, concurrency, requests_per_second, deferred
+        )
+        self.concurrency = concurrency
+        self._async_service: Optional[AsyncPidService] = None
+
+    @property
+    def async_service(self) -> AsyncPidService:
+        """The AsyncPidService, which is created on first use and after close()."""
+        if self._async_service is None:
+            self._async_service = AsyncPidService(self.pid_service, self.concurrency)
+        return self._async_service
+
+    def close(self):
+        """Shuts down the threads of the AsyncPidService."""
+        if self._async_service is not None:
+            self._async_service.close()
+            self._async_service = None
+
+    def assign_biobank_pids(self, biobanks: Table) -> List[EricWarning]:
+        return self._run(self.assign_biobank_pids_async(biobanks))
+
+    def update_biobank_pids(self, biobanks: Table, existing_biobanks: Table):
+        self._run(self.update_biobank_pids_async(biobanks, existing_biobanks))
+
+    def terminate_biobanks(self, biobank_pids: List[str]):
+        self._run(self.terminate_biobanks_async(biobank_pids))
+
+    @staticmethod
+    def _run(coroutine: Awaitable[R]) -> R:
+        """
+        Runs a coroutine with asyncio.run. From a running event loop, which
+        asyncio.run can't be called from, it's run in a thread of its own.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, coroutine).result()
+
+    async def assign_biobank_pids_async(self, biobanks: Table) -> List[EricWarning]:
+        """See PidManager.assign_biobank_pids."""
+        new_biobanks = [biobank for biobank in biobanks.rows if "pid" not in biobank]
+        savepoint = len(self.outbox) if self.outbox else 0
+        try:
+            results = await self._gather(self._assign_biobank_pid_async, new_biobanks)
+        except Exception:
+            if self.outbox:
+                self.outbox.rollback(savepoint)
+            raise
+        return self._set_pids(new_biobanks, results)
+
+    async def update_biobank_pids_async(
+        self, biobanks: Table, existing_biobanks: Table
+    ):
+        """See PidManager.update_biobank_pids."""
+        # the first lookup of a cached record can retrieve all handles
+        changes = await asyncio.to_thread(
+            self._get_pid_changes, biobanks, existing_biobanks
+        )
+        await self._gather(self._update_biobank_pid_async, changes)
+
+    async def terminate_biobanks_async(self, biobank_pids: List[str]):
+        """See PidManager.terminate_biobanks."""
+        await self._gather(self._terminate_biobank_async, biobank_pids)
+
+    async def _gather(
+        self, func: Callable[[T, Printer], Awaitable[R]], items: List[T]
+    ) -> List[R]:
+        """
+        Awaits a coroutine for each item concurrently. Each coroutine prints to a
+        buffer. The buffers are printed in the order of the items, up to the first
+        coroutine that failed, whose error is raised. When a coroutine fails, the
+        coroutines that haven't finished yet are cancelled, like the calls of
+        PidManager._run_all.
+        """
+        printers = [BufferedPrinter() for _ in items]
+        tasks = [
+            asyncio.ensure_future(func(item, printer))
+            for item, printer in zip(items, printers)
+        ]
+        if not tasks:
+            return []
+
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for task, printer in zip(tasks, printers):
+            for line in printer.lines:
+                self.printer.print(line)
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+        return [task.result() for task in tasks]
+
+    async def _assign_biobank_pid_async(
+        self, biobank: dict, printer: Printer
+    ) -> Tuple[str, List[EricWarning]]:
+        url = self.biobank_url_prefix + biobank["id"]
+        existing_pids = await self.async_service.reverse_lookup(url)
+
+        warnings = []
+        if existing_pids:
+            pid = existing_pids[0]
+            warning = self._existing_pids_warning(biobank["name"], existing_pids)
+            printer.print_warning(warning)
+            warnings.append(warning)
+        else:
+            name = biobank["name"]
+            pid = await self.async_service.register_pid(url, name)
+            printer.print(f'Registered {pid} for new biobank "{name}"')
+
+        if biobank.get("withdrawn", False):
+            await self.async_service.set_status(pid, Status.WITHDRAWN)
+            printer.print(f"Set STATUS of {pid} to {Status.WITHDRAWN.value}")
+        return pid, warnings
+
+    async def _update_biobank_pid_async(self, change: HandleMutation, printer: Printer):
+        if change.name is not None:
+            await self.async_service.set_name(change.pid, change.name)
+            printer.print(f'Updated NAME of {change.pid} to "{change.name}"')
+        if change.status:
+            await self.async_service.set_status(change.pid, Status.WITHDRAWN)
+            printer.print(f"Set STATUS of {change.pid} to {Status.WITHDRAWN.value}")
+        if change.remove_status:
+            await self.async_service.remove_status(change.pid)
+            printer.print(f"Remove WITHDRAWN STATUS of {change.pid}")
+
+    async def _terminate_biobank_async(self, biobank_pid: str, printer: Printer):
+        await self.async_service.set_status(biobank_pid, Status.TERMINATED)
+        printer.print(f"Set STATUS of {biobank_pid} to {Status.TERMINATED.value}")
 
 
 class NoOpPidManager(BasePidManager):
@@ -128,6 +462,12 @@ class NoOpPidManager(BasePidManager):
     def terminate_biobanks(self, biobank_pids: List[str]):
         pass
 
+    def flush(self):
+        pass
+
+    def discard(self):
+        pass
+
 
 class PidManagerFactory:
     """
@@ -136,8 +476,25 @@ class PidManagerFactory:
     """
 
     @staticmethod
-    def create(pid_service: BasePidService, printer: Printer) -> BasePidManager:
+    def create(
+        pid_service: BasePidService,
+        printer: Printer,
+        workers: int = 1,
+        requests_per_second: Optional[float] = None,
+        deferred: bool = False,
+        asynchronous: bool = False,
+    ) -> BasePidManager:
+        """
+        :param asynchronous: manage the PIDs on an event loop with an
+        AsyncPidManager, with at most `workers` concurrent handle operations
+        """
         if type(pid_service) is NoOpPidService:
             return NoOpPidManager()
+        elif asynchronous:
+            return AsyncPidManager(
+                pid_service, printer, workers, requests_per_second, deferred
+            )
         else:
-            return PidManager(pid_service, printer)
+            return PidManager(
+                pid_service, printer, workers, requests_per_second, deferred
+            )
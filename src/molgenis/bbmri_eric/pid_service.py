@@ -1,20 +1,22 @@
+import asyncio
 import secrets
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, TypeVar
 from urllib.parse import quote
 
-from pyhandle.client.resthandleclient import RESTHandleClient
-from pyhandle.clientcredentials import PIDClientCredentials
-from pyhandle.handleclient import PyHandleClient
-from pyhandle.handleexceptions import (
-    HandleAuthenticationError,
-    HandleNotFoundException,
-    HandleSyntaxError,
-)
-
 from molgenis.bbmri_eric.errors import EricError
 
+# pyhandle takes a while to import, so it's only imported when a PidService is used
+if TYPE_CHECKING:
+    from pyhandle.client.resthandleclient import RESTHandleClient
+
+T = TypeVar("T")
+
 
 class Status(Enum):
     TERMINATED = "TERMINATED"
@@ -28,6 +30,14 @@ def pyhandle_error_handler(func):
     """
 
     def inner_function(*args, **kwargs):
+        from pyhandle.handleexceptions import (
+            GenericHandleError,
+            HandleAuthenticationError,
+            HandleNotFoundException,
+            HandleSyntaxError,
+            ReverseLookupException,
+        )
+
         try:
             return func(*args, **kwargs)
         except HandleAuthenticationError as e:
@@ -36,10 +46,41 @@ def pyhandle_error_handler(func):
             raise EricError(f"Handle not found on handle server: {e.handle}")
         except HandleSyntaxError as e:
             raise EricError(f"Handle has incorrect syntax: {e.handle}")
+        except GenericHandleError as e:
+            raise EricError(f"Handle server error for handle {e.handle}") from e
+        except ReverseLookupException as e:
+            raise EricError("Reverse lookup failed") from e
 
     return inner_function
 
 
+@dataclass
+class HandleMutation:
+    """
+    The changes to a single handle. If url is set, the handle is new and is
+    registered with the URL and the other values.
+    """
+
+    pid: str
+    url: Optional[str] = None
+    name: Optional[str] = None
+    status: Optional[Status] = None
+    remove_status: bool = False
+
+    def merge(self, change: "HandleMutation"):
+        """Applies a later change to the same handle on top of this one."""
+        if change.url is not None:
+            self.url = change.url
+        if change.name is not None:
+            self.name = change.name
+        if change.status is not None:
+            self.status = change.status
+            self.remove_status = False
+        if change.remove_status:
+            self.status = None
+            self.remove_status = self.url is None
+
+
 class BasePidService(metaclass=ABCMeta):
     service_prefix = "1."
 
@@ -65,6 +106,21 @@ class BasePidService(metaclass=ABCMeta):
     def remove_status(self, pid: str):
         pass
 
+    @abstractmethod
+    def create_pid(self) -> str:
+        """Generates a new PID without registering it."""
+        pass
+
+    @abstractmethod
+    def apply(self, mutation: HandleMutation):
+        """Applies all changes to a handle, registering it if it's new."""
+        pass
+
+    @abstractmethod
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        """Returns the known values of a handle, or None if they aren't known."""
+        pass
+
     @staticmethod
     def generate_pid(prefix: str) -> str:
         """
@@ -77,15 +133,81 @@ class BasePidService(metaclass=ABCMeta):
         return f"{prefix}/{BasePidService.service_prefix}{id_[:4]}-{id_[4:8]}-{id_[8:]}"
 
 
+class HandleCache:
+    """
+    A local copy of the values (URL, NAME, STATUS, ...) of handles, with an index of
+    the handles by URL. Safe to use from multiple threads.
+
+    A complete cache has all handles under the prefix, so a URL that isn't in its
+    index has no handles.
+    """
+
+    def __init__(
+        self,
+        records: Optional[Dict[str, Dict[str, str]]] = None,
+        complete: bool = False,
+    ):
+        self.complete = complete
+        self._records: Dict[str, Dict[str, str]] = dict()
+        self._pids_by_url: Dict[str, List[str]] = dict()
+        self._lock = threading.Lock()
+        for pid, record in (records or dict()).items():
+            self.add(pid, record)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get_pids(self, url: str) -> List[str]:
+        with self._lock:
+            return list(self._pids_by_url.get(url, []))
+
+    def get_record(self, pid: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            record = self._records.get(pid)
+            return dict(record) if record is not None else None
+
+    def add(self, pid: str, record: Dict[str, str]):
+        with self._lock:
+            self._records[pid] = dict(record)
+            if "URL" in record:
+                self._pids_by_url.setdefault(record["URL"], []).append(pid)
+
+    def update(self, pid: str, **values: str):
+        """Updates the values of a known handle. Unknown handles are ignored."""
+        with self._lock:
+            if pid in self._records:
+                self._records[pid].update(values)
+
+    def remove_value(self, pid: str, key: str):
+        with self._lock:
+            if pid in self._records:
+                self._records[pid].pop(key, None)
+
+
 class PidService(BasePidService):
     """
     Low level service for interacting with the handle server.
+
+    The values of all handles under the prefix are retrieved with a single search the
+    first time they're needed and are kept in a HandleCache, which is updated with
+    every change this service makes. Reverse lookups are answered from the cache, a
+    URL that isn't in it has no handles. If the reverse lookup servlet can't return
+    the handle records, every URL is looked up with a search of its own.
     """
 
-    def __init__(self, client: RESTHandleClient, prefix: str, base_url: str):
+    def __init__(
+        self,
+        client: "RESTHandleClient",
+        prefix: str,
+        base_url: str,
+        use_handle_cache: bool = True,
+    ):
         self.client = client
         self.prefix = prefix
         self.base_url = base_url.rstrip("/") + "/"
+        self.use_handle_cache = use_handle_cache
+        self._cache: Optional[HandleCache] = None
+        self._cache_lock = threading.Lock()
 
     @staticmethod
     def from_credentials(credentials_json: str, base_url: str = None) -> "PidService":
@@ -108,6 +230,9 @@ class PidService(BasePidService):
         :param credentials_json: a full path to the credentials file
         :return: a PidService
         """
+        from pyhandle.clientcredentials import PIDClientCredentials
+        from pyhandle.handleclient import PyHandleClient
+
         credentials = PIDClientCredentials.load_from_JSON(credentials_json)
 
         if not base_url:
@@ -117,7 +242,9 @@ class PidService(BasePidService):
                 raise ValueError("server_url missing in credentials file")
 
         return PidService(
-            PyHandleClient("rest").instantiate_with_credentials(credentials),
+            PyHandleClient("rest").instantiate_with_credentials(
+                credentials, allowed_search_keys=["URL", "CHECKSUM", "retrieverecords"]
+            ),
             credentials.get_prefix(),
             base_url,
         )
@@ -129,8 +256,16 @@ class PidService(BasePidService):
 
         :param url: the URL to look up
         :raise: EricError if insufficient permissions for reverse lookup
-        :return: a (potentially empty) list of PIDs
+        :return: a (potentially empty) list of PIDs, or None if the URL isn't in the
+        complete handle cache
         """
+        cache = self._get_cache()
+        pids = cache.get_pids(url)
+        if pids:
+            return pids
+        if cache.complete:
+            return None
+
         url = quote(url)
         pids = self.client.search_handle(URL=url, prefix=self.prefix)
 
@@ -148,8 +283,10 @@ class PidService(BasePidService):
         :param name: the NAME for the handle
         :return: the generated PID
         """
-        pid = self.generate_pid(self.prefix)
-        return self.client.register_handle(handle=pid, location=url, NAME=name)
+        pid = self.create_pid()
+        pid = self.client.register_handle(handle=pid, location=url, NAME=name)
+        self._cache_record(pid, {"URL": url, "NAME": name})
+        return pid
 
     @pyhandle_error_handler
     def set_name(self, pid: str, new_name: str):
@@ -160,6 +297,7 @@ class PidService(BasePidService):
         :param new_name: the new value for the NAME field
         """
         self.client.modify_handle_value(pid, NAME=new_name)
+        self._cache_values(pid, NAME=new_name)
 
     @pyhandle_error_handler
     def set_status(self, pid: str, status: Status):
@@ -170,6 +308,7 @@ class PidService(BasePidService):
         :param status: a Status enum
         """
         self.client.modify_handle_value(pid, STATUS=status.value)
+        self._cache_values(pid, STATUS=status.value)
 
     @pyhandle_error_handler
     def remove_status(self, pid: str):
@@ -179,6 +318,290 @@ class PidService(BasePidService):
         :param pid: the PID to remove the STATUS field of
         """
         self.client.delete_handle_value(pid, "STATUS")
+        if self._cache is not None:
+            self._cache.remove_value(pid, "STATUS")
+
+    def create_pid(self) -> str:
+        return self.generate_pid(self.prefix)
+
+    @pyhandle_error_handler
+    def apply(self, mutation: HandleMutation):
+        """
+        Applies all changes to a handle with as few requests as possible: a new
+        handle is registered with all its values at once, the values of an existing
+        handle are modified with a single request.
+
+        :param mutation: the changes to the handle
+        """
+        values = dict()
+        if mutation.name is not None:
+            values["NAME"] = mutation.name
+        if mutation.status is not None:
+            values["STATUS"] = mutation.status.value
+
+        if mutation.url is not None:
+            self.client.register_handle(
+                handle=mutation.pid, location=mutation.url, **values
+            )
+            self._cache_record(mutation.pid, {"URL": mutation.url, **values})
+            return
+
+        if values:
+            self.client.modify_handle_value(mutation.pid, **values)
+            self._cache_values(mutation.pid, **values)
+        if mutation.remove_status:
+            self.client.delete_handle_value(mutation.pid, "STATUS")
+            if self._cache is not None:
+                self._cache.remove_value(mutation.pid, "STATUS")
+
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        """
+        Returns the values of a handle from the cache, retrieving the cache first if
+        needed.
+
+        :param pid: the PID of the handle
+        :return: the values by type, or None if the handle isn't in the cache
+        """
+        return self._get_cache().get_record(pid)
+
+    def _cache_record(self, pid: str, record: Dict[str, str]):
+        if self._cache is not None:
+            self._cache.add(pid, record)
+
+    def _cache_values(self, pid: str, **values: str):
+        if self._cache is not None:
+            self._cache.update(pid, **values)
+
+    def _get_cache(self) -> HandleCache:
+        """
+        Returns the handle cache. Retrieves it on first use. The cache is empty and
+        incomplete if it's turned off or if the handle records can't be retrieved in
+        bulk.
+        """
+        with self._cache_lock:
+            if self._cache is None:
+                self._cache = (
+                    self._retrieve_cache() if self.use_handle_cache else HandleCache()
+                )
+            return self._cache
+
+    def _retrieve_cache(self) -> HandleCache:
+        """
+        Retrieves the records of all handles under the prefix with a single wildcard
+        search.
+        """
+        from pyhandle.handleexceptions import ReverseLookupException
+
+        try:
+            records = self.client.search_handle(URL="*", retrieverecords="true")
+        except ReverseLookupException:
+            return HandleCache()
+
+        if isinstance(records, list):
+            # a servlet that doesn't support retrieverecords returns plain handles
+            if not all(
+                isinstance(record, dict) and "handle" in record and "values" in record
+                for record in records
+            ):
+                return HandleCache()
+            records = {record["handle"]: record["values"] for record in records}
+        if not isinstance(records, dict):
+            return HandleCache()
+
+        cache = HandleCache(complete=True)
+        for pid, values in records.items():
+            if pid.split("/")[0] != self.prefix:
+                continue
+            record = dict()
+            for value in values:
+                data = value.get("data")
+                data = data.get("value") if isinstance(data, dict) else data
+                record.setdefault(value.get("type"), str(data))
+            cache.add(pid, record)
+        return cache
+
+
+class RateLimitedPidService(BasePidService):
+    """
+    Wraps a BasePidService and limits the number of requests per second that are
+    made with it, also when it's used by multiple threads. The requests are spread
+    evenly: a request waits until at least 1 / requests_per_second seconds have passed
+    since the previous one.
+    """
+
+    def __init__(self, pid_service: BasePidService, requests_per_second: float):
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be greater than 0")
+        self.pid_service = pid_service
+        self.base_url = pid_service.base_url
+        self.interval = 1 / requests_per_second
+        self._next_request = 0.0
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_request - now
+            self._next_request = max(now, self._next_request) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        self._wait()
+        return self.pid_service.reverse_lookup(url)
+
+    def register_pid(self, url: str, name: str) -> str:
+        self._wait()
+        return self.pid_service.register_pid(url, name)
+
+    def set_name(self, pid: str, new_name: str):
+        self._wait()
+        self.pid_service.set_name(pid, new_name)
+
+    def set_status(self, pid: str, status: Status):
+        self._wait()
+        self.pid_service.set_status(pid, status)
+
+    def remove_status(self, pid: str):
+        self._wait()
+        self.pid_service.remove_status(pid)
+
+    def create_pid(self) -> str:
+        return self.pid_service.create_pid()
+
+    def apply(self, mutation: HandleMutation):
+        self._wait()
+        self.pid_service.apply(mutation)
+
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        return self.pid_service.get_cached_record(pid)
+
+
+class PidOutbox(BasePidService):
+    """
+    Wraps a BasePidService and defers all changes to handles. The changes are recorded
+    and coalesced per handle, so each handle is changed with a single request when the
+    outbox is flushed. New handles get a PID right away, but are only registered when
+    the outbox is flushed. Reverse lookups are not deferred.
+    """
+
+    def __init__(self, pid_service: BasePidService):
+        self.pid_service = pid_service
+        self.base_url = pid_service.base_url
+        self._changes: List[HandleMutation] = list()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._changes)
+
+    def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        with self._lock:
+            pids = [change.pid for change in self._changes if change.url == url]
+        if pids:
+            return pids
+        return self.pid_service.reverse_lookup(url)
+
+    def register_pid(self, url: str, name: str) -> str:
+        pid = self.create_pid()
+        self._record(HandleMutation(pid, url=url, name=name))
+        return pid
+
+    def set_name(self, pid: str, new_name: str):
+        self._record(HandleMutation(pid, name=new_name))
+
+    def set_status(self, pid: str, status: Status):
+        self._record(HandleMutation(pid, status=status))
+
+    def remove_status(self, pid: str):
+        self._record(HandleMutation(pid, remove_status=True))
+
+    def create_pid(self) -> str:
+        return self.pid_service.create_pid()
+
+    def apply(self, mutation: HandleMutation):
+        self._record(mutation)
+
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        return self.pid_service.get_cached_record(pid)
+
+    def rollback(self, savepoint: int):
+        """
+        Discards the changes that were recorded after the savepoint.
+
+        :param savepoint: the number of recorded changes to keep, see len()
+        """
+        with self._lock:
+            del self._changes[savepoint:]
+
+    def take(self) -> List[HandleMutation]:
+        """
+        Removes the recorded changes from the outbox and returns them coalesced per
+        handle, in the order in which the handles were first changed.
+        """
+        with self._lock:
+            changes, self._changes = self._changes, list()
+
+        mutations: Dict[str, HandleMutation] = dict()
+        for change in changes:
+            mutation = mutations.setdefault(change.pid, HandleMutation(change.pid))
+            mutation.merge(change)
+        return list(mutations.values())
+
+    def _record(self, change: HandleMutation):
+        with self._lock:
+            self._changes.append(change)
+
+
+class AsyncPidService:
+    """
+    Asynchronous interface to a BasePidService, so many handle operations can be
+    awaited concurrently, for example with asyncio.gather. The handle client is
+    synchronous, so the operations run in a pool of threads that share the client and
+    its HTTP connections. At most `concurrency` operations run at the same time.
+    """
+
+    def __init__(self, pid_service: BasePidService, concurrency: int = 8):
+        """
+        :param pid_service: the service that does the operations
+        :param concurrency: the maximum number of concurrent operations
+        """
+        self.pid_service = pid_service
+        self.base_url = pid_service.base_url
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def __enter__(self) -> "AsyncPidService":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    async def reverse_lookup(self, url: str) -> Optional[List[str]]:
+        return await self._call(self.pid_service.reverse_lookup, url)
+
+    async def register_pid(self, url: str, name: str) -> str:
+        return await self._call(self.pid_service.register_pid, url, name)
+
+    async def set_name(self, pid: str, new_name: str):
+        await self._call(self.pid_service.set_name, pid, new_name)
+
+    async def set_status(self, pid: str, status: Status):
+        await self._call(self.pid_service.set_status, pid, status)
+
+    async def remove_status(self, pid: str):
+        await self._call(self.pid_service.remove_status, pid)
+
+    async def apply(self, mutation: HandleMutation):
+        await self._call(self.pid_service.apply, mutation)
+
+    async def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        return await self._call(self.pid_service.get_cached_record, pid)
+
+    async def _call(self, func: Callable[..., T], *args) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
 
 
 class DummyPidService(BasePidService):
@@ -194,7 +617,7 @@ class DummyPidService(BasePidService):
         pass
 
     def register_pid(self, url: str, name: str) -> str:
-        return self.generate_pid("FAKE-PREFIX")
+        return self.create_pid()
 
     def set_name(self, pid: str, new_name: str):
         pass
@@ -205,6 +628,15 @@ class DummyPidService(BasePidService):
     def remove_status(self, pid: str):
         pass
 
+    def create_pid(self) -> str:
+        return self.generate_pid("FAKE-PREFIX")
+
+    def apply(self, mutation: HandleMutation):
+        pass
+
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        pass
+
 
 class NoOpPidService(BasePidService):
     """
@@ -226,3 +658,12 @@ class NoOpPidService(BasePidService):
 
     def remove_status(self, pid: str):
         pass
+
+    def create_pid(self) -> str:
+        pass
+
+    def apply(self, mutation: HandleMutation):
+        pass
+
+    def get_cached_record(self, pid: str) -> Optional[Dict[str, str]]:
+        pass
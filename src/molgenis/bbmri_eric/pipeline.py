@@ -0,0 +1,69 @@
+import queue
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple, TypeVar
+
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.printer import BufferedPrinter, Printer
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+Fetched = Tuple[T, Optional[R], Optional[EricError], List[str]]
+"""An item, the result of the function or the EricError it raised, and the lines it
+printed"""
+
+
+def prefetch(
+    func: Callable[[T, Printer], R], items: List[T], depth: int
+) -> Iterator[Fetched]:
+    """
+    Calls a function for each item, in order, in a background thread, while the
+    results are consumed. The function prints to a buffer, so the consumer can print
+    its output in order.
+
+    At most `depth` results wait in a queue to be consumed. When the queue is full the
+    background thread waits, so no more than depth + 2 results are in memory at the
+    same time: the waiting ones, the one being consumed and the one being fetched.
+
+    An EricError raised by the function is yielded with its item. Other exceptions are
+    raised to the consumer.
+
+    :param func: the function to call with an item and a printer
+    :param items: the items to call the function for
+    :param depth: the maximum number of results that wait to be consumed
+    :return: an iterator of Fetched tuples, in the order of the items
+    """
+    if depth < 1:
+        raise ValueError("depth must be at least 1")
+
+    results: queue.Queue = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def produce():
+        for item in items:
+            printer = BufferedPrinter()
+            try:
+                result = (item, func(item, printer), None, printer.lines)
+            except Exception as e:
+                result = (item, None, e, printer.lines)
+            while not stopped.is_set():
+                try:
+                    results.put(result, timeout=0.05)
+                    break
+                except queue.Full:
+                    pass
+            if stopped.is_set():
+                return
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        for _ in items:
+            item, result, error, lines = results.get()
+            if error is not None and not isinstance(error, EricError):
+                raise error
+            yield item, result, error, lines
+    finally:
+        # the consumer stopped or failed, let the background thread end too
+        stopped.set()
+        thread.join()
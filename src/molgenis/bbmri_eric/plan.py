@@ -0,0 +1,154 @@
+import csv
+import io
+import math
+from dataclasses import dataclass, field
+from typing import List, Set
+
+from molgenis.bbmri_eric.bbmri_client import DEFAULT_DELETE_BATCH_SIZE
+from molgenis.bbmri_eric.diff import TableDiff
+from molgenis.bbmri_eric.errors import ErrorReport
+from molgenis.bbmri_eric.model import Table, TableType
+from molgenis.bbmri_eric.pid_service import HandleMutation
+
+
+@dataclass
+class Deletion:
+    """The rows of a combined table that are removed from the data to publish."""
+
+    deletable_ids: Set[str]
+    """The ids of the rows that can be deleted"""
+
+    quality_ids: List[str]
+    """The ids of the rows that can't be deleted because of the quality info"""
+
+    referenced_ids: Set[str]
+    """The ids of the rows that can't be deleted because they're still referenced"""
+
+
+@dataclass(frozen=True)
+class TablePlan:
+    """What publishing would change in one of the combined tables."""
+
+    table_type: TableType
+    inserted: int
+    changed: int
+    unchanged: int
+    deleted: int
+    quality_protected: int
+    referenced: int
+    terminated_pids: int
+    upload_bytes: int
+
+    @staticmethod
+    def of(
+        diff: TableDiff, deletion: Deletion, table: Table, existing_table: Table
+    ) -> "TablePlan":
+        terminated_pids = 0
+        if table.type == TableType.BIOBANKS:
+            terminated_pids = sum(
+                1
+                for id_ in deletion.deletable_ids
+                if existing_table.rows_by_id[id_].get("pid")
+            )
+
+        return TablePlan(
+            table_type=table.type,
+            inserted=len(diff.inserted),
+            changed=len(diff.changed),
+            unchanged=diff.unchanged,
+            deleted=len(deletion.deletable_ids),
+            quality_protected=len(deletion.quality_ids),
+            referenced=len(deletion.referenced_ids),
+            terminated_pids=terminated_pids,
+            upload_bytes=get_csv_size(diff.upserted, table.meta.attributes),
+        )
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.inserted or self.changed or self.deleted)
+
+
+@dataclass
+class PublishingPlan:
+    """
+    What publishing a set of nodes would do, determined without changing anything in
+    the directory or on the handle server. The request counts are estimates of the
+    requests that change something.
+    """
+
+    report: ErrorReport
+    tables: List[TablePlan] = field(default_factory=list)
+    pid_changes: List[HandleMutation] = field(default_factory=list)
+    delete_batch_size: int = DEFAULT_DELETE_BATCH_SIZE
+    """The number of rows that are deleted per request (see EricSession)"""
+
+    @property
+    def registered_pids(self) -> int:
+        return sum(1 for change in self.pid_changes if change.url is not None)
+
+    @property
+    def updated_pids(self) -> int:
+        return len(self.pid_changes) - self.registered_pids
+
+    @property
+    def terminated_pids(self) -> int:
+        return sum(table.terminated_pids for table in self.tables)
+
+    @property
+    def upload_bytes(self) -> int:
+        return sum(table.upload_bytes for table in self.tables)
+
+    @property
+    def directory_requests(self) -> int:
+        """
+        One import of all new and changed rows and, per table, one deletion per batch
+        of delete_batch_size rows.
+        """
+        upload = any(table.inserted or table.changed for table in self.tables)
+        return int(upload) + sum(
+            math.ceil(table.deleted / self.delete_batch_size) for table in self.tables
+        )
+
+    @property
+    def handle_requests(self) -> int:
+        """
+        A new handle is registered with one request. Changing the values of an
+        existing handle takes two (the handle is read first), and so does removing a
+        value.
+        """
+        requests = 2 * self.terminated_pids
+        for change in self.pid_changes:
+            if change.url is not None:
+                requests += 1
+            elif change.name is not None or change.status is not None:
+                requests += 2
+            if change.remove_status:
+                requests += 2
+        return requests
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.pid_changes or any(table.has_changes for table in self.tables))
+
+
+def get_csv_size(rows: List[dict], attributes: List[str]) -> int:
+    """
+    Returns the number of bytes the rows take in the CSV format that they're
+    imported with.
+    """
+    if not rows:
+        return 0
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(
+        buffer, fieldnames=attributes, quoting=csv.QUOTE_ALL, extrasaction="ignore"
+    )
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(
+            {
+                key: ",".join(value) if isinstance(value, list) else value
+                for key, value in row.items()
+            }
+        )
+    return len(buffer.getvalue().encode("utf-8"))
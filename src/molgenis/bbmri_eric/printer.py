@@ -1,8 +1,13 @@
+import time
 from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, TextIO
 
 from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
 from molgenis.bbmri_eric.model import Node
 
+if TYPE_CHECKING:
+    from molgenis.bbmri_eric.plan import PublishingPlan
+
 
 class Printer:
     """
@@ -25,11 +30,14 @@ class Printer:
     def print(self, value: str = None, indent: int = 0):
         self.indents += indent
         if value:
-            print(f"{'    ' * self.indents}{value}")
+            self._write(f"{'    ' * self.indents}{value}")
         else:
-            print()
+            self._write("")
         self.indents -= indent
 
+    def _write(self, line: str):
+        print(line)
+
     def print_node_title(self, node: Node):
         self.print_header(f"🌍 Node {node.code} ({node.description})")
 
@@ -72,8 +80,82 @@ class Printer:
                 message = f"✅ Node {node.code} finished successfully"
             self.print(message)
 
+    def print_plan(self, plan: "PublishingPlan"):
+        self.print_header("📋 Plan")
+        if not plan.has_changes:
+            self.print("✅ Publishing would change nothing")
+            return
+
+        for table in plan.tables:
+            if not table.has_changes:
+                continue
+            self.print(
+                f"✏️ {table.table_type.base_id}: {table.inserted} new, "
+                f"{table.changed} changed, {table.deleted} deleted, "
+                f"{table.unchanged} unchanged"
+            )
+            with self.indentation():
+                if table.quality_protected:
+                    self.print(
+                        f"🛡️ {table.quality_protected} deletion(s) prevented by the "
+                        f"quality info"
+                    )
+                if table.referenced:
+                    self.print(
+                        f"🛡️ {table.referenced} deletion(s) prevented by references"
+                    )
+
+        self.print(
+            f"🆔 PIDs: {plan.registered_pids} registered, {plan.updated_pids} "
+            f"updated, {plan.terminated_pids} terminated"
+        )
+        self.print(
+            f"📡 About {plan.directory_requests} request(s) to the directory, "
+            f"{_format_bytes(plan.upload_bytes)} to upload"
+        )
+        self.print(f"📡 About {plan.handle_requests} request(s) to the handle server")
+
     @contextmanager
     def indentation(self):
         self.indent()
         yield
         self.dedent()
+
+
+def _format_bytes(size: int) -> str:
+    for unit in ["B", "kB", "MB"]:
+        if size < 1000:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1000
+    return f"{size:.1f} GB"
+
+
+class BufferedPrinter(Printer):
+    """
+    Printer that stores the printed lines instead of writing them to stdout. Used in
+    worker processes and threads, so their output can be printed in order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lines: List[str] = []
+
+    def _write(self, line: str):
+        self.lines.append(line)
+
+
+class TracingPrinter(Printer):
+    """
+    Printer that also writes every line to a trace file, preceded by the number of
+    seconds since the printer was created. Shows how long each step of a run takes.
+    """
+
+    def __init__(self, trace_file: TextIO):
+        super().__init__()
+        self.trace_file = trace_file
+        self.start = time.perf_counter()
+
+    def _write(self, line: str):
+        super()._write(line)
+        elapsed = time.perf_counter() - self.start
+        self.trace_file.write(f"{elapsed:10.3f}  {line}\n")
@@ -1,32 +1,125 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
 from molgenis.bbmri_eric.bbmri_client import EricSession
-from molgenis.bbmri_eric.errors import ErrorReport, requests_error_handler
+from molgenis.bbmri_eric.errors import (
+    EricError,
+    EricWarning,
+    ErrorReport,
+    requests_error_handler,
+)
 from molgenis.bbmri_eric.model import Node, NodeData
 from molgenis.bbmri_eric.model_fitting import ModelFitter
-from molgenis.bbmri_eric.pid_manager import BasePidManager
-from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.pid_manager import BasePidManager, NoOpPidManager
+from molgenis.bbmri_eric.printer import BufferedPrinter, Printer
 from molgenis.bbmri_eric.publisher import PublishingState
 from molgenis.bbmri_eric.transformer import Transformer
-from molgenis.bbmri_eric.validation import Validator
+from molgenis.bbmri_eric.validation import StreamingValidator, Validator
 
 
 class PublicationPreparer:
     """Prepares nodes for publishing."""
 
     def __init__(
-        self, printer: Printer, pid_manager: BasePidManager, session: EricSession
+        self,
+        printer: Printer,
+        pid_manager: BasePidManager,
+        session: EricSession,
+        max_errors: Optional[int] = None,
+        fused_transform: bool = True,
     ):
+        """
+        :param max_errors: if set, the staging data of a node is validated while it's
+        being retrieved, and the retrieval is aborted when the number of invalid ids
+        and hyperlinks exceeds max_errors
+        :param fused_transform: if True, the staged data is transformed in a single
+        pass over the tables, otherwise in one pass per step (see Transformer)
+        """
         self.printer = printer
         self.pid_manager = pid_manager
         self.session = session
+        self.max_errors = max_errors
+        self.fused_transform = fused_transform
 
     @requests_error_handler
-    def prepare(self, node: Node, state: PublishingState) -> NodeData:
-        node_data = self._get_node_data(node)
+    def prepare(
+        self, node: Node, state: PublishingState, node_data: Optional[NodeData] = None
+    ) -> NodeData:
+        """
+        Prepares a node for publishing.
+
+        :param node: the node to prepare
+        :param state: the publishing state
+        :param node_data: the node's staged data if it's already retrieved
+        :return: the prepared data
+        """
+        if node_data is None:
+            node_data = self._get_node_data(node)
+        self._prepare_node_data(node_data, state)
+        self._manage_node_pids(node_data, state)
+        return node_data
+
+    @requests_error_handler
+    def retrieve(
+        self,
+        node: Node,
+        printer: Optional[Printer] = None,
+        staged_data: Optional[NodeData] = None,
+    ) -> NodeData:
+        """Retrieves the staged data of a node, to prepare it with
+        prepare_in_parallel or to pass it to prepare.
+
+        :param node: the node to retrieve the staged data of
+        :param printer: the printer to print to, defaults to this preparer's printer
+        :param staged_data: the data that was just staged for the node (see
+        Stager.stage). It's used instead of retrieving the same data again.
+        """
+        if staged_data is not None:
+            return self._use_staged_data(staged_data, printer)
+        return self._get_node_data(node, printer)
+
+    def prepare_in_parallel(
+        self, nodes_data: List[NodeData], state: PublishingState, jobs: int
+    ) -> Iterator[Tuple[Node, Optional[NodeData], Optional[EricError]]]:
+        """
+        Prepares the retrieved data of multiple nodes. Validation, model fitting and
+        transformation are done in a pool of worker processes. The PIDs are managed in
+        this process, one node at a time.
+
+        The results are yielded in the order of nodes_data. The output and warnings of
+        a node are printed and added to the report when its result is yielded.
+
+        :param nodes_data: the retrieved data of the nodes to prepare
+        :param state: the publishing state, shared with the worker processes once
+        :param jobs: the maximum number of worker processes
+        :return: for each node the node and either the prepared data or an error
+        """
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker, initargs=(state,)
+        ) as executor:
+            futures = [
+                executor.submit(_prepare_in_worker, node_data, self.fused_transform)
+                for node_data in nodes_data
+            ]
+            for node_data, future in zip(nodes_data, futures):
+                node = node_data.node
+                prepared_data, warnings, lines, error = future.result()
+                for line in lines:
+                    self.printer.print(line)
+                state.report.add_node_warnings(node, warnings)
+                try:
+                    if error:
+                        raise error
+                    self._manage_node_pids(prepared_data, state)
+                except EricError as e:
+                    yield node, None, e
+                else:
+                    yield node, prepared_data, None
+
+    def _prepare_node_data(self, node_data: NodeData, state: PublishingState):
         self._validate_node(node_data, state.report)
         self._fit_node_model(node_data, state.report)
         self._transform_node(node_data, state)
-        self._manage_node_pids(node_data, state)
-        return node_data
 
     def _validate_node(self, node_data: NodeData, report: ErrorReport):
         self.printer.print(f"🔎 Validating staged data of node {node_data.node.code}")
@@ -55,10 +148,13 @@ class PublicationPreparer:
                 existing_biobanks=state.existing_data.biobanks,
                 eu_node_data=state.eu_node_data,
                 diseases=state.diseases,
+                fused=self.fused_transform,
+                category_rules=state.category_rules,
             ).transform()
             if warnings:
                 state.report.add_node_warnings(node_data.node, warnings)
 
+    @requests_error_handler
     def _manage_node_pids(self, node_data: NodeData, state: PublishingState):
         self.printer.print("🆔 Managing PIDs")
         with self.printer.indentation():
@@ -69,6 +165,68 @@ class PublicationPreparer:
             if warnings:
                 state.report.add_node_warnings(node_data.node, warnings)
 
-    def _get_node_data(self, node: Node) -> NodeData:
-        self.printer.print(f"📦 Retrieving staged data of node {node.code}")
-        return self.session.get_staging_node_data(node)
+    def _get_node_data(self, node: Node, printer: Optional[Printer] = None) -> NodeData:
+        printer = printer if printer else self.printer
+        printer.print(f"📦 Retrieving staged data of node {node.code}")
+        if self.max_errors is None:
+            return self.session.get_staging_node_data(node)
+
+        validator = StreamingValidator(node, self.max_errors)
+        return self.session.get_staging_node_data(
+            node, page_handler=validator.validate_page
+        )
+
+    def _use_staged_data(
+        self, staged_data: NodeData, printer: Optional[Printer] = None
+    ) -> NodeData:
+        """
+        Returns data that was staged in this run, after checking it the way it would
+        have been checked while it was retrieved.
+        """
+        printer = printer if printer else self.printer
+        node = staged_data.node
+        printer.print(f"📦 Using the data that was staged for node {node.code}")
+        if self.max_errors is not None:
+            validator = StreamingValidator(node, self.max_errors)
+            for table in staged_data.import_order:
+                validator.validate_page(table.type, table.meta, table.rows, 0)
+        return staged_data
+
+
+_worker_state: Optional[PublishingState] = None
+
+
+def _init_worker(state: PublishingState):
+    """
+    Stores the publishing state in a worker process. The read-only parts of the state
+    (quality info, EU node data, disease ontology and existing data) are sent to each
+    worker once instead of with every node.
+    """
+    global _worker_state
+    _worker_state = state
+
+
+def _prepare_in_worker(
+    node_data: NodeData, fused_transform: bool = True
+) -> Tuple[Optional[NodeData], List[EricWarning], List[str], Optional[EricError]]:
+    """
+    Validates, fits and transforms a node's data in a worker process. Returns the
+    prepared data, the warnings, the printed output and the error if the node
+    couldn't be prepared. The output and warnings are also returned on an error.
+    """
+    printer = BufferedPrinter()
+    node = node_data.node
+    _worker_state.report = ErrorReport([node])
+
+    preparer = PublicationPreparer(
+        printer, NoOpPidManager(), session=None, fused_transform=fused_transform
+    )
+    try:
+        preparer._prepare_node_data(node_data, _worker_state)
+    except EricError as e:
+        prepared_data, error = None, e
+    else:
+        prepared_data, error = node_data, None
+
+    warnings = _worker_state.report.node_warnings.get(node, [])
+    return prepared_data, warnings, printer.lines, error
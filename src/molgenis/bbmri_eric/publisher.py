@@ -1,7 +1,9 @@
 from dataclasses import dataclass, field
-from typing import List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.bbmri_eric.categories import CategoryRules
+from molgenis.bbmri_eric.diff import TableDiff
 from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
 from molgenis.bbmri_eric.model import (
     MixedData,
@@ -14,9 +16,14 @@ from molgenis.bbmri_eric.model import (
     TableType,
 )
 from molgenis.bbmri_eric.pid_manager import BasePidManager
+from molgenis.bbmri_eric.plan import Deletion, TablePlan
 from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.reference_graph import ReferenceGraph
 from molgenis.client import MolgenisRequestError
 
+if TYPE_CHECKING:
+    from molgenis.bbmri_eric.checkpoints import PublishingCheckpoint
+
 
 @dataclass
 class PublishingState:
@@ -26,10 +33,11 @@ class PublishingState:
     nodes: List[Node]
     report: ErrorReport
     diseases: OntologyTable
+    category_rules: CategoryRules = field(default_factory=CategoryRules.default)
     data_to_publish: MixedData = field(init=False)
 
     def __post_init__(self):
-        self.data_to_publish = self.existing_data.copy_empty()
+        self.data_to_publish = self.existing_data.copy_empty(segmented=True)
         self.data_to_publish.source = Source.TRANSFORMED
 
 
@@ -49,53 +57,212 @@ class Publisher:
         self.printer = printer
         self.pid_manager = pid_manager
 
-    def publish(self, state: PublishingState):
+    def publish(
+        self,
+        state: PublishingState,
+        checkpoint: Optional["PublishingCheckpoint"] = None,
+    ):
         """
         Copies staging data to the combined tables. This happens in two phases:
-        1. New/existing rows are upserted in the combined tables
+        1. New and changed rows are upserted in the combined tables
         2. Removed rows are deleted from the combined tables
+
+        Deferred changes to PIDs are sent after the rows they belong to are saved or
+        deleted, and discarded if that fails.
+
+        :param state: the publishing state
+        :param checkpoint: if set, the upsert and the deletions from each table are
+        recorded in it when they're completed, and skipped if they already were
         """
+        # The graph is built before the upload, which may change the rows it's given
+        references = ReferenceGraph.of(state.data_to_publish)
+
         self.printer.print("💾 Saving new and updated data to combined tables")
         with self.printer.indentation():
-            self._upsert_data(state)
+            if checkpoint and checkpoint.is_done("upsert"):
+                self.printer.print("⏩ Already saved in this run, skipping")
+            else:
+                try:
+                    self._upsert_data(state)
+                except EricError:
+                    self.pid_manager.discard()
+                    raise
+                self.pid_manager.flush()
+                if checkpoint:
+                    checkpoint.set_done("upsert")
 
         self.printer.print("🧼 Cleaning up removed data in combined tables")
         with self.printer.indentation():
-            self._delete_data(state)
+            self._delete_data(state, references, checkpoint)
 
-    def _upsert_data(self, state):
+    def _upsert_data(self, state: PublishingState):
+        """
+        Compares the rows to publish with the published rows and only uploads the rows
+        that are new or changed.
+        """
         try:
-            self.session.upload_data(state.data_to_publish)
+            published_rows = self._get_published_rows(state)
+            changes = state.data_to_publish.copy_empty()
+            for table in state.data_to_publish.import_order:
+                diff = TableDiff.of(table, published_rows[table.type])
+                self._print_diff(diff)
+                changes.table_by_type[table.type].rows_by_id.update(
+                    (row["id"], row) for row in diff.upserted
+                )
+
+            if any(table.rows_by_id for table in changes.import_order):
+                self.session.upload_data(changes)
         except MolgenisRequestError as e:
             raise EricError("Error importing data to combined tables") from e
 
-    def _delete_data(self, state):
+    def _get_published_rows(
+        self, state: PublishingState
+    ) -> Dict[TableType, Dict[str, dict]]:
+        """
+        Retrieves all attributes of the published rows that are going to be upserted.
+        Only the nodes that these rows were published by are retrieved. The existing
+        data only has the rows of the nodes that are published, so rows of other nodes
+        (the EU rows that nodes refer to) are looked up by their own national_node.
+        """
+        own_codes = {node.code for node in state.nodes}
+        codes = set()
+        for table in state.data_to_publish.import_order:
+            existing_rows = state.existing_data.table_by_type[table.type].rows_by_id
+            for id_, row in table.rows_by_id.items():
+                code = row.get("national_node")
+                if id_ in existing_rows:
+                    codes.add(existing_rows[id_]["national_node"])
+                elif code and code not in own_codes:
+                    codes.add(code)
+
+        if not codes:
+            return {table_type: dict() for table_type in TableType.get_import_order()}
+
+        self.printer.print("📦 Retrieving published rows to compare with")
+        published = self.session.get_published_data(
+            [Node.of(code) for code in sorted(codes)]
+        )
+        return {table.type: table.rows_by_id for table in published.import_order}
+
+    def _print_diff(self, diff: TableDiff):
+        if diff.upserted:
+            self.printer.print(
+                f"Upserting {len(diff.inserted)} new and {len(diff.changed)} changed "
+                f"row(s) in {diff.table_type.base_id}, {diff.unchanged} unchanged"
+            )
+        elif diff.unchanged:
+            self.printer.print(
+                f"No changes to the {diff.unchanged} row(s) in "
+                f"{diff.table_type.base_id}"
+            )
+
+    def _delete_data(
+        self,
+        state: PublishingState,
+        references: ReferenceGraph,
+        checkpoint: Optional["PublishingCheckpoint"] = None,
+    ):
         for table in reversed(state.data_to_publish.import_order):
+            phase = f"delete:{table.type.value}"
+            if checkpoint and checkpoint.is_done(phase):
+                continue
             try:
                 with self.printer.indentation():
                     self._delete_rows(
-                        table, state.existing_data.table_by_type[table.type], state
+                        table,
+                        state.existing_data.table_by_type[table.type],
+                        state,
+                        references,
                     )
             except MolgenisRequestError as e:
+                self.pid_manager.discard()
                 raise EricError(f"Error deleting rows from {table.type.base_id}") from e
+            self.pid_manager.flush()
+            if checkpoint:
+                checkpoint.set_done(phase)
 
-    def _delete_rows(self, table: Table, existing_table: Table, state: PublishingState):
+    def plan(self, state: PublishingState) -> List[TablePlan]:
         """
-        Deletes rows from a combined table that are not present in the staging area's
-        table. If a row is referenced from the quality info tables, it is not deleted
-        but a warning will be raised.
+        Determines what publishing the prepared data would change in the combined
+        tables, without changing anything: the rows that would be inserted, updated
+        and deleted, and the deletions that would be prevented.
+
+        :param state: the publishing state with the prepared data
+        :return: the plan of each table, in import order
+        """
+        try:
+            published_rows = self._get_published_rows(state)
+        except MolgenisRequestError as e:
+            raise EricError("Error retrieving the published rows") from e
+
+        references = ReferenceGraph.of(state.data_to_publish)
+        plans = []
+        for table in state.data_to_publish.import_order:
+            existing_table = state.existing_data.table_by_type[table.type]
+            deletion = self._get_deletion(table, existing_table, state, references)
+            plans.append(
+                TablePlan.of(
+                    TableDiff.of(table, published_rows[table.type]),
+                    deletion,
+                    table,
+                    existing_table,
+                )
+            )
+        return plans
+
+    @staticmethod
+    def _get_deletion(
+        table: Table,
+        existing_table: Table,
+        state: PublishingState,
+        references: ReferenceGraph,
+    ) -> Deletion:
+        """
+        Determines which rows of a combined table are not present in the staging
+        area's table anymore, and which of them can be deleted. Rows that are
+        referenced from the quality info tables or from a row that is published can't
+        be deleted.
 
         :param Table table: the staging area's table
         :param Table existing_table: the existing rows
+        :param ReferenceGraph references: the references between the rows to publish
         """
         # Compare the ids from staging and production to see what was deleted
-        staging_ids = table.rows_by_id.keys()
-        production_ids = set(existing_table.rows_by_id.keys())
-        deleted_ids = production_ids.difference(staging_ids)
+        staging_ids = table.rows_by_id
+        deleted_ids = {
+            id_ for id_ in existing_table.rows_by_id.keys() if id_ not in staging_ids
+        }
 
         # Remove ids that we are not allowed to delete
         undeletable_ids = state.quality_info.get_qualities(table.type).keys()
         deletable_ids = deleted_ids.difference(undeletable_ids)
+        referenced_ids = {
+            id_ for id_ in deletable_ids if references.is_referenced(table.type, id_)
+        }
+        return Deletion(
+            deletable_ids=deletable_ids.difference(referenced_ids),
+            quality_ids=[id_ for id_ in undeletable_ids if id_ in deleted_ids],
+            referenced_ids=referenced_ids,
+        )
+
+    def _delete_rows(
+        self,
+        table: Table,
+        existing_table: Table,
+        state: PublishingState,
+        references: ReferenceGraph,
+    ):
+        """
+        Deletes rows from a combined table that are not present in the staging area's
+        table. If a row is referenced from the quality info tables or from a row that
+        is published, it is not deleted but a warning will be raised.
+
+        :param Table table: the staging area's table
+        :param Table existing_table: the existing rows
+        :param ReferenceGraph references: the references between the rows to publish
+        """
+        deletion = self._get_deletion(table, existing_table, state, references)
+        deletable_ids = deletion.deletable_ids
 
         # For deleted biobanks, update the handle
         if table.type == TableType.BIOBANKS:
@@ -117,14 +284,24 @@ class Publisher:
                     state.report.add_node_warnings(Node.of(code), [warning])
 
         # Show warning for every id that we prevented deletion of
-        if deleted_ids != deletable_ids:
-            for id_ in undeletable_ids:
-                if id_ in deleted_ids:
-                    warning = EricWarning(
-                        f"Prevented the deletion of a row that is referenced from "
-                        f"the quality info: {table.type.value} {id_}."
-                    )
-                    self.printer.print_warning(warning)
+        for id_ in deletion.quality_ids:
+            warning = EricWarning(
+                f"Prevented the deletion of a row that is referenced from "
+                f"the quality info: {table.type.value} {id_}."
+            )
+            self.printer.print_warning(warning)
 
-                    code = existing_table.rows_by_id[id_]["national_node"]
-                    state.report.add_node_warnings(Node.of(code), [warning])
+            code = existing_table.rows_by_id[id_]["national_node"]
+            state.report.add_node_warnings(Node.of(code), [warning])
+
+        for id_ in deletion.referenced_ids:
+            referrers = references.get_referrers(table.type, id_)
+            warning = EricWarning(
+                f"Prevented the deletion of a row that is still referenced: "
+                f"{table.type.value} {id_} (referenced by "
+                f"{', '.join(sorted({ref.row_id for ref in referrers}))})."
+            )
+            self.printer.print_warning(warning)
+
+            code = existing_table.rows_by_id[id_]["national_node"]
+            state.report.add_node_warnings(Node.of(code), [warning])
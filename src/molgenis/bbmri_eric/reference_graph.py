@@ -0,0 +1,92 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import DefaultDict, Dict, List, Tuple
+
+from molgenis.bbmri_eric.model import EricData, TableType
+
+RowKey = Tuple[TableType, str]
+
+
+@dataclass(frozen=True)
+class Reference:
+    """A reference from an attribute of a row to a row in one of the ERIC tables."""
+
+    table_type: TableType
+    row_id: str
+    attribute: str
+    ref_table_type: TableType
+    ref_id: str
+
+
+class ReferenceGraph:
+    """
+    Index of the references between the rows of the six ERIC tables of an EricData
+    object. The references are found with the xref/mref attributes in the tables'
+    metadata. References to tables outside the EricData object (for example ontology
+    tables) are not included.
+    """
+
+    def __init__(self, data: EricData):
+        self._rows_by_type = {
+            table.type: table.rows_by_id for table in data.import_order
+        }
+        self._references: DefaultDict[RowKey, List[Reference]] = defaultdict(list)
+        self._referrers: DefaultDict[RowKey, List[Reference]] = defaultdict(list)
+        self._dangling: List[Reference] = list()
+        self._build(data)
+
+    @staticmethod
+    def of(data: EricData) -> "ReferenceGraph":
+        return ReferenceGraph(data)
+
+    def _build(self, data: EricData):
+        type_by_table_id = {table.full_name: table.type for table in data.import_order}
+        for table in data.import_order:
+            ref_types = self._get_ref_types(table.meta.references, type_by_table_id)
+            for row in table.rows_by_id.values():
+                for attribute, ref_type in ref_types.items():
+                    value = row.get(attribute)
+                    if value is None:
+                        continue
+                    ref_ids = value if isinstance(value, list) else [value]
+                    for ref_id in ref_ids:
+                        self._add(
+                            Reference(
+                                table.type, row["id"], attribute, ref_type, ref_id
+                            )
+                        )
+
+    @staticmethod
+    def _get_ref_types(
+        references: Dict[str, str], type_by_table_id: Dict[str, TableType]
+    ) -> Dict[str, TableType]:
+        return {
+            attribute: type_by_table_id[table_id]
+            for attribute, table_id in references.items()
+            if table_id in type_by_table_id
+        }
+
+    def _add(self, reference: Reference):
+        self._references[(reference.table_type, reference.row_id)].append(reference)
+        self._referrers[(reference.ref_table_type, reference.ref_id)].append(reference)
+        if reference.ref_id not in self._rows_by_type[reference.ref_table_type]:
+            self._dangling.append(reference)
+
+    def get_references(self, table_type: TableType, row_id: str) -> List[Reference]:
+        """Returns the references of a row to other rows."""
+        return self._references.get((table_type, row_id), [])
+
+    def get_referrers(self, table_type: TableType, row_id: str) -> List[Reference]:
+        """Returns the references of other rows to a row."""
+        return self._referrers.get((table_type, row_id), [])
+
+    def is_referenced(self, table_type: TableType, row_id: str) -> bool:
+        return (table_type, row_id) in self._referrers
+
+    def get_referenced_row(self, reference: Reference) -> dict | None:
+        """Returns the row a reference points to, or None if it's dangling."""
+        return self._rows_by_type[reference.ref_table_type].get(reference.ref_id)
+
+    def get_dangling_references(self) -> List[Reference]:
+        """Returns the references to rows that don't exist."""
+        return list(self._dangling)
@@ -0,0 +1,220 @@
+"""
+Binary snapshots of EricData objects. A snapshot stores the metadata and rows of the
+six tables in a versioned, columnar format that doesn't depend on the layout of the
+model classes. Snapshots are memory-mapped when loaded, so loading a single table or
+the rows of a single node only reads the parts of the file that are needed.
+
+Layout of a snapshot file:
+1. The magic bytes b"ERICSNAP"
+2. The format version (unsigned 32-bit integer, little-endian)
+3. The length of the header (unsigned 64-bit integer, little-endian)
+4. The header: UTF-8 encoded JSON with the source, the node (if any) and for every
+   table the row count and the location of its metadata and columns
+5. The data section: UTF-8 encoded JSON blobs with table metadata and columns
+"""
+
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from molgenis.bbmri_eric.model import (
+    EricData,
+    ExternalServerNode,
+    MixedData,
+    Node,
+    NodeData,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+
+MAGIC = b"ERICSNAP"
+VERSION = 1
+
+_PREAMBLE = struct.Struct("<8sIQ")
+
+PathLike = Union[str, Path]
+
+
+def save_snapshot(data: EricData, path: PathLike):
+    """
+    Writes an EricData object to a snapshot file. Each column of a table is stored
+    separately: a list with the values of all rows and a list with the indices of the
+    rows that don't have that column.
+
+    :param data: the NodeData or MixedData to save
+    :param path: the path of the snapshot file
+    """
+    blobs: List[bytes] = []
+    offset = 0
+
+    def add_blob(value) -> Tuple[int, int]:
+        nonlocal offset
+        blob = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        blobs.append(blob)
+        location = (offset, len(blob))
+        offset += len(blob)
+        return location
+
+    tables = dict()
+    for table in data.import_order:
+        rows = table.rows
+        columns = dict()
+        for name in _get_column_names(rows):
+            values = [row.get(name) for row in rows]
+            missing = [i for i, row in enumerate(rows) if name not in row]
+            columns[name] = add_blob([values, missing])
+
+        tables[table.type.value] = {
+            "row_count": len(rows),
+            "meta": add_blob(table.meta.meta),
+            "columns": columns,
+        }
+
+    header = json.dumps(
+        {
+            "source": data.source.value,
+            "node": _node_to_dict(data.node) if isinstance(data, NodeData) else None,
+            "tables": tables,
+        }
+    ).encode("utf-8")
+
+    with open(path, "wb") as file:
+        file.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        file.write(header)
+        for blob in blobs:
+            file.write(blob)
+
+
+def load_snapshot(
+    path: PathLike,
+    table_types: Optional[List[TableType]] = None,
+    node: Optional[Node] = None,
+) -> EricData:
+    """
+    Reads an EricData object from a snapshot file.
+
+    :param path: the path of the snapshot file
+    :param table_types: the tables to load the rows of, defaults to all tables. The
+    other tables will be empty.
+    :param node: only load the rows of this node. For a snapshot of mixed data the
+    rows are selected by their national_node and a NodeData object is returned.
+    :raise: ValueError if the file is not a snapshot or has an unsupported version
+    :return: a NodeData or MixedData object
+    """
+    table_types = table_types if table_types else TableType.get_import_order()
+
+    with open(path, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            header, data_start = _read_header(buffer)
+
+            def read_blob(location: List[int]):
+                start = data_start + location[0]
+                return json.loads(buffer[start : start + location[1]])
+
+            snapshot_node = _node_from_dict(header["node"]) if header["node"] else None
+            skip_rows = node is not None and snapshot_node not in (None, node)
+
+            tables = dict()
+            for table_type in TableType.get_import_order():
+                table_header = header["tables"][table_type.value]
+                meta = TableMeta(read_blob(table_header["meta"]))
+                if table_type not in table_types or skip_rows:
+                    tables[table_type.value] = Table.of_empty(table_type, meta)
+                    continue
+
+                columns = table_header["columns"]
+                selection = None
+                if node is not None and not snapshot_node:
+                    selection = _select_node_rows(read_blob, columns, node)
+
+                rows = _read_rows(
+                    read_blob, columns, table_header["row_count"], selection
+                )
+                tables[table_type.value] = Table.of(table_type, meta, rows)
+
+    source = Source(header["source"])
+    data_node = snapshot_node if snapshot_node else node
+    if data_node:
+        return NodeData.from_dict(node=data_node, source=source, tables=tables)
+    else:
+        return MixedData.from_mixed_dict(source=source, tables=tables)
+
+
+def _read_header(buffer: mmap.mmap) -> Tuple[dict, int]:
+    if len(buffer) < _PREAMBLE.size:
+        raise ValueError("file is not an ERIC snapshot")
+
+    magic, version, header_length = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("file is not an ERIC snapshot")
+    if version != VERSION:
+        raise ValueError(f"unsupported snapshot version: {version}")
+
+    header_end = _PREAMBLE.size + header_length
+    return json.loads(buffer[_PREAMBLE.size : header_end]), header_end
+
+
+def _read_rows(
+    read_blob,
+    columns: Dict[str, List[int]],
+    row_count: int,
+    selection: Optional[List[int]] = None,
+) -> List[dict]:
+    """
+    Converts the columns of a table back to rows. If a selection of row indices is
+    given, only those rows are returned.
+    """
+    if selection is None:
+        selection = range(row_count)
+
+    rows = [dict() for _ in selection]
+    for name, location in columns.items():
+        values, missing = read_blob(location)
+        if len(selection) != row_count:
+            values = [values[i] for i in selection]
+        for row, value in zip(rows, values):
+            row[name] = value
+
+        missing = set(missing)
+        if missing:
+            for row, i in zip(rows, selection):
+                if i in missing:
+                    del row[name]
+    return rows
+
+
+def _select_node_rows(read_blob, columns: Dict[str, List[int]], node: Node):
+    if "national_node" not in columns:
+        return []
+    codes, _ = read_blob(columns["national_node"])
+    return [i for i, code in enumerate(codes) if code == node.code]
+
+
+def _get_column_names(rows: List[dict]) -> List[str]:
+    names = dict()
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return list(names)
+
+
+def _node_to_dict(node: Node) -> dict:
+    # The token of an external server node is a secret, so it's not stored
+    node_dict = {
+        "code": node.code,
+        "description": node.description,
+        "date_end": node.date_end,
+    }
+    if isinstance(node, ExternalServerNode):
+        node_dict["url"] = node.url
+    return node_dict
+
+
+def _node_from_dict(node_dict: dict) -> Node:
+    if "url" in node_dict:
+        return ExternalServerNode(**node_dict)
+    else:
+        return Node(**node_dict)
@@ -19,16 +19,27 @@ class Stager:
         self.warnings: List[EricWarning] = list()
 
     @requests_error_handler
-    def stage(self, node: ExternalServerNode):
+    def stage(self, node: ExternalServerNode) -> NodeData:
         """
         Stages all data from the provided external node in the BBMRI-ERIC directory.
+        The warnings are stored in self.warnings.
+
+        :return: the staged data, as it is in the staging area
         """
         self.warnings = []
         source_data = self._get_source_data(node)
         self._clear_staging_area(node)
-        self._import_node(source_data)
+        return self._import_node(source_data)
 
-        return self.warnings
+    @requests_error_handler
+    def fetch(self, node: ExternalServerNode) -> NodeData:
+        """
+        Gets all data from the provided external node, converted to the form it would
+        have in the staging area, without staging it. The warnings are stored in
+        self.warnings.
+        """
+        self.warnings = []
+        return self._get_source_data(node).convert_to_staging()
 
     def _get_source_data(self, node: ExternalServerNode) -> NodeData:
         """
@@ -38,7 +49,9 @@ class Stager:
         - and if all tables are available
         """
         self.printer.print(f"📦 Retrieving node's data from {node.url}")
-        source_session = ExternalServerSession(node=node)
+        source_session = ExternalServerSession(
+            node=node, batch_size=self.session.batch_size
+        )
         self._check_permissions(source_session)
         self._check_tables(source_session)
         return source_session.get_node_data()
@@ -76,12 +89,15 @@ class Stager:
         for table_type in reversed(TableType.get_import_order()):
             self.session.delete(node.get_staging_id(table_type))
 
-    def _import_node(self, source_data: NodeData):
+    def _import_node(self, source_data: NodeData) -> NodeData:
         """
-        Imports an external node's data to its staging area.
+        Imports an external node's data to its staging area. Returns the imported
+        data.
         """
         self.printer.print(
             f"💾 Saving data to the staging area of {source_data.node.code}"
         )
 
-        self.session.upload_data(source_data.convert_to_staging())
+        staged_data = source_data.convert_to_staging()
+        self.session.upload_data(staged_data)
+        return staged_data
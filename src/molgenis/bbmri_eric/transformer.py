@@ -1,8 +1,16 @@
 from datetime import date
+from typing import Callable, Dict, List
 
-from molgenis.bbmri_eric.categories import CategoryMapper
+from molgenis.bbmri_eric.categories import CategoryMapper, CategoryRules
 from molgenis.bbmri_eric.errors import EricWarning
-from molgenis.bbmri_eric.model import Node, NodeData, OntologyTable, QualityInfo, Table
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    Table,
+    TableType,
+)
 from molgenis.bbmri_eric.printer import Printer
 
 
@@ -21,13 +29,22 @@ class Transformer:
         existing_biobanks: Table,
         eu_node_data: NodeData,
         diseases: OntologyTable,
+        fused: bool = False,
+        category_rules: CategoryRules | None = None,
     ):
+        """
+        :param fused: if True, all steps are done for each row in a single pass over
+        the tables instead of one pass per step. The result is the same.
+        :param category_rules: the rules to derive the collections' categories with,
+        defaults to CategoryRules.default()
+        """
         self.node_data = node_data
         self.quality = quality
         self.printer = printer
         self.existing_biobanks = existing_biobanks.rows_by_id
         self.eu_node_data = eu_node_data
-        self.category_mapper = CategoryMapper(diseases)
+        self.category_mapper = CategoryMapper(diseases, category_rules)
+        self.fused = fused
 
         self.warnings = []
 
@@ -46,6 +63,10 @@ class Transformer:
         10. Sets the collections' categories
 
         """
+        if self.fused:
+            self._transform_fused()
+            return self.warnings
+
         self._set_national_node_code()
         self._set_withdrawn()
         self._replace_eu_rows()
@@ -66,17 +87,19 @@ class Transformer:
 
         self.printer.print("Setting 'commercial_use' booleans")
         for collection in self.node_data.collections.rows:
-
-            def is_true(row: dict, attr: str):
-                # if the value is not entered, it is also considered true
-                return attr not in row or row[attr] is True
-
             biobank_id = collection["biobank"]
             biobank = self.node_data.biobanks.rows_by_id[biobank_id]
+            self._set_commercial_use(collection, biobank)
 
-            collection["commercial_use"] = is_true(
-                biobank, "collaboration_commercial"
-            ) and is_true(collection, "collaboration_commercial")
+    @staticmethod
+    def _set_commercial_use(collection: dict, biobank: dict):
+        def is_true(row: dict, attr: str):
+            # if the value is not entered, it is also considered true
+            return attr not in row or row[attr] is True
+
+        collection["commercial_use"] = is_true(
+            biobank, "collaboration_commercial"
+        ) and is_true(collection, "collaboration_commercial")
 
     def _set_national_node_code(self):
         """
@@ -97,11 +120,15 @@ class Transformer:
         self._set_quality_for_table(self.node_data.collections)
 
     def _set_quality_for_table(self, table: Table):
+        qualities = self.quality.get_qualities(table.type)
         for row in table.rows:
-            qualities = self.quality.get_qualities(table.type)
-            quality_ids = qualities.get(row["id"], [])
-            if quality_ids:
-                row["quality"] = quality_ids
+            self._set_quality(row, qualities)
+
+    @staticmethod
+    def _set_quality(row: dict, qualities: Dict[str, List[str]]):
+        quality_ids = qualities.get(row["id"], [])
+        if quality_ids:
+            row["quality"] = quality_ids
 
     def _set_biobank_pids(self):
         """
@@ -109,11 +136,14 @@ class Transformer:
         """
         self.printer.print("Adding existing PIDs to biobanks")
         for biobank in self.node_data.biobanks.rows:
-            biobank_id = biobank["id"]
-            if biobank_id in self.existing_biobanks:
-                existing_biobank = self.existing_biobanks[biobank_id]
-                if "pid" in existing_biobank:
-                    biobank["pid"] = existing_biobank["pid"]
+            self._set_biobank_pid(biobank)
+
+    def _set_biobank_pid(self, biobank: dict):
+        biobank_id = biobank["id"]
+        if biobank_id in self.existing_biobanks:
+            existing_biobank = self.existing_biobanks[biobank_id]
+            if "pid" in existing_biobank:
+                biobank["pid"] = existing_biobank["pid"]
 
     def _replace_eu_rows(self):
         """
@@ -130,20 +160,23 @@ class Transformer:
 
     def _replace_rows(self, node: Node, table: Table, eu_table: Table):
         eu_prefix = node.get_eu_id_prefix(table.type)
-        for network in table.rows:
-            id_ = network["id"]
-            if id_.startswith(eu_prefix):
-                if id_ in eu_table.rows_by_id:
-                    table.rows_by_id[id_] = eu_table.rows_by_id[id_]
-
-                    # overwrite EU code that was added in previous enrichment step
-                    table.rows_by_id[id_]["national_node"] = self.eu_node_data.node.code
-                else:
-                    warning = EricWarning(
-                        f"{id_} is not present in {eu_table.type.base_id}"
-                    )
-                    self.printer.print_warning(warning, indent=1)
-                    self.warnings.append(warning)
+        for row in table.rows:
+            self._replace_row(row, eu_prefix, table, eu_table)
+
+    def _replace_row(self, row: dict, eu_prefix: str, table: Table, eu_table: Table):
+        id_ = row["id"]
+        if id_.startswith(eu_prefix):
+            if id_ in eu_table.rows_by_id:
+                table.rows_by_id[id_] = eu_table.rows_by_id[id_]
+
+                # overwrite EU code that was added in previous enrichment step
+                table.rows_by_id[id_]["national_node"] = self.eu_node_data.node.code
+            else:
+                warning = EricWarning(
+                    f"{id_} is not present in {eu_table.type.base_id}"
+                )
+                self.printer.print_warning(warning, indent=1)
+                self.warnings.append(warning)
 
     def _set_biobank_labels(self):
         """
@@ -153,7 +186,11 @@ class Transformer:
         self.printer.print("Adding biobank labels")
         for collection in self.node_data.collections.rows:
             biobank = self.node_data.biobanks.rows_by_id[collection["biobank"]]
-            collection["biobank_label"] = biobank["name"]
+            self._set_biobank_label(collection, biobank)
+
+    @staticmethod
+    def _set_biobank_label(collection: dict, biobank: dict):
+        collection["biobank_label"] = biobank["name"]
 
     def _set_combined_networks(self):
         """
@@ -163,9 +200,13 @@ class Transformer:
         self.printer.print("Adding combined networks")
         for collection in self.node_data.collections.rows:
             biobank = self.node_data.biobanks.rows_by_id[collection["biobank"]]
-            collection["combined_network"] = list(
-                set(biobank["network"] + collection["network"])
-            )
+            self._set_combined_network(collection, biobank)
+
+    @staticmethod
+    def _set_combined_network(collection: dict, biobank: dict):
+        collection["combined_network"] = list(
+            set(biobank["network"] + collection["network"])
+        )
 
     def _set_combined_qualities(self):
         """
@@ -178,17 +219,30 @@ class Transformer:
         coll_levels = self.quality.get_levels(self.node_data.collections.type)
         for collection in self.node_data.collections.rows:
             biobank = self.node_data.biobanks.rows_by_id[collection["biobank"]]
-            bb_level = bb_levels.get(biobank["id"], [])
-            coll_level = coll_levels.get(collection["id"], [])
-            collection["combined_quality"] = list(set(bb_level + coll_level))
+            self._set_combined_quality(collection, biobank, bb_levels, coll_levels)
+
+    @staticmethod
+    def _set_combined_quality(
+        collection: dict,
+        biobank: dict,
+        bb_levels: Dict[str, List[str]],
+        coll_levels: Dict[str, List[str]],
+    ):
+        bb_level = bb_levels.get(biobank["id"], [])
+        coll_level = coll_levels.get(collection["id"], [])
+        collection["combined_quality"] = list(set(bb_level + coll_level))
 
     def _set_collection_categories(self):
         """
         Sets the 'categories' field of each collection based on the collection values.
         """
         self.printer.print("Setting collection categories")
-        for collection in self.node_data.collections.rows:
-            collection["categories"] = self.category_mapper.map(collection)
+        self._map_categories(self.node_data.collections.rows)
+
+    def _map_categories(self, collections: List[dict]):
+        all_categories = self.category_mapper.map_many(collections)
+        for collection, categories in zip(collections, all_categories):
+            collection["categories"] = categories
 
     def _set_withdrawn(self):
         """
@@ -196,9 +250,72 @@ class Transformer:
         """
         self.printer.print("Marking withdrawn national nodes")
         for table in self.node_data.import_order:
-            if (
-                self.node_data.node.date_end
-                and self.node_data.node.date_end <= date.today().strftime("%Y-%m-%d")
-            ):
+            if self._is_node_withdrawn():
                 for row in table.rows:
                     row["withdrawn"] = True
+
+    def _is_node_withdrawn(self) -> bool:
+        date_end = self.node_data.node.date_end
+        return bool(date_end and date_end <= date.today().strftime("%Y-%m-%d"))
+
+    def _transform_fused(self):
+        """
+        Does the same as the separate steps of the transform method, but visits every
+        row only once. The biobank of a collection is looked up once and shared by
+        the steps that need it. The categories of the collections are mapped in one
+        batch.
+        """
+        self.printer.print("Transforming all rows in a single pass")
+        code = self.node_data.node.code
+        withdrawn = self._is_node_withdrawn()
+
+        for table in self.node_data.import_order:
+            transform_row = self._get_row_transformer(table)
+            for row in table.rows:
+                row["national_node"] = code
+                if withdrawn:
+                    row["withdrawn"] = True
+                if transform_row:
+                    transform_row(row)
+            if table.type == TableType.COLLECTIONS:
+                self._map_categories(table.rows)
+
+    def _get_row_transformer(self, table: Table) -> Callable[[dict], None] | None:
+        """
+        Returns a function that does the table specific steps of the transformation
+        for a single row.
+        """
+        node = self.node_data.node
+        if table.type in (TableType.PERSONS, TableType.NETWORKS):
+            if node.code == "EU":
+                return None
+            eu_table = self.eu_node_data.table_by_type[table.type]
+            eu_prefix = node.get_eu_id_prefix(table.type)
+            return lambda row: self._replace_row(row, eu_prefix, table, eu_table)
+
+        elif table.type == TableType.BIOBANKS:
+            qualities = self.quality.get_qualities(TableType.BIOBANKS)
+
+            def transform_biobank(biobank: dict):
+                self._set_quality(biobank, qualities)
+                self._set_biobank_pid(biobank)
+
+            return transform_biobank
+
+        elif table.type == TableType.COLLECTIONS:
+            biobanks = self.node_data.biobanks.rows_by_id
+            qualities = self.quality.get_qualities(TableType.COLLECTIONS)
+            bb_levels = self.quality.get_levels(TableType.BIOBANKS)
+            coll_levels = self.quality.get_levels(TableType.COLLECTIONS)
+
+            def transform_collection(collection: dict):
+                biobank = biobanks[collection["biobank"]]
+                self._set_commercial_use(collection, biobank)
+                self._set_quality(collection, qualities)
+                self._set_biobank_label(collection, biobank)
+                self._set_combined_network(collection, biobank)
+                self._set_combined_quality(collection, biobank, bb_levels, coll_levels)
+
+            return transform_collection
+
+        return None
@@ -1,5 +1,6 @@
 from collections import OrderedDict
-from typing import List
+from collections.abc import Mapping
+from typing import Iterator, List
 
 
 def to_ordered_dict(rows: List[dict]) -> OrderedDict:
@@ -7,3 +8,47 @@ def to_ordered_dict(rows: List[dict]) -> OrderedDict:
     for row in rows:
         rows_by_id[row["id"]] = row
     return rows_by_id
+
+
+class SegmentedDict(Mapping):
+    """
+    Read-only view over a list of dicts (segments) that behaves like the dict you'd get
+    by updating an empty dict with each segment in turn: keys keep the position of
+    their first occurrence and values come from the last segment that contains them.
+    The segments are not copied, so changes to a segment are visible in the view.
+    """
+
+    def __init__(self, segments: List[Mapping] = None):
+        self.segments: List[Mapping] = segments if segments else []
+
+    def add_segment(self, segment: Mapping):
+        self.segments.append(segment)
+
+    def __getitem__(self, key):
+        for segment in reversed(self.segments):
+            if key in segment:
+                return segment[key]
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return any(key in segment for segment in self.segments)
+
+    def __iter__(self) -> Iterator:
+        if len(self.segments) == 1:
+            yield from self.segments[0]
+            return
+
+        seen = set()
+        for segment in self.segments:
+            for key in segment:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self) -> int:
+        if len(self.segments) == 1:
+            return len(self.segments[0])
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"SegmentedDict({self.segments!r})"
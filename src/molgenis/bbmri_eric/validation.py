@@ -1,11 +1,174 @@
 import re
-from typing import List, Set
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Set, Tuple
 
-from molgenis.bbmri_eric.errors import EricWarning
-from molgenis.bbmri_eric.model import NodeData, Table, TableType
+from molgenis.bbmri_eric.errors import EricError, EricWarning
+from molgenis.bbmri_eric.model import Node, NodeData, TableMeta, TableType
 from molgenis.bbmri_eric.printer import Printer
 
 
+class Violation(NamedTuple):
+    """A compact record of a failed validation rule. Turned into a warning with the
+    message template of the rule."""
+
+    rule: str
+    args: Tuple
+
+
+MESSAGES = {
+    "id_prefix": "{} in entity: {} does not start with {}",
+    "id_chars": "{} in entity: {} contains invalid characters. Only alphanumerics "
+    "and -_: are allowed.",
+    "hyperlink": "{} {} has an invalid {}: {}",
+    "reference": "{} references invalid id: {}",
+    "ages_zero": "Collection {} has invalid ages: age_low = 0 and age_high = 0",
+    "ages_unit": "Collection {} has age_low/age_high without age_unit",
+    "ages_order": "Collection {} has invalid ages: age_low > age_high",
+}
+
+ID_CHARS_REGEX = re.compile("^[A-Za-z0-9-_:]+$")
+
+HYPERLINK_REGEX = re.compile(
+    r"^((https?):\/\/)(www.)?[-a-zA-Z0-9@:%._\\+~#?&//=]{2,256}\."
+    r"[a-z]{2,6}\b([-a-zA-Z0-9@:%._\\+~#?&//=]*)\/?$|^$/"
+)
+
+ALLOWS_EU_PREFIXES = {TableType.PERSONS, TableType.NETWORKS}
+
+REFERENCES = {
+    TableType.NETWORKS: [("contact", False), ("parent_network", True)],
+    TableType.BIOBANKS: [
+        ("contact", False),
+        ("network", True),
+        ("also_known_in", True),
+    ],
+    TableType.COLLECTIONS: [
+        ("contact", False),
+        ("biobank", False),
+        ("parent_collection", False),
+        ("networks", True),
+        ("also_known_in", True),
+    ],
+}
+"""The reference attributes that are checked for references to invalid ids, and
+whether they are mrefs"""
+
+
+@dataclass(frozen=True)
+class TableRules:
+    """
+    The validation rules of a single table, compiled against its metadata and the
+    node it belongs to. The checks work on the rows of (a part of) the table and
+    return violations with the index of the row they belong to, so they can also be
+    used on rows that arrive page by page.
+    """
+
+    table_type: TableType
+    table_name: str
+    prefixes: Tuple[str, ...]
+    prefixes_text: str
+    hyperlinks: Tuple[str, ...]
+    references: Tuple[Tuple[str, bool], ...]
+    check_ages: bool
+
+    @staticmethod
+    def compile(table_type: TableType, meta: TableMeta, node: Node) -> "TableRules":
+        prefixes = (node.get_id_prefix(table_type),)
+        if table_type in ALLOWS_EU_PREFIXES:
+            prefixes += (node.get_eu_id_prefix(table_type),)
+
+        return TableRules(
+            table_type=table_type,
+            table_name=meta.id,
+            prefixes=prefixes,
+            prefixes_text=" or ".join(prefixes),
+            hyperlinks=tuple(meta.hyperlinks),
+            references=tuple(REFERENCES.get(table_type, [])),
+            check_ages=table_type == TableType.COLLECTIONS,
+        )
+
+    def check_ids(
+        self, rows: List[dict], invalid_ids: Set[str], offset: int = 0
+    ) -> List[Tuple[int, Violation]]:
+        """Checks the prefixes and characters of the ids and adds the invalid ids to
+        invalid_ids."""
+        violations = []
+        prefixes = self.prefixes
+        search = ID_CHARS_REGEX.search
+        for i, id_ in enumerate([row["id"] for row in rows], offset):
+            if not id_.startswith(prefixes):
+                args = (id_, self.table_name, self.prefixes_text)
+                violations.append((i, Violation("id_prefix", args)))
+                invalid_ids.add(id_)
+            if not search(id_):
+                violations.append((i, Violation("id_chars", (id_, self.table_name))))
+                invalid_ids.add(id_)
+        return violations
+
+    def check_hyperlinks(
+        self, rows: List[dict], offset: int = 0
+    ) -> List[Tuple[int, Violation]]:
+        """Checks the hyperlink columns, one column at a time. The violations are
+        sorted by row."""
+        violations = []
+        label = self.table_type.value.capitalize()[:-1]
+        match = HYPERLINK_REGEX.match
+        for column in self.hyperlinks:
+            for i, row in enumerate(rows, offset):
+                if column in row and not match(row[column]):
+                    args = (label, row["id"], column, row[column])
+                    violations.append((i, Violation("hyperlink", args)))
+        violations.sort(key=lambda violation: violation[0])
+        return violations
+
+    def check_references(
+        self, rows: List[dict], invalid_ids: Set[str], offset: int = 0
+    ) -> List[Tuple[int, Violation]]:
+        """Checks the reference columns (and the ages of collections), one column at a
+        time. The violations are sorted by row."""
+        violations = []
+        if invalid_ids:
+            for column, is_mref in self.references:
+                for i, row in enumerate(rows, offset):
+                    if column not in row:
+                        continue
+                    ref_ids = row[column] if is_mref else (row[column],)
+                    for ref_id in ref_ids:
+                        if ref_id in invalid_ids:
+                            violations.append(
+                                (i, Violation("reference", (row["id"], ref_id)))
+                            )
+
+        if self.check_ages:
+            for i, row in enumerate(rows, offset):
+                if "age_low" in row or "age_high" in row:
+                    violations.extend((i, v) for v in check_ages(row))
+
+        violations.sort(key=lambda violation: violation[0])
+        return violations
+
+
+def check_ages(collection: dict) -> List[Violation]:
+    low = collection.get("age_low", None)
+    high = collection.get("age_high", None)
+    unit = collection.get("age_unit", None)
+
+    violations = []
+    if low == 0 and high == 0:
+        violations.append(Violation("ages_zero", (collection["id"],)))
+
+    if (low is not None or high is not None) and not unit:
+        violations.append(Violation("ages_unit", (collection["id"],)))
+
+    if low is not None and high is not None and (low > high):
+        violations.append(Violation("ages_order", (collection["id"],)))
+    return violations
+
+
+def to_warning(violation: Violation) -> EricWarning:
+    return EricWarning(MESSAGES[violation.rule].format(*violation.args))
+
+
 class Validator:
     """
     This class is responsible for validating the data in a single node. Validation
@@ -14,132 +177,92 @@ class Validator:
     2. Checking if there are rows that reference rows with invalid identifiers
     3. Checking the validity of ages
     4. Checking the validity of hyperlinks
-    """
 
-    ALLOWS_EU_PREFIXES = {TableType.PERSONS, TableType.NETWORKS}
-    HYPERLINK_REGEX = (
-        r"^((https?):\/\/)(www.)?[-a-zA-Z0-9@:%._\\+~#?&//=]{2,256}\."
-        r"[a-z]{2,6}\b([-a-zA-Z0-9@:%._\\+~#?&//=]*)\/?$|^$/"
-    )
+    The rules are compiled for each table (see TableRules) and run column by column.
+    Violations are collected as compact records and only turned into warnings at the
+    end.
+    """
 
     def __init__(self, node_data: NodeData, printer: Printer):
         self.printer = printer
         self.node_data = node_data
         self.invalid_ids: Set[str] = set()
+        self.violations: List[Violation] = list()
         self.warnings: List[EricWarning] = list()
 
     def validate(self) -> List[EricWarning]:
+        rules = self._compile()
+
         for table in self.node_data.import_order:
-            self._validate_ids(table)
-            self._validate_hyperlinks(table)
+            rows = table.rows
+            self._add(rules[table.type].check_ids(rows, self.invalid_ids))
+            self._add(rules[table.type].check_hyperlinks(rows))
 
-        self._validate_networks()
-        self._validate_biobanks()
-        self._validate_collections()
+        for table in self.node_data.import_order:
+            table_rules = rules[table.type]
+            if table_rules.references or table_rules.check_ages:
+                self._add(table_rules.check_references(table.rows, self.invalid_ids))
 
+        self._create_warnings()
         return self.warnings
 
-    def _validate_ids(self, table: Table):
-        for row in table.rows:
-            id_ = row["id"]
-            self._validate_id_prefix(id_, table)
-            self._validate_id_chars(id_, table)
-
-    def _validate_hyperlinks(self, table: Table):
-        for row in table.rows:
-            for column in list(set(table.meta.hyperlinks).intersection(row.keys())):
-                if not re.match(self.HYPERLINK_REGEX, row[column]):
-                    self._warn(
-                        f"{table.type.value.capitalize()[:-1]} {row['id']} "
-                        f"has an invalid {column}: {row[column]}"
-                    )
-
-    def _validate_networks(self):
-        for network in self.node_data.networks.rows:
-            self._validate_xref(network, "contact")
-            self._validate_mref(network, "parent_network")
-
-    def _validate_biobanks(self):
-        for biobank in self.node_data.biobanks.rows:
-            self._validate_xref(biobank, "contact")
-            self._validate_mref(biobank, "network")
-            self._validate_mref(biobank, "also_known_in")
-
-    def _validate_collections(self):
-        for collection in self.node_data.collections.rows:
-            self._validate_xref(collection, "contact")
-            self._validate_xref(collection, "biobank")
-            self._validate_xref(collection, "parent_collection")
-            self._validate_mref(collection, "networks")
-            self._validate_mref(collection, "also_known_in")
-            self._validate_ages(
-                collection,
-            )
+    def _compile(self) -> Dict[TableType, TableRules]:
+        return {
+            table.type: TableRules.compile(table.type, table.meta, self.node_data.node)
+            for table in self.node_data.import_order
+        }
 
-    def _validate_ages(self, collection: dict):
-        low = collection.get("age_low", None)
-        high = collection.get("age_high", None)
-        unit = collection.get("age_unit", None)
+    def _add(self, violations: List[Tuple[int, Violation]]):
+        self.violations.extend(violation for _, violation in violations)
 
-        if low == 0 and high == 0:
-            self._warn(
-                f"Collection {collection['id']} has invalid ages: age_low = 0 and "
-                f"age_high = 0"
-            )
+    def _create_warnings(self):
+        for violation in self.violations:
+            warning = to_warning(violation)
+            self.printer.print_warning(warning)
+            self.warnings.append(warning)
+        self.violations = list()
 
-        if (low is not None or high is not None) and not unit:
-            self._warn(
-                f"Collection {collection['id']} has age_low/age_high without age_unit"
-            )
 
-        if low is not None and high is not None and (low > high):
-            self._warn(
-                f"Collection {collection['id']} has invalid ages: age_low > age_high"
-            )
+class StreamingValidator:
+    """
+    Validates the ids and hyperlinks of a node's staging data page by page while it's
+    being retrieved (see EricSession.get_staging_node_data). Aborts the retrieval when
+    the number of invalid ids and hyperlinks exceeds a threshold, so a node with
+    systematically broken data fails without transferring all of its data.
 
-    def _validate_xref(self, row: dict, ref_attr: str):
-        if ref_attr in row:
-            self._validate_ref(row, row[ref_attr])
+    References and ages are not checked because they need the complete data. The
+    warnings of a node that isn't aborted come from the Validator.
+    """
 
-    def _validate_mref(self, row: dict, mref_attr: str):
-        if mref_attr in row:
-            for ref_id in row[mref_attr]:
-                self._validate_ref(row, ref_id)
+    def __init__(self, node: Node, max_errors: int):
+        """
+        :param node: the node that is being retrieved
+        :param max_errors: the number of errors after which the retrieval is aborted
+        """
+        self.node = node
+        self.max_errors = max_errors
+        self.error_count = 0
+        self.invalid_ids: Set[str] = set()
+        self.rules: Dict[TableType, TableRules] = dict()
 
-    def _validate_ref(self, row: dict, ref_id: str):
-        if ref_id in self.invalid_ids:
-            warning = EricWarning(f"{row['id']} references invalid id: {ref_id}")
-            self.printer.print_warning(warning)
-            self.warnings.append(warning)
+    def validate_page(
+        self, table_type: TableType, meta: TableMeta, rows: List[dict], offset: int
+    ):
+        """
+        Validates a page of rows.
 
-    def _validate_id_prefix(self, id_: str, table: Table):
-        node = self.node_data.node
-
-        prefix = node.get_id_prefix(table.type)
-        if table.type in self.ALLOWS_EU_PREFIXES:
-            eu_prefix = node.get_eu_id_prefix(table.type)
-            if not id_.startswith((prefix, eu_prefix)):
-                self._warn(
-                    f"{id_} in entity: {table.full_name} does not start with {prefix} "
-                    f"or {eu_prefix}"
-                )
-                self.invalid_ids.add(id_)
-        else:
-            if not id_.startswith(prefix):
-                self._warn(
-                    f"{id_} in entity: {table.full_name} does not start with {prefix}"
-                )
-                self.invalid_ids.add(id_)
-
-    def _validate_id_chars(self, id_: str, table: Table):
-        if not re.search("^[A-Za-z0-9-_:]+$", id_):
-            self._warn(
-                f"{id_} in entity: {table.full_name} contains"
-                f" invalid characters. Only alphanumerics and -_: are allowed."
-            )
-            self.invalid_ids.add(id_)
+        :raise: EricError if the number of errors exceeds the threshold
+        """
+        rules = self.rules.get(table_type)
+        if not rules:
+            rules = TableRules.compile(table_type, meta, self.node)
+            self.rules[table_type] = rules
 
-    def _warn(self, message: str):
-        warning = EricWarning(message)
-        self.printer.print_warning(warning)
-        self.warnings.append(warning)
+        self.error_count += len(rules.check_ids(rows, self.invalid_ids, offset))
+        self.error_count += len(rules.check_hyperlinks(rows, offset))
+        if self.error_count > self.max_errors:
+            raise EricError(
+                f"Aborted retrieving the staging data of node {self.node.code}: "
+                f"{self.error_count} invalid ids and hyperlinks exceed the maximum "
+                f"of {self.max_errors}"
+            )
@@ -1,11 +1,18 @@
 import json
 from importlib import resources
-from typing import List
+from typing import List, Optional, Tuple
 from unittest.mock import MagicMock
 
 import pytest
 
-from molgenis.bbmri_eric.model import Node, NodeData, Source, Table, TableType
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
 
 
 def get_data(table_type) -> List[dict]:
@@ -17,6 +24,29 @@ def get_data(table_type) -> List[dict]:
     return data
 
 
+def create_table_meta(
+    id_: str, attributes: Optional[List[Tuple[str, str]]] = None
+) -> TableMeta:
+    """
+    Creates the metadata of a table with an "id" attribute and the given attributes.
+
+    :param id_: the id of the table
+    :param attributes: the names and types of the other attributes
+    """
+    attributes = [("id", "string")] + (attributes or [])
+    return TableMeta(
+        meta={
+            "id": id_,
+            "attributes": {
+                "items": [
+                    {"data": {"name": name, "type": type_, "idAttribute": name == "id"}}
+                    for name, type_ in attributes
+                ]
+            },
+        }
+    )
+
+
 @pytest.fixture
 def node_data() -> NodeData:
     """
@@ -102,4 +132,5 @@ def printer() -> MagicMock:
 def pid_service() -> MagicMock:
     service = MagicMock()
     service.base_url = "url/"
+    service.get_cached_record.return_value = None
     return service
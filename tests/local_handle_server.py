@@ -0,0 +1,234 @@
+import fnmatch
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from pyhandle.client.resthandleclient import RESTHandleClient
+
+from molgenis.bbmri_eric.pid_service import PidService
+
+
+class LocalHandleServer:
+    """
+    An in-process stand-in for a handle server. Implements the parts of the REST API
+    and the reverse lookup servlet that pyhandle's RESTHandleClient uses, on top of
+    an in-memory handle store. Used to test and benchmark the PidService without a
+    real handle server.
+
+    Every request can be delayed by a fixed latency, and a fraction of the requests
+    can be answered with an error.
+    """
+
+    def __init__(
+        self,
+        prefix: str = "TEST",
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        :param prefix: the prefix of the handles on this server
+        :param latency: the number of seconds each request takes
+        :param error_rate: the fraction of requests that fail with an HTTP 500
+        :param seed: the seed for choosing which requests fail
+        """
+        self.prefix = prefix
+        self.latency = latency
+        self.error_rate = error_rate
+        self.handles: Dict[str, List[dict]] = dict()
+        self.request_counts: Counter = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.add_handle(f"{prefix}/admin", [{"index": 300, "type": "HS_SECKEY"}])
+
+    def __enter__(self) -> "LocalHandleServer":
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Starts serving on a free port of localhost in a background thread."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _create_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def create_client(self) -> RESTHandleClient:
+        """Creates a RESTHandleClient with read, write and search access."""
+        return RESTHandleClient.instantiate_with_username_and_password(
+            self.url,
+            f"300:{self.prefix}/admin",
+            "password",
+            HTTPS_verify=False,
+            reverselookup_username=f"{self.prefix}",
+            reverselookup_password="password",
+            allowed_search_keys=["URL", "CHECKSUM", "retrieverecords"],
+        )
+
+    def create_pid_service(
+        self, base_url: str = "https://directory.bbmri-eric.eu/", **kwargs
+    ) -> PidService:
+        return PidService(self.create_client(), self.prefix, base_url, **kwargs)
+
+    def add_handle(self, handle: str, values: List[dict]):
+        """Adds a handle to the store. The values have an index, type and data."""
+        with self._lock:
+            self.handles[handle] = [_normalize(value) for value in values]
+
+    def get_values(self, handle: str) -> Dict[str, str]:
+        """Returns the values of a handle by type."""
+        with self._lock:
+            return {
+                value["type"]: value["data"]["value"]
+                for value in self.handles.get(handle, [])
+            }
+
+    def _handle(
+        self, method: str, path: str, query: Dict[str, List[str]], body: Optional[dict]
+    ):
+        """Handles a request and returns the HTTP status and the JSON body."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.request_counts[method] += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                return 500, {"responseCode": 2, "message": "Injected error"}
+            if path.startswith("/hrls/handles"):
+                return self._search(query)
+            if path.startswith("/api/handles/"):
+                handle = path[len("/api/handles/") :]
+                indices = {int(index) for index in query.get("index", [])}
+                if method == "GET":
+                    return self._get(handle)
+                if method == "PUT":
+                    overwrite = query.get("overwrite", ["false"])[0] == "true"
+                    return self._put(handle, body["values"], indices, overwrite)
+                if method == "DELETE":
+                    return self._delete(handle, indices)
+            return 404, {"responseCode": 2, "message": "Not found"}
+
+    def _get(self, handle: str):
+        if handle not in self.handles:
+            return 404, {"responseCode": 100, "handle": handle}
+        return 200, {
+            "responseCode": 1,
+            "handle": handle,
+            "values": self.handles[handle],
+        }
+
+    def _put(self, handle: str, values: List[dict], indices: set, overwrite: bool):
+        values = [_normalize(value) for value in values]
+        if not indices:
+            if handle in self.handles and not overwrite:
+                return 409, {"responseCode": 101, "handle": handle}
+            created = handle not in self.handles
+            self.handles[handle] = values
+            return (201 if created else 200), {"responseCode": 1, "handle": handle}
+
+        if handle not in self.handles:
+            return 404, {"responseCode": 100, "handle": handle}
+        by_index = {value["index"]: value for value in self.handles[handle]}
+        by_index.update({value["index"]: value for value in values})
+        self.handles[handle] = sorted(by_index.values(), key=lambda v: v["index"])
+        return 200, {"responseCode": 1, "handle": handle}
+
+    def _delete(self, handle: str, indices: set):
+        if handle not in self.handles:
+            return 404, {"responseCode": 100, "handle": handle}
+        if not indices:
+            del self.handles[handle]
+            return 200, {"responseCode": 1, "handle": handle}
+
+        values = self.handles[handle]
+        remaining = [value for value in values if value["index"] not in indices]
+        if len(remaining) == len(values):
+            return 400, {"responseCode": 200, "handle": handle}
+        self.handles[handle] = remaining
+        return 200, {"responseCode": 1, "handle": handle}
+
+    def _search(self, query: Dict[str, List[str]]):
+        patterns = {
+            key: values[0] for key, values in query.items() if key != "retrieverecords"
+        }
+        matches = {
+            handle: values
+            for handle, values in self.handles.items()
+            if all(
+                any(
+                    value["type"] == key
+                    and fnmatch.fnmatchcase(str(value["data"]["value"]), pattern)
+                    for value in values
+                )
+                for key, pattern in patterns.items()
+            )
+        }
+        if query.get("retrieverecords", ["false"])[0] == "true":
+            return 200, matches
+        return 200, list(matches)
+
+
+def _normalize(value: dict) -> dict:
+    """Stores the data of a value in the format the handle server returns."""
+    data = value.get("data", "")
+    if not isinstance(data, dict):
+        data = {"format": "string", "value": data}
+    return {
+        "index": int(value["index"]),
+        "type": value["type"],
+        "data": data,
+        "ttl": value.get("ttl", 86400),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _create_handler(server: LocalHandleServer):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_PUT(self):
+            self._respond("PUT")
+
+        def do_DELETE(self):
+            self._respond("DELETE")
+
+        def _respond(self, method: str):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length)) if length else None
+            status, response = server._handle(
+                method, url.path, parse_qs(url.query), body
+            )
+            content = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
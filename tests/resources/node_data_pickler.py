@@ -1,16 +1,16 @@
 """
-Use this script to update the node_data.pkl file that contains test data (the staging
-data of node NO).
+Use this script to create the node_data.snapshot file that contains test data (the
+staging data of node NO). The older node_data.pkl file is a pickled NodeData object
+and can only be loaded with the version of the model classes it was created with.
 """
 
-import pickle
-
 from dotenv import dotenv_values
 
 from molgenis.bbmri_eric.bbmri_client import EricSession
 
 # noinspection PyProtectedMember
 from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.snapshot import save_snapshot
 
 # get credentials from .env.local (in this dir) - if this file doesn't exist: create it
 config = dotenv_values(".env.local")
@@ -18,12 +18,10 @@ target = config["TARGET"]
 username = config["USERNAME"]
 password = config["PASSWORD"]
 
-# get staging data of node NL
+# get staging data of node NO
 session = EricSession(url=target)
 session.login(username, password)
 node_data = session.get_staging_node_data((Node("NO", "Norway")))
 
-# pickle and write the NodeData object to file
-file = open("node_data.pkl", "wb")
-pickle.dump(node_data, file)
-file.close()
+# write the NodeData object to a snapshot file
+save_snapshot(node_data, "node_data.snapshot")
@@ -0,0 +1,88 @@
+from unittest import mock
+from unittest.mock import DEFAULT, patch
+
+import pytest
+
+from molgenis.bbmri_eric.bbmri_client import EricSession
+from molgenis.client import Session
+
+
+def test_delete_list_in_batches():
+    session = EricSession("url", delete_batch_size=2)
+
+    with patch("molgenis.client.Session.delete_list") as delete_list:
+        session.delete_list("table", ["a", "b", "c", "d", "e"])
+
+    assert delete_list.mock_calls == [
+        mock.call("table", ["a", "b"]),
+        mock.call("table", ["c", "d"]),
+        mock.call("table", ["e"]),
+    ]
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        EricSession("url", batch_size=0)
+
+
+def test_get_pages_retrieves_meta_once():
+    session = EricSession("url")
+    meta = {
+        "attributes": {
+            "items": [
+                {"data": {"name": "id", "idAttribute": True}},
+                {
+                    "data": {
+                        "name": "country",
+                        "refEntityType": {
+                            "attributes": {
+                                "items": [
+                                    {"data": {"name": "code", "idAttribute": True}}
+                                ]
+                            }
+                        },
+                    }
+                },
+                {
+                    "data": {
+                        "name": "contacts",
+                        "refEntityType": {
+                            "attributes": {
+                                "items": [{"data": {"name": "id", "idAttribute": True}}]
+                            }
+                        },
+                    }
+                },
+            ]
+        }
+    }
+    pages = [
+        {
+            "items": [
+                {
+                    "_href": "href",
+                    "id": "a",
+                    "country": {"code": "NL"},
+                    "contacts": [{"id": "p1"}, {"id": "p2"}],
+                }
+            ],
+            "nextHref": "url?start=1",
+        },
+        {"items": [{"id": "b", "country": {"code": "BE"}, "contacts": []}]},
+    ]
+
+    with patch.multiple(
+        Session, get_entity_meta_data=DEFAULT, get_meta=DEFAULT, _get_batch=DEFAULT
+    ) as mocks:
+        mocks["get_entity_meta_data"].return_value = {"idAttribute": "id"}
+        mocks["get_meta"].return_value = meta
+        mocks["_get_batch"].side_effect = pages
+
+        result = list(session.get_pages("table"))
+
+    assert result == [
+        [{"id": "a", "country": "NL", "contacts": ["p1", "p2"]}],
+        [{"id": "b", "country": "BE", "contacts": []}],
+    ]
+    mocks["get_meta"].assert_called_once_with("table", expand=True, abstract=True)
+    assert mocks["_get_batch"].call_args_list[1].kwargs["start"] == "1"
@@ -1,9 +1,16 @@
+import gc
+import json
 from typing import List
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 import pytest
 
-from molgenis.bbmri_eric.categories import Category, CategoryMapper
+from molgenis.bbmri_eric.categories import (
+    Category,
+    CategoryMapper,
+    CategoryRules,
+    _term_masks_cache,
+)
 from molgenis.bbmri_eric.model import OntologyTable
 
 
@@ -85,9 +92,7 @@ def disease_ontology() -> OntologyTable:
     ],
 )
 def test_map_paediatric(mapper, collection: dict, expected: List[str]):
-    categories = []
-    mapper._map_paediatric(collection, categories)
-    assert categories == expected
+    assert mapper.map(collection) == expected
 
 
 @pytest.mark.parametrize(
@@ -147,9 +152,7 @@ def test_map_paediatric(mapper, collection: dict, expected: List[str]):
 )
 def test_map_diseases(mapper, disease_ontology, collection: dict, expected: List[str]):
     mapper.diseases = disease_ontology
-    categories = []
-    mapper._map_diseases(collection, categories)
-    assert categories == expected
+    assert mapper.map(collection) == expected
 
 
 @pytest.mark.parametrize(
@@ -163,6 +166,171 @@ def test_map_diseases(mapper, disease_ontology, collection: dict, expected: List
     ],
 )
 def test_map_collection_types(mapper, collection: dict, expected: List[str]):
-    categories = []
-    mapper._map_collection_types(collection, categories)
-    assert categories == expected
+    assert mapper.map(collection) == expected
+
+
+def test_term_masks(mapper, disease_ontology):
+    mapper.diseases = disease_ontology
+
+    masks = mapper.term_masks
+
+    assert len(masks) == len(disease_ontology.rows_by_id)
+    assert masks["urn:miriam:icd:T18.5"] == 0
+    assert masks["urn:miriam:icd:II"] == masks["urn:miriam:icd:C97"] != 0
+    assert masks["urn:miriam:icd:U09.9"] == masks["urn:miriam:icd:U09"]
+    assert masks["urn:miriam:icd:D69.6"] == masks["urn:miriam:icd:D65-D69"]
+    assert masks["ORPHA:93969"] == mapper.matcher.bits["rare_disease"]
+
+
+def test_term_masks_reset(mapper, disease_ontology):
+    mapper.diseases = disease_ontology
+    assert "ORPHA:93969" in mapper.term_masks
+
+    mapper.diseases = OntologyTable.of(
+        disease_ontology.meta, [{"id": "urn:miriam:icd:II"}], "parentId"
+    )
+
+    assert mapper.term_masks == {"urn:miriam:icd:II": mapper.matcher.bits["oncology"]}
+
+
+def test_term_masks_shared(disease_ontology):
+    with patch.object(
+        CategoryMapper,
+        "_build_term_masks",
+        autospec=True,
+        side_effect=CategoryMapper._build_term_masks,
+    ) as build_term_masks:
+        first = CategoryMapper(disease_ontology)
+        second = CategoryMapper(disease_ontology, CategoryRules.default())
+
+        assert first.term_masks is second.term_masks
+        assert build_term_masks.call_count == 1
+
+        rules = CategoryRules.default()
+        rules.ontologies.clear()
+        other_rules = CategoryMapper(disease_ontology, rules)
+
+        assert other_rules.term_masks["ORPHA:93969"] == 0
+        assert build_term_masks.call_count == 2
+
+
+def test_term_masks_released(disease_ontology):
+    diseases = OntologyTable.of(
+        disease_ontology.meta, [{"id": "urn:miriam:icd:II"}], "parentId"
+    )
+    key = id(diseases)
+    mapper = CategoryMapper(diseases)
+    assert mapper.term_masks
+    assert key in _term_masks_cache
+
+    del mapper, diseases
+    gc.collect()
+
+    assert key not in _term_masks_cache
+
+
+def test_map_many(mapper, disease_ontology):
+    mapper.diseases = disease_ontology
+    collections = [
+        dict(),
+        {"age_low": 0, "age_high": 20, "age_unit": "YEAR", "type": ["RD"]},
+        {"diagnosis_available": ["urn:miriam:icd:C97", "urn:miriam:icd:I05"]},
+        {"diagnosis_available": ["urn:miriam:icd:U09.9"], "type": ["CASE_CONTROL"]},
+        {"age_low": 10, "age_high": 1, "age_unit": "YEAR", "type": ["BIRTH_COHORT"]},
+        {"diagnosis_available": ["urn:miriam:icd:C97"]},
+    ]
+
+    results = mapper.map_many(collections)
+
+    assert results == [
+        [],
+        [Category.PAEDIATRICS.value, Category.RARE_DISEASE.value],
+        [
+            Category.CARDIOVASCULAR.value,
+            Category.ONCOLOGY.value,
+            Category.RARE_DISEASE.value,
+        ],
+        [
+            Category.COVID19.value,
+            Category.INFECTIOUS.value,
+            Category.POPULATION.value,
+            Category.RARE_DISEASE.value,
+        ],
+        [Category.PAEDIATRICS.value],
+        [Category.ONCOLOGY.value, Category.RARE_DISEASE.value],
+    ]
+    assert results[2] is not results[5]
+
+
+def test_category_rules_default():
+    rules = CategoryRules.default()
+
+    assert rules.categories == [category.value for category in Category]
+    assert rules.ontologies == {"orphanet": "rare_disease"}
+    assert rules.age_limits == {
+        "paediatrics": {"DAY": 365 * 18, "WEEK": 52 * 18, "MONTH": 12 * 18, "YEAR": 18}
+    }
+
+
+def test_category_rules_from_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(CategoryRules.default().to_dict()))
+
+    assert CategoryRules.from_file(path) == CategoryRules.default()
+
+
+def test_category_rules_from_rows():
+    rules = CategoryRules.from_rows(
+        [
+            {"category": "oncology", "rule": "term_root", "value": "urn:miriam:icd:II"},
+            {"category": "rare_disease", "rule": "ontology", "value": "orphanet"},
+            {"category": "rare_disease", "rule": "collection_type", "value": "RD"},
+            {"category": "neonatal", "rule": "age_limit", "value": "28", "unit": "DAY"},
+        ]
+    )
+
+    assert rules == CategoryRules(
+        term_roots={"oncology": {"urn:miriam:icd:II"}},
+        ontologies={"orphanet": "rare_disease"},
+        collection_types={"RD": {"rare_disease"}},
+        age_limits={"neonatal": {"DAY": 28}},
+    )
+    assert rules.categories == ["oncology", "rare_disease", "neonatal"]
+
+
+def test_category_rules_from_rows_unknown_rule():
+    with pytest.raises(ValueError) as e:
+        CategoryRules.from_rows([{"category": "oncology", "rule": "x", "value": "y"}])
+
+    assert str(e.value) == "Unknown category rule type: x"
+
+
+@pytest.mark.parametrize(
+    "collection,expected",
+    [
+        ({"age_low": 10, "age_high": 20, "age_unit": "DAY"}, ["neonatal", "young"]),
+        ({"age_low": 28, "age_high": 50, "age_unit": "DAY"}, ["young"]),
+        ({"age_high": 100, "age_unit": "DAY"}, ["young"]),
+        ({"age_low": 365, "age_unit": "DAY"}, []),
+        ({"age_low": 0, "age_unit": "WEEK"}, []),
+        ({"type": ["RD", "OTHER"]}, ["rare_disease"]),
+        (
+            {"diagnosis_available": ["urn:miriam:icd:C97"]},
+            ["oncology", "rare_disease", "tumour"],
+        ),
+        ({"diagnosis_available": ["ORPHA:93969"]}, ["rare_disease"]),
+    ],
+)
+def test_map_custom_rules(disease_ontology, collection: dict, expected: List[str]):
+    rules = CategoryRules(
+        term_roots={
+            "oncology": {"urn:miriam:icd:II"},
+            "tumour": {"urn:miriam:icd:C97"},
+        },
+        ontologies={"orphanet": "rare_disease"},
+        collection_types={"RD": {"rare_disease"}},
+        age_limits={"neonatal": {"DAY": 28}, "young": {"DAY": 365}},
+    )
+    mapper = CategoryMapper(disease_ontology, rules)
+
+    assert mapper.map(collection) == expected
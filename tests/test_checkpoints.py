@@ -0,0 +1,118 @@
+import pytest
+
+from molgenis.bbmri_eric.checkpoints import PublishingCheckpoint
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.model import (
+    MixedData,
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    Source,
+    Table,
+    TableType,
+)
+from molgenis.bbmri_eric.publisher import PublishingState
+from tests.conftest import create_table_meta
+
+
+def _tables(rows: dict) -> dict:
+    return {
+        type_.value: Table.of(
+            type_, create_table_meta(type_.base_id), rows.get(type_, [])
+        )
+        for type_ in TableType.get_import_order()
+    }
+
+
+@pytest.fixture
+def nodes():
+    return [Node.of("NL"), Node.of("BE"), Node.of("NO")]
+
+
+@pytest.fixture
+def state(nodes) -> PublishingState:
+    existing_data = MixedData.from_mixed_dict(
+        Source.PUBLISHED,
+        _tables(
+            {
+                TableType.BIOBANKS: [
+                    {"id": "nl1", "national_node": "NL"},
+                    {"id": "be1", "national_node": "BE"},
+                    {"id": "no1", "national_node": "NO"},
+                ]
+            }
+        ),
+    )
+    return PublishingState(
+        existing_data=existing_data,
+        eu_node_data=NodeData.from_dict(Node.of("EU"), Source.STAGING, _tables({})),
+        quality_info=QualityInfo({"nl1": ["q1"]}, {}, {}, {}),
+        nodes=nodes,
+        report=ErrorReport(nodes),
+        diseases=OntologyTable.of(
+            create_table_meta("diseases"),
+            [{"id": "d1"}, {"id": "d2", "parent": "d1"}],
+            "parent",
+        ),
+    )
+
+
+def test_checkpoint(state, nodes, tmp_path):
+    nl, be, no = nodes
+    checkpoint = PublishingCheckpoint.create(tmp_path, state)
+    nl_data = NodeData.from_dict(
+        nl,
+        Source.TRANSFORMED,
+        _tables({TableType.BIOBANKS: [{"id": "nl1", "national_node": "NL"}]}),
+    )
+    state.report.add_node_warnings(nl, [EricWarning("warning")])
+    checkpoint.set_prepared(nl, nl_data, state.report, "fingerprint")
+    checkpoint.set_failed(be, EricError("error"), state.report)
+    checkpoint.set_done("upsert")
+
+    loaded = PublishingCheckpoint.load(tmp_path, checkpoint.run_id)
+    report = ErrorReport(nodes)
+    loaded_state = loaded.load_state(nodes, report, state.category_rules)
+
+    assert loaded.is_prepared(nl)
+    assert loaded.is_prepared(be)
+    assert not loaded.is_prepared(no)
+    assert loaded.is_done("upsert")
+    assert not loaded.is_done("delete:facts")
+    assert loaded.get_fingerprints(nodes) == {nl: "fingerprint"}
+    assert report.node_warnings[nl] == [EricWarning("warning")]
+    assert str(report.node_errors[be]) == "error"
+    assert loaded_state.data_to_publish.biobanks.rows == nl_data.biobanks.rows
+    assert list(loaded_state.existing_data.biobanks.rows_by_id) == ["nl1", "no1"]
+    assert loaded_state.quality_info == state.quality_info
+    assert loaded_state.diseases.is_descendant_of_any("d2", {"d1"})
+
+
+def test_checkpoint_finish(state, tmp_path):
+    checkpoint = PublishingCheckpoint.create(tmp_path, state)
+    checkpoint.finish()
+
+    with pytest.raises(ValueError) as e:
+        PublishingCheckpoint.load(tmp_path, checkpoint.run_id)
+
+    assert str(e.value) == f"Unknown publishing run: {checkpoint.run_id}"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_checkpoint_unknown_run(tmp_path):
+    with pytest.raises(ValueError) as e:
+        PublishingCheckpoint.load(tmp_path, "unknown")
+
+    assert str(e.value) == "Unknown publishing run: unknown"
+
+
+def test_checkpoint_other_nodes(state, nodes, tmp_path):
+    checkpoint = PublishingCheckpoint.create(tmp_path, state)
+
+    with pytest.raises(ValueError) as e:
+        checkpoint.load_state(nodes[:1], ErrorReport(nodes), state.category_rules)
+
+    assert str(e.value) == (
+        f"Publishing run {checkpoint.run_id} was started with nodes NL, BE, NO"
+    )
@@ -0,0 +1,236 @@
+import subprocess
+import sys
+from unittest.mock import ANY, patch
+
+import pytest
+
+from molgenis.bbmri_eric.cli import main
+from molgenis.bbmri_eric.errors import EricError, ErrorReport
+from molgenis.bbmri_eric.model import Node
+from molgenis.bbmri_eric.pid_service import DummyPidService, NoOpPidService
+from molgenis.bbmri_eric.plan import PublishingPlan
+from molgenis.bbmri_eric.printer import Printer, TracingPrinter
+
+CONNECTION = ["--url", "https://directory", "--username", "admin"]
+
+
+@pytest.fixture
+def session_init(monkeypatch):
+    monkeypatch.setenv("PASSWORD", "secret")
+    with patch("molgenis.bbmri_eric.bbmri_client.EricSession") as session_mock:
+        yield session_mock
+
+
+@pytest.fixture
+def eric_init():
+    with patch("molgenis.bbmri_eric.eric.Eric") as eric_mock:
+        eric = eric_mock.return_value
+        eric.stage_external_nodes.return_value = ErrorReport([])
+        eric.publish_nodes.return_value = ErrorReport([])
+        eric.plan_nodes.return_value = PublishingPlan(ErrorReport([]))
+        yield eric_mock
+
+
+def test_stage(session_init, eric_init):
+    exit_code = main(["stage", "NL", "BE", "--batch-size", "500"] + CONNECTION)
+
+    assert exit_code == 0
+    session_init.assert_called_once_with(
+        url="https://directory", batch_size=500, delete_batch_size=1000
+    )
+    session = session_init.return_value
+    session.login.assert_called_once_with("admin", "secret")
+    session.get_external_nodes.assert_called_once_with(["NL", "BE"])
+    eric_init.assert_called_once_with(session, printer=ANY)
+    assert type(eric_init.call_args.kwargs["printer"]) is Printer
+    eric_init.return_value.stage_external_nodes.assert_called_once_with(
+        session.get_external_nodes.return_value
+    )
+
+
+def test_publish(session_init, eric_init, tmp_path):
+    report = ErrorReport([Node.of("NL")])
+    report.add_node_error(Node.of("NL"), EricError("error"))
+    eric_init.return_value.publish_nodes.return_value = report
+
+    exit_code = main(
+        [
+            "publish",
+            "--jobs",
+            "4",
+            "--pipeline-depth",
+            "2",
+            "--max-errors",
+            "10",
+            "--cache-dir",
+            str(tmp_path),
+            "--incremental",
+            "--checkpoints",
+            "--pid-service",
+            "dummy",
+            "--pid-workers",
+            "8",
+            "--pid-requests-per-second",
+            "20",
+            "--defer-pids",
+            "--async-pids",
+            "--delete-batch-size",
+            "100",
+        ]
+        + CONNECTION
+    )
+
+    assert exit_code == 1
+    session_init.assert_called_once_with(
+        url="https://directory", batch_size=10000, delete_batch_size=100
+    )
+    session = session_init.return_value
+    session.get_nodes.assert_called_once_with([])
+    eric_init.assert_called_once_with(
+        session,
+        ANY,
+        jobs=4,
+        cache_dir=str(tmp_path),
+        max_errors=10,
+        pid_workers=8,
+        pid_requests_per_second=20.0,
+        defer_pids=True,
+        async_pids=True,
+        pipeline_depth=2,
+        checkpoints=True,
+        printer=ANY,
+    )
+    assert type(eric_init.call_args.args[1]) is DummyPidService
+    eric_init.return_value.publish_nodes.assert_called_once_with(
+        session.get_nodes.return_value, True, None
+    )
+
+
+def test_plan(session_init, eric_init):
+    exit_code = main(["plan", "NL", "--pid-service", "noop"] + CONNECTION)
+
+    assert exit_code == 0
+    assert type(eric_init.call_args.args[1]) is NoOpPidService
+    eric_init.return_value.plan_nodes.assert_called_once_with(
+        session_init.return_value.get_nodes.return_value
+    )
+
+
+def test_unknown_node(session_init, eric_init, capsys):
+    session_init.return_value.get_nodes.side_effect = KeyError("Unknown code: XX")
+
+    with pytest.raises(SystemExit) as e:
+        main(["publish", "XX", "--pid-service", "noop"] + CONNECTION)
+
+    assert e.value.code == 2
+    assert "Unknown code: XX" in capsys.readouterr().err
+
+
+def test_error_while_publishing(session_init, eric_init):
+    eric_init.return_value.publish_nodes.side_effect = ValueError("corrupt file")
+
+    with pytest.raises(ValueError):
+        main(["publish", "--pid-service", "noop"] + CONNECTION)
+
+
+def test_unknown_run(session_init, eric_init, tmp_path, capsys):
+    eric_init.return_value.runs_dir = tmp_path / "runs"
+    args = ["--cache-dir", str(tmp_path), "--resume", "unknown"]
+
+    with pytest.raises(SystemExit) as e:
+        main(["publish", "--pid-service", "noop"] + args + CONNECTION)
+
+    assert e.value.code == 2
+    assert "Unknown publishing run: unknown" in capsys.readouterr().err
+    eric_init.return_value.publish_nodes.assert_not_called()
+
+
+def test_incremental_without_cache_dir(session_init, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["publish", "--incremental", "--pid-service", "noop"] + CONNECTION)
+
+    assert e.value.code == 2
+    assert "require --cache-dir" in capsys.readouterr().err
+    session_init.assert_not_called()
+
+
+def test_missing_pid_credentials(session_init, eric_init, tmp_path, capsys):
+    credentials = str(tmp_path / "missing.json")
+
+    with pytest.raises(SystemExit):
+        main(["plan", "--pid-credentials", credentials] + CONNECTION)
+
+    assert f"PID credentials file not found: {credentials}" in capsys.readouterr().err
+    eric_init.assert_not_called()
+
+
+def test_missing_url(session_init, monkeypatch, capsys):
+    monkeypatch.delenv("TARGET", raising=False)
+
+    with pytest.raises(SystemExit):
+        main(["stage", "--username", "admin"])
+
+    assert "No directory URL" in capsys.readouterr().err
+    session_init.assert_not_called()
+
+
+def test_invalid_batch_size(capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["stage", "--batch-size", "0"] + CONNECTION)
+
+    assert e.value.code == 2
+    assert "must be at least 1: 0" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "option,value,message",
+    [
+        ("--max-errors", "-1", "must be at least 0: -1"),
+        ("--pipeline-depth", "-1", "must be at least 0: -1"),
+        ("--pid-requests-per-second", "0", "must be greater than 0: 0"),
+        ("--pid-requests-per-second", "-2.5", "must be greater than 0: -2.5"),
+    ],
+)
+def test_invalid_publishing_option(option, value, message, capsys):
+    with pytest.raises(SystemExit) as e:
+        main(["publish", option, value] + CONNECTION)
+
+    assert e.value.code == 2
+    assert message in capsys.readouterr().err
+
+
+def test_username_from_environment(session_init, eric_init, monkeypatch):
+    monkeypatch.setenv("DIRECTORY_USERNAME", "directory_admin")
+    monkeypatch.setenv("USERNAME", "os_user")
+
+    exit_code = main(["stage", "--url", "https://directory"])
+
+    assert exit_code == 0
+    session_init.return_value.login.assert_called_once_with("directory_admin", "secret")
+
+
+def test_profile_and_trace(session_init, eric_init, tmp_path):
+    profile = tmp_path / "run.prof"
+    trace = tmp_path / "run.trace"
+
+    exit_code = main(
+        ["stage", "--profile", str(profile), "--trace", str(trace)] + CONNECTION
+    )
+
+    assert exit_code == 0
+    assert profile.stat().st_size > 0
+    assert type(eric_init.call_args.kwargs["printer"]) is TracingPrinter
+    assert "Wrote the profile to" in trace.read_text(encoding="utf-8")
+
+
+def test_import_is_light():
+    code = (
+        "import sys, molgenis.bbmri_eric.cli; "
+        "print(sorted({'pyhandle', 'requests'} & set(sys.modules)))"
+    )
+
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == "[]"
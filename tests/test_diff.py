@@ -0,0 +1,95 @@
+from molgenis.bbmri_eric.diff import TableDiff, diff_data, normalize_row
+from molgenis.bbmri_eric.model import MixedData, Source, Table, TableType
+from tests.conftest import create_table_meta
+
+ATTRIBUTES = [
+    ("name", "string"),
+    ("network", "mref"),
+    ("withdrawn", "bool"),
+    ("size", "int"),
+    ("collections", "onetomany"),
+]
+
+
+def test_normalize_row():
+    row = {
+        "id": "b1",
+        "name": "",
+        "network": ["n2", "n1"],
+        "withdrawn": False,
+        "size": 3,
+        "other": "x",
+    }
+
+    assert normalize_row(row, ["id", "name", "network", "withdrawn", "size"]) == {
+        "id": "b1",
+        "network": ("n1", "n2"),
+        "withdrawn": "false",
+        "size": "3",
+    }
+
+
+def test_table_diff():
+    table = Table.of(
+        TableType.BIOBANKS,
+        create_table_meta(TableType.BIOBANKS.base_id, ATTRIBUTES),
+        [
+            {"id": "b1", "name": "same", "network": ["n1", "n2"], "withdrawn": False},
+            {"id": "b2", "name": "new name"},
+            {"id": "b3", "name": "new"},
+        ],
+    )
+    published_rows = {
+        "b1": {
+            "id": "b1",
+            "name": "same",
+            "network": ["n2", "n1"],
+            "withdrawn": False,
+            "collections": ["c1"],
+        },
+        "b2": {"id": "b2", "name": "old name"},
+    }
+
+    diff = TableDiff.of(table, published_rows)
+
+    assert diff.inserted == [table.rows_by_id["b3"]]
+    assert diff.changed == [table.rows_by_id["b2"]]
+    assert diff.unchanged == 1
+    assert diff.upserted == [table.rows_by_id["b3"], table.rows_by_id["b2"]]
+
+
+def test_table_diff_removed_value():
+    table = Table.of(
+        TableType.BIOBANKS,
+        create_table_meta(TableType.BIOBANKS.base_id, ATTRIBUTES),
+        [{"id": "b1", "size": None}],
+    )
+
+    diff = TableDiff.of(table, {"b1": {"id": "b1", "size": 10}})
+
+    assert diff.changed == [{"id": "b1", "size": None}]
+
+
+def test_diff_data():
+    def data(rows):
+        return MixedData.from_mixed_dict(
+            Source.PUBLISHED,
+            {
+                type_.value: Table.of(
+                    type_,
+                    create_table_meta(type_.base_id, ATTRIBUTES),
+                    rows.get(type_, []),
+                )
+                for type_ in TableType.get_import_order()
+            },
+        )
+
+    diffs = diff_data(
+        data({TableType.PERSONS: [{"id": "p1", "name": "a"}]}),
+        data({TableType.PERSONS: [{"id": "p1", "name": "b"}]}),
+    )
+
+    assert len(diffs) == 6
+    assert diffs[0].table_type == TableType.PERSONS
+    assert len(diffs[0].changed) == 1
+    assert all(not diff.upserted for diff in diffs[1:])
@@ -4,8 +4,11 @@ from unittest.mock import MagicMock, call, patch
 import pytest
 
 from molgenis.bbmri_eric.eric import Eric
-from molgenis.bbmri_eric.errors import EricError, ErrorReport
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.fingerprints import FingerprintStore
 from molgenis.bbmri_eric.model import ExternalServerNode, Node
+from molgenis.bbmri_eric.pid_manager import PidManager
+from molgenis.bbmri_eric.pid_service import HandleMutation
 from molgenis.bbmri_eric.publisher import PublishingState
 
 
@@ -83,22 +86,88 @@ def test_publish_nodes(eric, report_init):
 
     error = EricError("error")
     eric.publisher.publish.side_effect = error
-    eric.stager.stage.return_value = []
+    eric.stager.warnings = []
+    staged_data = MagicMock()
+    eric.stager.stage.return_value = staged_data
+    no_data = MagicMock()
+    nl_data = MagicMock()
+    eric.preparator.retrieve.side_effect = [no_data, nl_data]
 
     report = eric.publish_nodes([no, nl])
 
     assert eric.printer.print_node_title.mock_calls == [call(no), call(nl)]
     eric.stager.stage.assert_has_calls([call(nl)])
+    assert eric.preparator.retrieve.mock_calls == [
+        call(no, staged_data=None),
+        call(nl, staged_data=staged_data),
+    ]
     eric.preparator.prepare.assert_has_calls(
-        [call(no, state), call(nl, state)], any_order=True
+        [call(no, state, no_data), call(nl, state, nl_data)]
     )
-    eric.publisher.publish.assert_called_with(state)
+    eric.publisher.publish.assert_called_with(state, None)
     assert len(report.node_errors) == 0
     assert report.error == error
     assert len(report.node_warnings[nl]) == 0
     eric.printer.print_summary.assert_called_once_with(report)
 
 
+@patch("molgenis.bbmri_eric.eric.PidManagerFactory")
+@patch("molgenis.bbmri_eric.eric.PublicationPreparer")
+def test_plan_nodes(preparer_init, pid_manager_factory, eric, report_init, pid_service):
+    no = Node("NO", "succeeds", None)
+    nl = ExternalServerNode("NL", "is fetched", None, "url")
+    be = Node("BE", "fails during preparation", None)
+    state = _setup_state([no, nl, be], eric, report_init)
+    preparer = preparer_init.return_value
+    error = EricError("error")
+    no_data = MagicMock()
+    nl_data = MagicMock()
+    preparer.retrieve.side_effect = [no_data, nl_data, MagicMock()]
+    preparer.prepare.side_effect = [no_data, nl_data, error]
+    warning = EricWarning("warning")
+    eric.stager.warnings = [warning]
+    fetched_data = eric.stager.fetch.return_value
+    mutation = HandleMutation("pid", url="url")
+    pid_manager = MagicMock(spec=PidManager)
+    pid_manager.outbox = MagicMock()
+    pid_manager.outbox.take.return_value = [mutation]
+    pid_manager_factory.create.return_value = pid_manager
+    table_plans = [MagicMock()]
+    eric.publisher.plan.return_value = table_plans
+
+    plan = eric.plan_nodes([no, nl, be])
+
+    pid_manager_factory.create.assert_called_once_with(
+        pid_service, eric.printer, deferred=True
+    )
+    pid_manager.close.assert_called_once()
+    eric.stager.fetch.assert_called_once_with(nl)
+    eric.stager.stage.assert_not_called()
+    assert preparer.retrieve.mock_calls == [
+        call(no, staged_data=None),
+        call(nl, staged_data=fetched_data),
+        call(be, staged_data=None),
+    ]
+    state.existing_data.remove_node_rows.assert_called_once_with(be)
+    eric.publisher.plan.assert_called_once_with(state)
+    eric.publisher.publish.assert_not_called()
+    eric.pid_manager.flush.assert_not_called()
+    assert plan.tables == table_plans
+    assert plan.pid_changes == [mutation]
+    assert plan.delete_batch_size == eric.session.delete_batch_size
+    assert plan.report.node_errors == {be: error}
+    assert plan.report.node_warnings[nl] == [warning]
+    eric.printer.print_plan.assert_called_once_with(plan)
+    eric.printer.print_summary.assert_called_once_with(plan.report)
+
+
+def test_plan_nodes_without_pid_service(session):
+    with pytest.raises(ValueError) as e:
+        Eric(session).plan_nodes([Node.of("NL")])
+
+    assert str(e.value) == "A PID service is required to plan publishing"
+
+
 # noinspection PyProtectedMember
 def _setup_state(nodes: List[Node], eric: Eric, report_init):
     report = ErrorReport(nodes)
@@ -115,3 +184,218 @@ def _setup_state(nodes: List[Node], eric: Eric, report_init):
     eric._init_state = MagicMock()
     eric._init_state.return_value = state
     return state
+
+
+@patch("molgenis.bbmri_eric.eric.Stager")
+def test_publish_nodes_in_parallel(stager_init, eric, report_init):
+    no = Node("NO", "succeeds", None)
+    nl = ExternalServerNode("NL", "fails during staging", None, "url")
+    be = Node("BE", "fails during preparation", None)
+    state = _setup_state([no, nl, be], eric, report_init)
+    eric.jobs = 2
+
+    staging_error = EricError("staging error")
+    preparation_error = EricError("preparation error")
+    stager_init.return_value.stage.side_effect = staging_error
+    no_data = MagicMock()
+    be_data = MagicMock()
+    eric.preparator.retrieve.side_effect = [no_data, be_data]
+    eric.preparator.prepare_in_parallel.return_value = iter(
+        [(no, no_data, None), (be, None, preparation_error)]
+    )
+
+    report = eric.publish_nodes([no, nl, be])
+
+    assert [c.args[::2] for c in eric.preparator.retrieve.call_args_list] == [
+        (no, None),
+        (be, None),
+    ]
+    eric.preparator.prepare_in_parallel.assert_called_once_with(
+        [no_data, be_data], state, 2
+    )
+    assert not eric.preparator.prepare.called
+    assert eric.printer.print_node_title.mock_calls == [call(no), call(nl), call(be)]
+    assert [
+        c for c in eric.printer.method_calls if c[0] in ("print_node_title", "print")
+    ][1:4] == [
+        call.print_node_title(nl),
+        call.print("📥 Staging data of node NL"),
+        call.print("    ❌ staging error"),
+    ]
+    state.data_to_publish.merge.assert_called_once_with(no_data)
+    assert report.node_errors == {nl: staging_error, be: preparation_error}
+    eric.publisher.publish.assert_called_with(state, None)
+
+
+def test_publish_nodes_incremental_requires_cache_dir(eric):
+    with pytest.raises(ValueError) as e:
+        eric.publish_nodes([Node("NO", "Norway", None)], incremental=True)
+
+    assert str(e.value) == "A cache directory is required to publish incrementally"
+
+
+@patch("molgenis.bbmri_eric.eric.Fingerprinter")
+def test_publish_nodes_incremental(fingerprinter_init, eric, report_init, tmp_path):
+    no = Node("NO", "unchanged", None)
+    be = Node("BE", "changed", None)
+    state = _setup_state([no, be], eric, report_init)
+    eric.fingerprint_store = FingerprintStore(tmp_path / "fingerprints.json")
+    eric.fingerprint_store.set(no, "no_fingerprint", "no_published")
+    eric.fingerprint_store.set(be, "old_be_fingerprint", "be_published")
+
+    no_data = MagicMock()
+    be_data = MagicMock()
+    eric.preparator.retrieve.side_effect = [no_data, be_data]
+    eric.preparator.prepare.return_value = be_data
+    fingerprinter_init.return_value.get_fingerprint.side_effect = [
+        "no_fingerprint",
+        "be_fingerprint",
+    ]
+    fingerprinter_init.get_published_fingerprint.side_effect = [
+        "no_published",
+        "be_published",
+        "new_be_published",
+    ]
+
+    report = eric.publish_nodes([no, be], incremental=True)
+
+    eric.preparator.prepare.assert_called_once_with(be, state, be_data)
+    state.existing_data.remove_node_rows.assert_called_once_with(no)
+    state.data_to_publish.merge.assert_called_once_with(be_data)
+    eric.publisher.publish.assert_called_with(state, None)
+    assert len(report.node_errors) == 0
+    assert FingerprintStore(tmp_path / "fingerprints.json").fingerprints == {
+        "NO": {"fingerprint": "no_fingerprint", "published": "no_published"},
+        "BE": {"fingerprint": "be_fingerprint", "published": "new_be_published"},
+    }
+
+
+@patch("molgenis.bbmri_eric.eric.Fingerprinter")
+def test_publish_nodes_full_stores_fingerprints(
+    fingerprinter_init, eric, report_init, tmp_path
+):
+    no = Node("NO", "unchanged", None)
+    state = _setup_state([no], eric, report_init)
+    eric.fingerprint_store = FingerprintStore(tmp_path / "fingerprints.json")
+    eric.fingerprint_store.set(no, "no_fingerprint", "no_published")
+
+    no_data = MagicMock()
+    eric.preparator.retrieve.return_value = no_data
+    eric.preparator.prepare.return_value = no_data
+    fingerprinter_init.return_value.get_fingerprint.return_value = "no_fingerprint"
+    fingerprinter_init.get_published_fingerprint.return_value = "no_published"
+
+    eric.publish_nodes([no])
+
+    eric.preparator.prepare.assert_called_once_with(no, state, no_data)
+    assert not state.existing_data.remove_node_rows.called
+    state.data_to_publish.merge.assert_called_once_with(no_data)
+    assert (tmp_path / "fingerprints.json").exists()
+
+
+def test_publish_nodes_resume_requires_cache_dir(eric):
+    with pytest.raises(ValueError) as e:
+        eric.publish_nodes([Node("NO", "Norway", None)], resume="run")
+
+    assert str(e.value) == "A cache directory is required to resume a run"
+
+
+@patch("molgenis.bbmri_eric.eric.PublishingCheckpoint")
+def test_publish_nodes_writes_checkpoints(checkpoint_init, eric, report_init, tmp_path):
+    no = Node("NO", "succeeds", None)
+    be = Node("BE", "fails", None)
+    state = _setup_state([no, be], eric, report_init)
+    eric.cache_dir = tmp_path
+    eric.checkpoints = True
+    checkpoint = checkpoint_init.create.return_value
+    checkpoint.get_fingerprints.return_value = dict()
+    checkpoint.is_prepared.return_value = False
+    no_data = MagicMock()
+    error = EricError("error")
+    eric.preparator.prepare.side_effect = [no_data, error]
+
+    eric.publish_nodes([no, be])
+
+    checkpoint_init.create.assert_called_once_with(tmp_path / "runs", state)
+    checkpoint.set_prepared.assert_called_once_with(no, no_data, state.report, None)
+    checkpoint.set_failed.assert_called_once_with(be, error, state.report)
+    eric.pid_manager.flush.assert_called_once()
+    eric.publisher.publish.assert_called_with(state, checkpoint)
+    checkpoint.finish.assert_called_once()
+
+
+@patch("molgenis.bbmri_eric.eric.PublishingCheckpoint")
+def test_publish_nodes_without_checkpoints(
+    checkpoint_init, eric, report_init, tmp_path
+):
+    no = Node("NO", "succeeds", None)
+    state = _setup_state([no], eric, report_init)
+    eric.cache_dir = tmp_path
+
+    eric.publish_nodes([no])
+
+    checkpoint_init.create.assert_not_called()
+    eric.publisher.publish.assert_called_with(state, None)
+    eric.pid_manager.close.assert_called_once()
+
+
+def test_checkpoints_require_cache_dir(session, pid_service):
+    with pytest.raises(ValueError) as e:
+        Eric(session, pid_service, checkpoints=True)
+
+    assert str(e.value) == "A cache directory is required to write checkpoints"
+
+
+@patch("molgenis.bbmri_eric.eric.PublishingCheckpoint")
+def test_publish_nodes_resume(checkpoint_init, eric, report_init, tmp_path):
+    no = Node("NO", "prepared", None)
+    be = Node("BE", "not prepared", None)
+    state = _setup_state([no, be], eric, report_init)
+    eric.cache_dir = tmp_path
+    checkpoint = checkpoint_init.load.return_value
+    checkpoint.load_state.return_value = state
+    checkpoint.is_prepared.side_effect = lambda node: node == no
+    checkpoint.get_fingerprints.return_value = dict()
+    eric.publisher.publish.side_effect = EricError("error")
+
+    report = eric.publish_nodes([no, be], resume="run")
+
+    checkpoint_init.load.assert_called_once_with(tmp_path / "runs", "run")
+    checkpoint.load_state.assert_called_once_with([no, be], report, eric.category_rules)
+    assert not eric._init_state.called
+    eric.preparator.prepare.assert_called_once_with(
+        be, state, eric.preparator.retrieve.return_value
+    )
+    eric.publisher.publish.assert_called_with(state, checkpoint)
+    assert not checkpoint.finish.called
+
+
+@patch("molgenis.bbmri_eric.eric.Stager")
+def test_publish_nodes_pipelined(stager_init, eric, report_init):
+    no = Node("NO", "succeeds", None)
+    nl = ExternalServerNode("NL", "fails during staging", None, "url")
+    be = ExternalServerNode("BE", "succeeds with warnings", None, "url")
+    state = _setup_state([no, nl, be], eric, report_init)
+    eric.pipeline_depth = 1
+
+    warning = EricWarning("warning")
+    staging_error = EricError("staging error")
+    be_staged_data = MagicMock()
+    stager_init.return_value.stage.side_effect = [staging_error, be_staged_data]
+    stager_init.return_value.warnings = [warning]
+    no_data = MagicMock()
+    be_data = MagicMock()
+    eric.preparator.retrieve.side_effect = [no_data, be_data]
+    eric.preparator.prepare.side_effect = lambda node, _, node_data: node_data
+
+    report = eric.publish_nodes([no, nl, be])
+
+    assert eric.printer.print_node_title.mock_calls == [call(no), call(nl), call(be)]
+    assert eric.preparator.retrieve.call_args_list[1].args[::2] == (be, be_staged_data)
+    eric.preparator.prepare.assert_has_calls(
+        [call(no, state, no_data), call(be, state, be_data)]
+    )
+    assert state.data_to_publish.merge.mock_calls == [call(no_data), call(be_data)]
+    assert report.node_errors == {nl: staging_error}
+    assert report.node_warnings[be] == [warning]
+    eric.publisher.publish.assert_called_with(state, None)
@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock
+
+from molgenis.bbmri_eric.categories import CategoryRules
+from molgenis.bbmri_eric.fingerprints import Fingerprinter, FingerprintStore
+from molgenis.bbmri_eric.model import Node, QualityInfo
+
+
+def _create_state(node_data) -> MagicMock:
+    state = MagicMock()
+    state.quality_info = QualityInfo(
+        biobanks={}, biobank_levels={}, collections={}, collection_levels={}
+    )
+    state.eu_node_data = node_data
+    state.diseases.rows = [{"id": "urn:miriam:icd:C34"}]
+    state.category_rules = CategoryRules.default()
+    return state
+
+
+def test_fingerprint_changes_with_staging_data(node_data):
+    fingerprinter = Fingerprinter(_create_state(node_data))
+    fingerprint = fingerprinter.get_fingerprint(node_data)
+
+    assert fingerprinter.get_fingerprint(node_data) == fingerprint
+
+    node_data.biobanks.rows[0]["name"] = "changed"
+    assert fingerprinter.get_fingerprint(node_data) != fingerprint
+
+
+def test_fingerprint_changes_with_inputs(node_data):
+    state = _create_state(node_data)
+    fingerprint = Fingerprinter(state).get_fingerprint(node_data)
+
+    state.quality_info.biobanks["bbmri-eric:ID:NO_OUS"] = ["quality1"]
+    assert Fingerprinter(state).get_fingerprint(node_data) != fingerprint
+
+    fingerprint = Fingerprinter(state).get_fingerprint(node_data)
+    state.category_rules.term_roots["oncology"].add("urn:miriam:icd:C34")
+    assert Fingerprinter(state).get_fingerprint(node_data) != fingerprint
+
+
+def test_published_fingerprint(node_data):
+    node = node_data.node
+    for table in node_data.import_order:
+        for row in table.rows:
+            row["national_node"] = node.code
+    published = Fingerprinter.get_published_fingerprint(node_data, node)
+
+    assert Fingerprinter.get_published_fingerprint(node_data, node) == published
+    assert (
+        Fingerprinter.get_published_fingerprint(node_data, Node("BE", "Belgium"))
+        != published
+    )
+
+    node_data.biobanks.rows[0]["pid"] = "changed"
+    assert Fingerprinter.get_published_fingerprint(node_data, node) != published
+
+
+def test_fingerprint_store(tmp_path):
+    path = tmp_path / "cache" / "fingerprints.json"
+    no = Node("NO", "Norway")
+    store = FingerprintStore(path)
+    assert store.get(no) is None
+    assert not store.is_unchanged(no, "fingerprint", "published")
+
+    store.set(no, "fingerprint", "published")
+    store.save()
+
+    store = FingerprintStore(path)
+    assert store.get(no) == {"fingerprint": "fingerprint", "published": "published"}
+    assert store.is_unchanged(no, "fingerprint", "published")
+    assert not store.is_unchanged(no, "fingerprint", "other")
+    assert not store.is_unchanged(no, "other", "published")
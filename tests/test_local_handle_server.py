@@ -0,0 +1,114 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.model import Table, TableType
+from molgenis.bbmri_eric.pid_manager import AsyncPidManager, PidManager
+from molgenis.bbmri_eric.pid_service import HandleMutation, Status
+from tests.local_handle_server import LocalHandleServer
+
+
+@pytest.fixture
+def server():
+    with LocalHandleServer() as server:
+        yield server
+
+
+def test_pid_service(server):
+    pid_service = server.create_pid_service()
+    url = pid_service.base_url + "#/biobank/b1"
+
+    assert pid_service.reverse_lookup(url) is None
+
+    pid = pid_service.register_pid(url, "biobank1")
+    pid_service.set_name(pid, "new name")
+    pid_service.set_status(pid, Status.WITHDRAWN)
+
+    assert pid.startswith("TEST/1.")
+    assert server.get_values(pid)["URL"] == url
+    assert server.get_values(pid)["NAME"] == "new name"
+    assert server.get_values(pid)["STATUS"] == Status.WITHDRAWN.value
+
+    pid_service.remove_status(pid)
+
+    assert "STATUS" not in server.get_values(pid)
+    assert server.create_pid_service().reverse_lookup(url) == [pid]
+
+
+def test_pid_service_handle_cache(server):
+    server.add_handle(
+        "TEST/pid1",
+        [
+            {"index": 1, "type": "URL", "data": "https://directory/#/biobank/b1"},
+            {"index": 2, "type": "NAME", "data": "biobank1"},
+        ],
+    )
+    pid_service = server.create_pid_service()
+
+    assert pid_service.get_cached_record("TEST/pid1") == {
+        "URL": "https://directory/#/biobank/b1",
+        "NAME": "biobank1",
+    }
+    assert pid_service.reverse_lookup("https://directory/#/biobank/b1") == ["TEST/pid1"]
+    assert server.request_counts["GET"] == 2  # the admin handle and the search
+
+
+def test_pid_service_apply(server):
+    pid_service = server.create_pid_service()
+    pid = pid_service.create_pid()
+
+    pid_service.apply(
+        HandleMutation(pid, url="url", name="biobank1", status=Status.WITHDRAWN)
+    )
+    puts = server.request_counts["PUT"]
+    pid_service.apply(HandleMutation(pid, name="new name", remove_status=True))
+
+    assert server.get_values(pid)["NAME"] == "new name"
+    assert "STATUS" not in server.get_values(pid)
+    assert puts == 1
+    assert server.request_counts["PUT"] == 2
+
+
+def test_pid_manager_concurrently(server):
+    server.latency = 0.005
+    pid_manager = PidManager(server.create_pid_service(), MagicMock(), workers=8)
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": f"b{i}", "name": f"biobank{i}"} for i in range(20)],
+    )
+
+    warnings = pid_manager.assign_biobank_pids(biobanks)
+
+    assert warnings == []
+    for biobank in biobanks.rows:
+        assert server.get_values(biobank["pid"])["NAME"] == biobank["name"]
+
+
+def test_async_pid_manager(server):
+    server.latency = 0.005
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": f"b{i}", "name": f"biobank{i}"} for i in range(20)],
+    )
+
+    pid_manager = AsyncPidManager(server.create_pid_service(), MagicMock())
+    pid_manager.assign_biobank_pids(biobanks)
+    pid_manager.close()
+
+    for biobank in biobanks.rows:
+        assert server.get_values(biobank["pid"])["NAME"] == biobank["name"]
+
+
+def test_error_injection():
+    with LocalHandleServer(error_rate=1.0) as server:
+        server.error_rate = 0.0
+        pid_service = server.create_pid_service(use_handle_cache=False)
+        server.error_rate = 1.0
+
+        with pytest.raises(EricError) as e:
+            pid_service.set_name("TEST/pid1", "name")
+
+        assert str(e.value) == "Handle server error for handle TEST/pid1"
@@ -1,14 +1,19 @@
 # noinspection PyProtectedMember
 from unittest.mock import MagicMock
 
+import pytest
+
 from molgenis.bbmri_eric.model import (
     ExternalServerNode,
+    MixedData,
     Node,
     NodeData,
     Source,
     Table,
+    TableMeta,
     TableType,
 )
+from tests.conftest import create_table_meta
 
 
 def test_table_type_order():
@@ -108,3 +113,119 @@ def test_node_data_order():
         collections,
         facts,
     ]
+
+
+def test_table_meta_with_id():
+    meta = create_table_meta("eu_bbmri_eric_NL_persons", [("url", "hyperlink")])
+
+    derived = meta.with_id("eu_bbmri_eric_persons")
+
+    assert derived.id == "eu_bbmri_eric_persons"
+    assert meta.id == "eu_bbmri_eric_NL_persons"
+    assert derived.id_attribute == "id"
+    assert derived.hyperlinks == ["url"]
+    assert derived.meta["attributes"] is meta.meta["attributes"]
+
+
+def test_table_meta_with_id_keeps_id_attribute():
+    meta = create_table_meta("eu_bbmri_eric_NL_persons")
+    # a derived TableMeta doesn't look up the id attribute again
+    meta.meta["attributes"]["items"][0]["data"]["idAttribute"] = False
+
+    assert meta.with_id("eu_bbmri_eric_persons").id_attribute == "id"
+
+
+def test_convert_to_staging():
+    node = ExternalServerNode("NL", "NL", url="url.nl")
+    tables = {
+        type_.value: Table.of(
+            type_,
+            create_table_meta(
+                f"eu_bbmri_eric_NL_{type_.value}", [("url", "hyperlink")]
+            ),
+            [],
+        )
+        for type_ in TableType.get_import_order()
+    }
+    node_data = NodeData.from_dict(node, Source.EXTERNAL_SERVER, tables)
+
+    staging_data = node_data.convert_to_staging()
+
+    assert staging_data.source == Source.STAGING
+    for table, staging_table in zip(node_data.import_order, staging_data.import_order):
+        assert staging_table.full_name == node.get_staging_id(table.type)
+        assert staging_table.rows_by_id is table.rows_by_id
+        assert staging_table.meta.meta["attributes"] is table.meta.meta["attributes"]
+
+
+def test_convert_to_staging_wrong_source(node_data):
+    with pytest.raises(ValueError):
+        node_data.convert_to_staging()
+
+
+def test_mixed_data_merge_segmented(node_data):
+    mixed_data = MixedData.from_mixed_dict(
+        Source.PUBLISHED,
+        {
+            type_.value: Table.of_empty(type_, MagicMock())
+            for type_ in TableType.get_import_order()
+        },
+    )
+    data_to_publish = mixed_data.copy_empty(segmented=True)
+
+    data_to_publish.merge(node_data)
+
+    for table in data_to_publish.import_order:
+        node_table = node_data.table_by_type[table.type]
+        assert table.rows_by_id.segments == [node_table.rows_by_id]
+        assert table.rows == node_table.rows
+
+
+def test_table_meta_references():
+    meta = TableMeta(
+        meta={
+            "id": "eu_bbmri_eric_NL_biobanks",
+            "attributes": {
+                "items": [
+                    {"data": {"name": "id", "idAttribute": True, "type": "string"}},
+                    {
+                        "data": {
+                            "name": "contact",
+                            "idAttribute": False,
+                            "type": "xref",
+                            "refEntityType": {
+                                "self": "https://url/api/metadata/"
+                                "eu_bbmri_eric_NL_persons"
+                            },
+                        }
+                    },
+                    {
+                        "data": {
+                            "name": "network",
+                            "idAttribute": False,
+                            "type": "mref",
+                            "refEntityType": {
+                                "data": {"id": "eu_bbmri_eric_NL_networks"}
+                            },
+                        }
+                    },
+                    {
+                        "data": {
+                            "name": "collections",
+                            "idAttribute": False,
+                            "type": "onetomany",
+                            "refEntityType": {
+                                "self": "https://url/api/metadata/"
+                                "eu_bbmri_eric_NL_collections"
+                            },
+                        }
+                    },
+                ]
+            },
+        }
+    )
+
+    assert meta.references == {
+        "contact": "eu_bbmri_eric_NL_persons",
+        "network": "eu_bbmri_eric_NL_networks",
+    }
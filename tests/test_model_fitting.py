@@ -2,6 +2,7 @@ from unittest.mock import MagicMock
 
 import pytest
 
+from molgenis.bbmri_eric.model import Node, Table, TableType
 from molgenis.bbmri_eric.model_fitting import ModelFitter
 
 
@@ -120,3 +121,44 @@ def test_move_head_info(node_data, model_fitter):
         ]
         == "bbmri-eric:contactID:NL_devries"
     )
+
+
+def test_check_person_index(model_fitter):
+    model_fitter.node_data.node = Node("NL", "NL")
+    model_fitter.node_data.persons = Table.of(
+        TableType.PERSONS,
+        MagicMock(),
+        [
+            {"id": "p1", "first_name": "Jan ", "last_name": "De Vries", "role": "A"},
+            {"id": "p2", "first_name": "jan", "last_name": "devries"},
+            {"id": "bbmri-eric:contactID:NL_smit", "first_name": "Els"},
+        ],
+    )
+
+    head = {"head_firstname": "JAN", "head_lastname": "de vries", "head_role": "B"}
+    assert model_fitter._check_person(head) == "p1"
+    assert set(
+        model_fitter.node_data.persons.rows_by_id["p1"]["role"].split(" and ")
+    ) == {"A", "B"}
+    assert (
+        model_fitter._check_person({"head_firstname": "Els", "head_lastname": "Smit"})
+        is None
+    )
+
+    # a created person is added to the index
+    model_fitter._create_person({"head_firstname": "Piet", "head_lastname": "Geluk"})
+    assert (
+        model_fitter._check_person({"head_firstname": "piet", "head_lastname": "Geluk"})
+        == "bbmri-eric:contactID:NL_geluk"
+    )
+
+    # a created person that replaces an existing person with the same id
+    model_fitter._create_person({"head_firstname": "Karel", "head_lastname": "Smit"})
+    assert (
+        model_fitter._check_person({"head_firstname": "Karel", "head_lastname": "Smit"})
+        == "bbmri-eric:contactID:NL_smit"
+    )
+    assert (
+        model_fitter._check_person({"head_firstname": "Els", "head_lastname": "NN"})
+        is None
+    )
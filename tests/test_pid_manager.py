@@ -1,15 +1,26 @@
+import asyncio
+import threading
+import time
 from unittest import mock
 from unittest.mock import MagicMock, call
 
 import pytest
 
+from molgenis.bbmri_eric.errors import EricError
 from molgenis.bbmri_eric.model import Table, TableType
 from molgenis.bbmri_eric.pid_manager import (
+    AsyncPidManager,
     NoOpPidManager,
     PidManager,
     PidManagerFactory,
 )
-from molgenis.bbmri_eric.pid_service import DummyPidService, NoOpPidService, Status
+from molgenis.bbmri_eric.pid_service import (
+    DummyPidService,
+    HandleMutation,
+    NoOpPidService,
+    RateLimitedPidService,
+    Status,
+)
 from molgenis.bbmri_eric.printer import Printer
 
 
@@ -82,6 +93,40 @@ def test_update_biobank_pids(pid_manager, pid_service):
     pid_service.remove_status.assert_called_with("pid4")
 
 
+def test_update_biobank_pids_with_cached_records(pid_manager, pid_service):
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[
+            {"id": "b1", "name": "new name", "pid": "pid1", "withdrawn": True},
+            {"id": "b2", "name": "biobank2", "pid": "pid2", "withdrawn": False},
+            {"id": "b3", "name": "biobank3", "pid": "pid3", "withdrawn": False},
+        ],
+    )
+    existing_biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[
+            {"id": "b1", "name": "old name", "pid": "pid1", "withdrawn": False},
+            {"id": "b2", "name": "biobank2", "pid": "pid2", "withdrawn": False},
+            {"id": "b3", "name": "biobank3", "pid": "pid3", "withdrawn": True},
+        ],
+    )
+    records = {
+        # a previous run already updated the handle of b1
+        "pid1": {"NAME": "new name", "STATUS": Status.WITHDRAWN.value},
+        # the handle of b2 is out of sync with the published biobank
+        "pid2": {"NAME": "old name", "STATUS": Status.WITHDRAWN.value},
+    }
+    pid_service.get_cached_record.side_effect = records.get
+
+    pid_manager.update_biobank_pids(biobanks, existing_biobanks)
+
+    pid_service.set_name.assert_called_once_with("pid2", "biobank2")
+    pid_service.set_status.assert_not_called()
+    assert pid_service.remove_status.mock_calls == [call("pid2"), call("pid3")]
+
+
 def test_terminate_biobanks(pid_manager, pid_service):
     pid_manager.terminate_biobanks(["pid1", "pid2"])
     assert pid_service.set_status.mock_calls == [
@@ -90,6 +135,265 @@ def test_terminate_biobanks(pid_manager, pid_service):
     ]
 
 
+def test_assign_biobank_pids_concurrently(pid_service, printer):
+    pid_manager = PidManager(pid_service, printer, workers=4)
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": f"b{i}", "name": f"biobank{i}"} for i in range(10)],
+    )
+
+    def reverse_lookup(url: str):
+        # let the first biobanks finish last
+        i = int(url.split("/b")[-1])
+        time.sleep((10 - i) * 0.002)
+        return [f"existing{i}"] if i % 3 == 0 else []
+
+    pid_service.reverse_lookup.side_effect = reverse_lookup
+    pid_service.register_pid.side_effect = lambda url, name: f"pid-{name}"
+
+    warnings = pid_manager.assign_biobank_pids(biobanks)
+
+    assert [biobank["pid"] for biobank in biobanks.rows] == [
+        f"existing{i}" if i % 3 == 0 else f"pid-biobank{i}" for i in range(10)
+    ]
+    assert [warning.message for warning in warnings] == [
+        f'PID(s) already exist for new biobank "biobank{i}": '
+        f"['existing{i}']. Please check the PID's contents!"
+        for i in (0, 3, 6, 9)
+    ]
+    printed = [c.args[0] for c in printer.print.mock_calls]
+    assert printed[0].startswith('⚠️ PID(s) already exist for new biobank "biobank0"')
+    assert printed[1:3] == [
+        'Registered pid-biobank1 for new biobank "biobank1"',
+        'Registered pid-biobank2 for new biobank "biobank2"',
+    ]
+    assert len(printed) == 10
+
+
+def test_terminate_biobanks_concurrently_error(pid_service, printer):
+    pid_manager = PidManager(pid_service, printer, workers=2)
+
+    def set_status(pid: str, _status: Status):
+        if pid == "pid2":
+            raise EricError("Handle not found on handle server: pid2")
+
+    pid_service.set_status.side_effect = set_status
+
+    with pytest.raises(EricError):
+        pid_manager.terminate_biobanks(["pid1", "pid2", "pid3"])
+
+    printer.print.assert_called_once_with("Set STATUS of pid1 to TERMINATED")
+
+
+def test_deferred_pid_manager(pid_service, printer):
+    pid_manager = PidManager(pid_service, printer, deferred=True)
+    pid_service.create_pid.return_value = "pid2"
+    pid_service.reverse_lookup.return_value = []
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[
+            {"id": "b1", "name": "biobank1", "pid": "pid1", "withdrawn": False},
+            {"id": "b2", "name": "biobank2", "withdrawn": True},
+        ],
+    )
+    existing_biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": "b1", "name": "old name", "withdrawn": True}],
+    )
+
+    pid_manager.assign_biobank_pids(biobanks)
+    pid_manager.update_biobank_pids(biobanks, existing_biobanks)
+    pid_manager.terminate_biobanks(["pid3"])
+
+    assert biobanks.rows[1]["pid"] == "pid2"
+    pid_service.register_pid.assert_not_called()
+    pid_service.set_status.assert_not_called()
+    pid_service.apply.assert_not_called()
+
+    pid_manager.flush()
+
+    assert pid_service.apply.mock_calls == [
+        call(
+            HandleMutation(
+                "pid2", url="url/#/biobank/b2", name="biobank2", status=Status.WITHDRAWN
+            )
+        ),
+        call(HandleMutation("pid1", name="biobank1", remove_status=True)),
+        call(HandleMutation("pid3", status=Status.TERMINATED)),
+    ]
+
+
+def test_deferred_pid_manager_discard(pid_service, printer):
+    pid_manager = PidManager(pid_service, printer, deferred=True)
+
+    pid_manager.terminate_biobanks(["pid1"])
+    pid_manager.discard()
+    pid_manager.flush()
+
+    pid_service.apply.assert_not_called()
+
+
+def test_deferred_pid_manager_rollback(pid_service, printer):
+    pid_manager = PidManager(pid_service, printer, deferred=True)
+    pid_service.create_pid.return_value = "pid1"
+    pid_service.reverse_lookup.side_effect = [[], EricError("error")]
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": "b1", "name": "biobank1"}, {"id": "b2", "name": "biobank2"}],
+    )
+
+    with pytest.raises(EricError):
+        pid_manager.assign_biobank_pids(biobanks)
+    pid_manager.flush()
+
+    pid_service.apply.assert_not_called()
+
+
+def test_async_pid_manager(pid_service, printer):
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[
+            {"id": "b1", "name": "new name", "pid": "pid1", "withdrawn": True},
+            {"id": "b2", "name": "biobank2"},
+            {"id": "b3", "name": "biobank3", "withdrawn": True},
+        ],
+    )
+    existing_biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": "b1", "name": "biobank1", "pid": "pid1", "withdrawn": False}],
+    )
+    pid_service.reverse_lookup.side_effect = lambda url: (
+        ["pid2"] if url.endswith("b2") else []
+    )
+    pid_service.register_pid.return_value = "pid3"
+
+    pid_manager = AsyncPidManager(pid_service, printer)
+    warnings = pid_manager.assign_biobank_pids(biobanks)
+    pid_manager.update_biobank_pids(biobanks, existing_biobanks)
+    pid_manager.terminate_biobanks(["pid4"])
+    pid_manager.close()
+
+    assert [biobank["pid"] for biobank in biobanks.rows] == ["pid1", "pid2", "pid3"]
+    assert len(warnings) == 1
+    pid_service.register_pid.assert_called_once_with("url/#/biobank/b3", "biobank3")
+    pid_service.set_name.assert_called_once_with("pid1", "new name")
+    assert pid_service.set_status.mock_calls == [
+        call("pid3", Status.WITHDRAWN),
+        call("pid1", Status.WITHDRAWN),
+        call("pid4", Status.TERMINATED),
+    ]
+    assert printer.print.mock_calls[:2] == [
+        call(f"⚠️ {warnings[0].message}"),
+        call('Registered pid3 for new biobank "biobank3"'),
+    ]
+
+
+def test_async_pid_manager_error(pid_service, printer):
+    pid_service.set_status.side_effect = [None, EricError("error"), None]
+
+    pid_manager = AsyncPidManager(pid_service, printer, concurrency=1)
+    with pytest.raises(EricError):
+        pid_manager.terminate_biobanks(["pid1", "pid2", "pid3"])
+    pid_manager.close()
+
+    printer.print.assert_called_once_with("Set STATUS of pid1 to TERMINATED")
+
+
+def test_async_pid_manager_error_cancels(pid_service, printer):
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": f"b{i}", "name": f"biobank{i}"} for i in range(1, 4)],
+    )
+    lookups_released = threading.Event()
+
+    def reverse_lookup(url: str):
+        if url.endswith("b1"):
+            raise EricError("error")
+        lookups_released.wait(1)
+        return []
+
+    pid_service.reverse_lookup.side_effect = reverse_lookup
+
+    pid_manager = AsyncPidManager(pid_service, printer, concurrency=2)
+    with pytest.raises(EricError):
+        pid_manager.assign_biobank_pids(biobanks)
+    lookups_released.set()
+    pid_manager.close()
+
+    pid_service.register_pid.assert_not_called()
+    assert "pid" not in biobanks.rows[1]
+
+
+def test_async_pid_manager_in_event_loop(pid_service, printer):
+    pid_manager = AsyncPidManager(pid_service, printer)
+
+    async def terminate():
+        pid_manager.terminate_biobanks(["pid1"])
+
+    asyncio.run(terminate())
+    pid_manager.close()
+
+    pid_service.set_status.assert_called_once_with("pid1", Status.TERMINATED)
+
+
+def test_async_pid_manager_deferred(pid_service, printer):
+    biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": "b1", "name": "biobank1", "pid": "pid1", "withdrawn": True}],
+    )
+    existing_biobanks = Table.of(
+        table_type=TableType.BIOBANKS,
+        meta=MagicMock(),
+        rows=[{"id": "b1", "name": "biobank1", "pid": "pid1", "withdrawn": False}],
+    )
+    pid_service.get_cached_record.return_value = None
+
+    pid_manager = AsyncPidManager(
+        pid_service, printer, requests_per_second=100, deferred=True
+    )
+    pid_manager.update_biobank_pids(biobanks, existing_biobanks)
+    pid_manager.terminate_biobanks(["pid2"])
+
+    assert type(pid_manager.outbox.pid_service) is RateLimitedPidService
+    pid_service.set_status.assert_not_called()
+
+    pid_manager.flush()
+    pid_manager.close()
+
+    assert pid_service.apply.mock_calls == [
+        call(HandleMutation("pid1", status=Status.WITHDRAWN)),
+        call(HandleMutation("pid2", status=Status.TERMINATED)),
+    ]
+
+
+def test_rate_limited_pid_service():
+    pid_service = MagicMock()
+    pid_service.base_url = "url/"
+    limited = RateLimitedPidService(pid_service, requests_per_second=100)
+
+    start = time.monotonic()
+    for i in range(5):
+        limited.set_name(f"pid{i}", "name")
+    duration = time.monotonic() - start
+
+    assert limited.base_url == "url/"
+    assert pid_service.set_name.call_count == 5
+    assert duration >= 0.04
+
+
+def test_rate_limited_pid_service_invalid():
+    with pytest.raises(ValueError):
+        RateLimitedPidService(MagicMock(), requests_per_second=0)
+
+
 def test_noop_pid_manager():
     noop = NoOpPidManager()
 
@@ -105,6 +409,12 @@ def test_pid_manager_factory():
 
     manager1 = PidManagerFactory.create(noop_pid_service, printer)
     manager2 = PidManagerFactory.create(dummy_pid_service, printer)
+    manager3 = PidManagerFactory.create(
+        dummy_pid_service, printer, workers=4, asynchronous=True
+    )
 
-    assert type(manager1) == NoOpPidManager
-    assert type(manager2) == PidManager
+    assert type(manager1) is NoOpPidManager
+    assert type(manager2) is PidManager
+    assert type(manager3) is AsyncPidManager
+    assert manager3.workers == 4
+    manager3.close()
@@ -2,11 +2,14 @@ from unittest import mock
 from unittest.mock import MagicMock
 
 import pytest
+from pyhandle.handleexceptions import ReverseLookupException
 
 from molgenis.bbmri_eric.errors import EricError
 from molgenis.bbmri_eric.pid_service import (
     DummyPidService,
+    HandleMutation,
     NoOpPidService,
+    PidOutbox,
     PidService,
     Status,
 )
@@ -40,6 +43,106 @@ def test_reverse_lookup_no_auth(pid_service, handle_client):
     assert str(e.value) == "Insufficient permissions for reverse lookup"
 
 
+def test_reverse_lookup_url_index(pid_service, handle_client):
+    handle_client.search_handle.return_value = {
+        "test/pid1": [
+            {"type": "URL", "data": {"format": "string", "value": "my_url"}},
+            {"type": "NAME", "data": {"format": "string", "value": "biobank1"}},
+        ],
+        "test/pid2": [{"type": "URL", "data": "my_url"}],
+        "other/pid3": [{"type": "URL", "data": "my_url"}],
+    }
+
+    assert pid_service.reverse_lookup("my_url") == ["test/pid1", "test/pid2"]
+    assert pid_service.reverse_lookup("my_url") == ["test/pid1", "test/pid2"]
+
+    handle_client.search_handle.assert_called_once_with(URL="*", retrieverecords="true")
+
+
+def test_reverse_lookup_url_index_miss(pid_service, handle_client):
+    handle_client.search_handle.return_value = {
+        "test/pid1": [{"type": "URL", "data": "other_url"}]
+    }
+
+    assert pid_service.reverse_lookup("my_url") is None
+
+    handle_client.search_handle.assert_called_once_with(URL="*", retrieverecords="true")
+
+
+def test_reverse_lookup_url_index_unavailable(pid_service, handle_client):
+    handle_client.search_handle.side_effect = [
+        ReverseLookupException(),
+        ["test/pid2"],
+        [],
+    ]
+
+    assert pid_service.reverse_lookup("my_url") == ["test/pid2"]
+    assert pid_service.reverse_lookup("other_url") == []
+
+    handle_client.search_handle.assert_called_with(URL="other_url", prefix="test")
+
+
+def test_reverse_lookup_without_handle_cache(handle_client):
+    pid_service = PidService(handle_client, "test", "test.nl", use_handle_cache=False)
+    handle_client.search_handle.return_value = ["pid1"]
+
+    assert pid_service.reverse_lookup("my_url") == ["pid1"]
+
+    handle_client.search_handle.assert_called_once_with(URL="my_url", prefix="test")
+
+
+def test_register_pid_adds_to_handle_cache(pid_service, handle_client):
+    handle_client.search_handle.return_value = {
+        "test/pid1": [{"type": "URL", "data": "url1"}]
+    }
+    handle_client.register_handle.return_value = "test/pid2"
+    pid_service.reverse_lookup("url1")
+
+    pid_service.register_pid("url2", "biobank2")
+
+    assert pid_service.reverse_lookup("url2") == ["test/pid2"]
+    handle_client.search_handle.assert_called_once()
+
+
+def test_handle_cache(pid_service: PidService, handle_client):
+    handle_client.search_handle.return_value = {
+        "test/pid1": [
+            {"type": "URL", "data": {"format": "string", "value": "url1"}},
+            {"type": "NAME", "data": {"format": "string", "value": "biobank1"}},
+            {"type": "STATUS", "data": "TERMINATED"},
+        ],
+        "test/pid2": [{"type": "URL", "data": "url2"}],
+    }
+
+    assert pid_service.get_cached_record("test/pid1") == {
+        "URL": "url1",
+        "NAME": "biobank1",
+        "STATUS": "TERMINATED",
+    }
+    assert pid_service.get_cached_record("test/pid3") is None
+
+    pid_service.set_name("test/pid1", "new name")
+    pid_service.remove_status("test/pid1")
+    pid_service.set_status("test/pid2", Status.WITHDRAWN)
+    pid_service.apply(HandleMutation("test/pid4", url="url4", name="biobank4"))
+    pid_service.set_name("test/pid5", "unknown")
+
+    assert pid_service.get_cached_record("test/pid1") == {
+        "URL": "url1",
+        "NAME": "new name",
+    }
+    assert pid_service.get_cached_record("test/pid2") == {
+        "URL": "url2",
+        "STATUS": Status.WITHDRAWN.value,
+    }
+    assert pid_service.get_cached_record("test/pid4") == {
+        "URL": "url4",
+        "NAME": "biobank4",
+    }
+    assert pid_service.get_cached_record("test/pid5") is None
+    handle_client.search_handle.assert_called_once()
+
+
 def test_register_pid(pid_service: PidService, handle_client):
     handle_client.register_handle.return_value = "test/pid"
 
@@ -53,6 +156,72 @@ def test_register_pid(pid_service: PidService, handle_client):
     assert result == "test/pid"
 
 
+def test_apply_new_handle(pid_service: PidService, handle_client):
+    pid_service.apply(
+        HandleMutation("test/pid", url="url", name="biobank1", status=Status.WITHDRAWN)
+    )
+
+    handle_client.register_handle.assert_called_once_with(
+        handle="test/pid",
+        location="url",
+        NAME="biobank1",
+        STATUS=Status.WITHDRAWN.value,
+    )
+    handle_client.modify_handle_value.assert_not_called()
+
+
+def test_apply_existing_handle(pid_service: PidService, handle_client):
+    pid_service.apply(HandleMutation("test/pid1", name="biobank1"))
+    pid_service.apply(HandleMutation("test/pid2", remove_status=True))
+
+    handle_client.modify_handle_value.assert_called_once_with(
+        "test/pid1", NAME="biobank1"
+    )
+    handle_client.delete_handle_value.assert_called_once_with("test/pid2", "STATUS")
+    handle_client.register_handle.assert_not_called()
+
+
+def test_pid_outbox(pid_service: PidService, handle_client):
+    handle_client.search_handle.return_value = ["test/pid0"]
+    outbox = PidOutbox(pid_service)
+
+    pid = outbox.register_pid("url1", "biobank1")
+    outbox.set_status(pid, Status.WITHDRAWN)
+    outbox.set_name(pid, "new name")
+    outbox.set_name("test/pid2", "biobank2")
+    outbox.set_status("test/pid2", Status.WITHDRAWN)
+    outbox.set_status("test/pid3", Status.WITHDRAWN)
+    outbox.remove_status("test/pid3")
+    outbox.set_status("test/pid4", Status.TERMINATED)
+    savepoint = len(outbox)
+    outbox.set_name("test/pid4", "discarded")
+
+    assert outbox.reverse_lookup("url1") == [pid]
+    assert outbox.reverse_lookup("url2") == ["test/pid0"]
+    handle_client.register_handle.assert_not_called()
+    handle_client.modify_handle_value.assert_not_called()
+
+    outbox.rollback(savepoint)
+
+    assert outbox.take() == [
+        HandleMutation(pid, url="url1", name="new name", status=Status.WITHDRAWN),
+        HandleMutation("test/pid2", name="biobank2", status=Status.WITHDRAWN),
+        HandleMutation("test/pid3", remove_status=True),
+        HandleMutation("test/pid4", status=Status.TERMINATED),
+    ]
+    assert len(outbox) == 0
+
+
+def test_pid_outbox_remove_status_of_new_handle(pid_service: PidService):
+    outbox = PidOutbox(pid_service)
+
+    pid = outbox.register_pid("url1", "biobank1")
+    outbox.set_status(pid, Status.WITHDRAWN)
+    outbox.remove_status(pid)
+
+    assert outbox.take() == [HandleMutation(pid, url="url1", name="biobank1")]
+
+
 def test_set_name(pid_service: PidService, handle_client):
     pid_service.set_name("pid1", "new_name")
     handle_client.modify_handle_value.assert_called_with("pid1", NAME="new_name")
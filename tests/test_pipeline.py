@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from molgenis.bbmri_eric.errors import EricError
+from molgenis.bbmri_eric.pipeline import prefetch
+
+
+def test_prefetch():
+    def fetch(item, printer):
+        printer.print(f"fetching {item}")
+        if item == 2:
+            raise EricError("error")
+        return item * 10
+
+    results = list(prefetch(fetch, [1, 2, 3], depth=1))
+
+    assert [(item, result) for item, result, _, _ in results] == [
+        (1, 10),
+        (2, None),
+        (3, 30),
+    ]
+    assert str(results[1][2]) == "error"
+    assert [lines for _, _, _, lines in results] == [
+        ["fetching 1"],
+        ["fetching 2"],
+        ["fetching 3"],
+    ]
+
+
+def test_prefetch_back_pressure():
+    fetched = []
+
+    def fetch(item, _):
+        fetched.append(item)
+        return item
+
+    results = prefetch(fetch, list(range(10)), depth=2)
+    next(results)
+    time.sleep(0.2)
+
+    # one consumed, two waiting in the queue and one waiting to be put in the queue
+    assert len(fetched) == 4
+    results.close()
+
+
+def test_prefetch_raises_other_errors():
+    def fetch(item, _):
+        raise KeyError(item)
+
+    with pytest.raises(KeyError):
+        list(prefetch(fetch, [1], depth=1))
+
+
+def test_prefetch_invalid_depth():
+    with pytest.raises(ValueError):
+        list(prefetch(lambda item, _: item, [1], depth=0))
@@ -0,0 +1,126 @@
+from molgenis.bbmri_eric.diff import TableDiff
+from molgenis.bbmri_eric.errors import ErrorReport
+from molgenis.bbmri_eric.model import Table, TableMeta, TableType
+from molgenis.bbmri_eric.pid_service import HandleMutation, Status
+from molgenis.bbmri_eric.plan import (
+    Deletion,
+    PublishingPlan,
+    TablePlan,
+    get_csv_size,
+)
+
+
+def _table(table_type: TableType, rows: list) -> Table:
+    meta = TableMeta(
+        meta={
+            "id": table_type.base_id,
+            "attributes": {
+                "items": [
+                    {"data": {"name": name, "type": "string", "idAttribute": i == 0}}
+                    for i, name in enumerate(["id", "pid", "national_node"])
+                ]
+            },
+        }
+    )
+    return Table.of(table_type, meta, rows)
+
+
+def _table_plan(**kwargs) -> TablePlan:
+    values = dict(
+        table_type=TableType.PERSONS,
+        inserted=0,
+        changed=0,
+        unchanged=0,
+        deleted=0,
+        quality_protected=0,
+        referenced=0,
+        terminated_pids=0,
+        upload_bytes=0,
+    )
+    values.update(kwargs)
+    return TablePlan(**values)
+
+
+def test_table_plan_of():
+    table = _table(TableType.BIOBANKS, [{"id": "b1"}, {"id": "b2"}, {"id": "b3"}])
+    existing_table = _table(
+        TableType.BIOBANKS,
+        [{"id": "b4", "pid": "pid4"}, {"id": "b5"}, {"id": "b6"}, {"id": "b7"}],
+    )
+    diff = TableDiff(
+        TableType.BIOBANKS, inserted=[{"id": "b1"}], changed=[{"id": "b2"}], unchanged=1
+    )
+    deletion = Deletion(
+        deletable_ids={"b4", "b5"}, quality_ids=["b6"], referenced_ids={"b7"}
+    )
+
+    plan = TablePlan.of(diff, deletion, table, existing_table)
+
+    assert plan == TablePlan(
+        table_type=TableType.BIOBANKS,
+        inserted=1,
+        changed=1,
+        unchanged=1,
+        deleted=2,
+        quality_protected=1,
+        referenced=1,
+        terminated_pids=1,
+        upload_bytes=get_csv_size(diff.upserted, table.meta.attributes),
+    )
+    assert plan.has_changes
+
+
+def test_publishing_plan():
+    plan = PublishingPlan(
+        ErrorReport([]),
+        tables=[
+            _table_plan(inserted=1, upload_bytes=10),
+            _table_plan(table_type=TableType.BIOBANKS, deleted=2, terminated_pids=1),
+            _table_plan(table_type=TableType.FACTS, unchanged=5),
+        ],
+        pid_changes=[
+            HandleMutation("pid1", url="url", name="name"),
+            HandleMutation("pid2", name="new name"),
+            HandleMutation("pid3", status=Status.WITHDRAWN),
+            HandleMutation("pid4", remove_status=True),
+        ],
+    )
+
+    assert plan.has_changes
+    assert plan.registered_pids == 1
+    assert plan.updated_pids == 3
+    assert plan.terminated_pids == 1
+    assert plan.upload_bytes == 10
+    assert plan.directory_requests == 2
+    assert plan.handle_requests == 2 + 1 + 2 + 2 + 2
+
+
+def test_publishing_plan_delete_batches():
+    plan = PublishingPlan(
+        ErrorReport([]),
+        tables=[
+            _table_plan(table_type=TableType.BIOBANKS, deleted=3),
+            _table_plan(table_type=TableType.COLLECTIONS, deleted=5),
+            _table_plan(table_type=TableType.FACTS, deleted=1),
+        ],
+        delete_batch_size=2,
+    )
+
+    assert plan.directory_requests == 2 + 3 + 1
+
+
+def test_publishing_plan_without_changes():
+    plan = PublishingPlan(ErrorReport([]), tables=[_table_plan(unchanged=3)])
+
+    assert not plan.has_changes
+    assert plan.directory_requests == 0
+    assert plan.handle_requests == 0
+
+
+def test_get_csv_size():
+    rows = [{"id": "p1", "national_node": "NL", "contact": ["a", "b"]}]
+
+    size = get_csv_size(rows, ["id", "national_node", "contact"])
+
+    assert size == len('"id","national_node","contact"\r\n"p1","NL","a,b"\r\n')
+    assert get_csv_size([], ["id"]) == 0
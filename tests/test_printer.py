@@ -1,8 +1,10 @@
 import textwrap
 
 from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
-from molgenis.bbmri_eric.model import Node
-from molgenis.bbmri_eric.printer import Printer
+from molgenis.bbmri_eric.model import Node, TableType
+from molgenis.bbmri_eric.pid_service import HandleMutation
+from molgenis.bbmri_eric.plan import PublishingPlan, TablePlan
+from molgenis.bbmri_eric.printer import BufferedPrinter, Printer, TracingPrinter
 
 
 def test_indentation(capsys):
@@ -134,6 +136,56 @@ def test_print_summary(capsys):
     assert captured.out == expected
 
 
+def test_print_plan(capsys):
+    expected = textwrap.dedent(
+        """\
+
+        =======
+        📋 Plan
+        =======
+        ✏️ eu_bbmri_eric_biobanks: 1 new, 2 changed, 1 deleted, 10 unchanged
+            🛡️ 1 deletion(s) prevented by the quality info
+            🛡️ 2 deletion(s) prevented by references
+        🆔 PIDs: 1 registered, 1 updated, 1 terminated
+        📡 About 2 request(s) to the directory, 1.5 kB to upload
+        📡 About 5 request(s) to the handle server
+        """
+    )
+
+    plan = PublishingPlan(
+        ErrorReport([]),
+        tables=[
+            TablePlan(
+                table_type=TableType.BIOBANKS,
+                inserted=1,
+                changed=2,
+                unchanged=10,
+                deleted=1,
+                quality_protected=1,
+                referenced=2,
+                terminated_pids=1,
+                upload_bytes=1500,
+            )
+        ],
+        pid_changes=[
+            HandleMutation("pid1", url="url", name="name"),
+            HandleMutation("pid2", name="name"),
+        ],
+    )
+
+    Printer().print_plan(plan)
+
+    captured = capsys.readouterr()
+    assert captured.out == expected
+
+
+def test_print_plan_without_changes(capsys):
+    Printer().print_plan(PublishingPlan(ErrorReport([])))
+
+    captured = capsys.readouterr()
+    assert captured.out.endswith("✅ Publishing would change nothing\n")
+
+
 def test_with_indentation(capsys):
     expected = textwrap.dedent(
         """\
@@ -152,3 +204,28 @@ def test_with_indentation(capsys):
 
     captured = capsys.readouterr()
     assert captured.out == expected
+
+
+def test_buffered_printer(capsys):
+    printer = BufferedPrinter()
+    printer.print("line1")
+    with printer.indentation():
+        printer.print_warning(EricWarning("warning"))
+
+    assert printer.lines == ["line1", "    ⚠️ warning"]
+    assert capsys.readouterr().out == ""
+
+
+def test_tracing_printer(capsys, tmp_path):
+    trace = tmp_path / "trace.txt"
+
+    with open(trace, "w", encoding="utf-8") as trace_file:
+        printer = TracingPrinter(trace_file)
+        printer.print("line1")
+        with printer.indentation():
+            printer.print("line2")
+
+    assert capsys.readouterr().out == "line1\n    line2\n"
+    lines = trace.read_text(encoding="utf-8").splitlines()
+    assert [line[12:] for line in lines] == ["line1", "    line2"]
+    assert all(float(line[:10]) >= 0 for line in lines)
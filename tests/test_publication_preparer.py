@@ -1,10 +1,26 @@
 from unittest.mock import MagicMock, patch
 
 import pytest
-
-from molgenis.bbmri_eric.errors import EricWarning, ErrorReport
-from molgenis.bbmri_eric.model import Node
-from molgenis.bbmri_eric.publication_preparer import PublicationPreparer
+import requests
+
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
+from molgenis.bbmri_eric.model import (
+    MixedData,
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    Source,
+    Table,
+    TableMeta,
+    TableType,
+)
+from molgenis.bbmri_eric.publication_preparer import (
+    PublicationPreparer,
+    _init_worker,
+    _prepare_in_worker,
+)
+from molgenis.bbmri_eric.publisher import PublishingState
 
 
 @pytest.fixture
@@ -64,6 +80,44 @@ def test_prepare(preparer, session):
     manage_pids_func.assert_called_with(node_data, state)
 
 
+def test_retrieve_with_streaming_validation(session, printer, pid_manager):
+    preparer = PublicationPreparer(printer, pid_manager, session, max_errors=10)
+    nl = Node.of("NL")
+    node_data = MagicMock()
+    session.get_staging_node_data.return_value = node_data
+
+    assert preparer.retrieve(nl) == node_data
+
+    page_handler = session.get_staging_node_data.call_args.kwargs["page_handler"]
+    assert page_handler.__self__.node == nl
+    assert page_handler.__self__.max_errors == 10
+
+
+def test_retrieve_staged_data(preparer, session, node_data, printer):
+    assert preparer.retrieve(node_data.node, staged_data=node_data) == node_data
+
+    assert not session.get_staging_node_data.called
+    printer.print.assert_called_once_with(
+        "📦 Using the data that was staged for node NL"
+    )
+
+
+@patch("molgenis.bbmri_eric.publication_preparer.StreamingValidator")
+def test_retrieve_staged_data_with_streaming_validation(
+    validator_init, session, printer, pid_manager, node_data
+):
+    preparer = PublicationPreparer(printer, pid_manager, session, max_errors=10)
+    validator_init.return_value.validate_page.side_effect = [None, EricError("error")]
+
+    with pytest.raises(EricError):
+        preparer.retrieve(node_data.node, staged_data=node_data)
+
+    validator_init.assert_called_once_with(node_data.node, 10)
+    validator_init.return_value.validate_page.assert_any_call(
+        TableType.PERSONS, node_data.persons.meta, node_data.persons.rows, 0
+    )
+
+
 def test_validate(preparer: PublicationPreparer, validator_init, printer):
     validator = MagicMock()
     validator_init.return_value = validator
@@ -123,10 +177,18 @@ def test_transform(preparer: PublicationPreparer, transformer_init):
 
     preparer._transform_node(MagicMock(), MagicMock())
 
-    assert transformer_init.called
+    assert transformer_init.call_args.kwargs["fused"] is True
     assert transformer.transform.called
 
 
+def test_transform_pass_by_pass(session, printer, pid_manager, transformer_init):
+    preparer = PublicationPreparer(printer, pid_manager, session, fused_transform=False)
+
+    preparer._transform_node(MagicMock(), MagicMock())
+
+    assert transformer_init.call_args.kwargs["fused"] is False
+
+
 def test_transform_warnings(preparer: PublicationPreparer, transformer_init, printer):
     transformer = MagicMock()
     transformer_init.return_value = transformer
@@ -169,3 +231,166 @@ def test_manage_pids_warning(preparer, transformer_init, pid_manager):
     preparer._manage_node_pids(node_data, state)
 
     assert state.report.node_warnings[nl] == [warning]
+
+
+def _create_node_data(code: str) -> NodeData:
+    node = Node(code, code)
+    rows = {
+        TableType.PERSONS: [{"id": f"bbmri-eric:contactID:{code}_p1"}],
+        TableType.BIOBANKS: [
+            {
+                "id": f"bbmri-eric:ID:{code}_b1",
+                "name": "biobank",
+                "network": [],
+                "url": "invalid url",
+            }
+        ],
+        TableType.COLLECTIONS: [
+            {
+                "id": f"bbmri-eric:ID:{code}_b1:collection:c1",
+                "biobank": f"bbmri-eric:ID:{code}_b1",
+                "network": [],
+            }
+        ],
+    }
+    tables = dict()
+    for table_type in TableType.get_import_order():
+        meta = TableMeta(
+            {
+                "id": node.get_staging_id(table_type),
+                "attributes": {
+                    "items": [
+                        {"data": {"name": "id", "idAttribute": True, "type": "string"}},
+                        {
+                            "data": {
+                                "name": "url",
+                                "idAttribute": False,
+                                "type": "hyperlink",
+                            }
+                        },
+                    ]
+                },
+            }
+        )
+        tables[table_type.value] = Table.of(table_type, meta, rows.get(table_type, []))
+    return NodeData.from_dict(node, Source.STAGING, tables)
+
+
+def test_prepare_in_parallel(preparer, pid_manager):
+    nodes_data = [_create_node_data("NL"), _create_node_data("BE")]
+    nodes = [node_data.node for node_data in nodes_data]
+    existing_data = MixedData.from_mixed_dict(
+        Source.PUBLISHED,
+        {
+            type_.value: Table.of_placeholder(type_)
+            for type_ in TableType.get_import_order()
+        },
+    )
+    state = PublishingState(
+        existing_data=existing_data,
+        eu_node_data=_create_node_data("EU"),
+        quality_info=QualityInfo({}, {}, {}, {}),
+        nodes=nodes,
+        report=ErrorReport(nodes),
+        diseases=OntologyTable.of(
+            Table.of_placeholder(TableType.PERSONS).meta, [], "parentId"
+        ),
+    )
+    pid_warning = EricWarning("pid warning")
+    pid_manager.assign_biobank_pids.return_value = [pid_warning]
+
+    results = list(preparer.prepare_in_parallel(nodes_data, state, jobs=2))
+
+    assert [node for node, _, _ in results] == nodes
+    for (node, prepared_data, error), node_data in zip(results, nodes_data):
+        assert error is None
+        collection = prepared_data.collections.rows[0]
+        assert collection["national_node"] == node.code
+        assert collection["biobank_label"] == "biobank"
+        assert state.report.node_warnings[node] == [
+            EricWarning(
+                f"Biobank bbmri-eric:ID:{node.code}_b1 has an invalid url: invalid url"
+            ),
+            pid_warning,
+        ]
+    assert pid_manager.assign_biobank_pids.call_count == 2
+
+
+def test_prepare_in_parallel_error(preparer, pid_manager):
+    node_data = _create_node_data("NL")
+    state = MagicMock()
+    error = EricError("error")
+    pid_manager.assign_biobank_pids.side_effect = error
+
+    with patch(
+        "molgenis.bbmri_eric.publication_preparer.ProcessPoolExecutor"
+    ) as executor_init:
+        executor = executor_init.return_value.__enter__.return_value
+        executor.submit.return_value.result.return_value = (
+            node_data,
+            [],
+            ["line"],
+            None,
+        )
+
+        results = list(preparer.prepare_in_parallel([node_data], state, jobs=2))
+
+    assert results == [(node_data.node, None, error)]
+    preparer.printer.print.assert_any_call("line")
+
+
+def test_prepare_in_parallel_request_error(preparer, pid_manager):
+    node_data = _create_node_data("NL")
+    pid_manager.assign_biobank_pids.side_effect = requests.exceptions.ConnectionError()
+
+    with patch(
+        "molgenis.bbmri_eric.publication_preparer.ProcessPoolExecutor"
+    ) as executor_init:
+        executor = executor_init.return_value.__enter__.return_value
+        executor.submit.return_value.result.return_value = (node_data, [], [], None)
+
+        results = list(preparer.prepare_in_parallel([node_data], MagicMock(), jobs=2))
+
+    node, prepared_data, error = results[0]
+    assert prepared_data is None
+    assert str(error) == "Request failed"
+
+
+def test_prepare_in_parallel_worker_error(preparer, pid_manager):
+    node_data = _create_node_data("NL")
+    state = MagicMock()
+    error = EricError("error")
+    warning = EricWarning("warning")
+
+    with patch(
+        "molgenis.bbmri_eric.publication_preparer.ProcessPoolExecutor"
+    ) as executor_init:
+        executor = executor_init.return_value.__enter__.return_value
+        executor.submit.return_value.result.return_value = (
+            None,
+            [warning],
+            ["line"],
+            error,
+        )
+
+        results = list(preparer.prepare_in_parallel([node_data], state, jobs=2))
+
+    assert results == [(node_data.node, None, error)]
+    preparer.printer.print.assert_called_once_with("line")
+    state.report.add_node_warnings.assert_called_once_with(node_data.node, [warning])
+    pid_manager.assign_biobank_pids.assert_not_called()
+
+
+def test_prepare_in_worker_error():
+    node_data = _create_node_data("NL")
+    error = EricError("error")
+
+    def fail(preparer: PublicationPreparer, *_):
+        preparer.printer.print("line")
+        raise error
+
+    _init_worker(MagicMock())
+    with patch.object(PublicationPreparer, "_prepare_node_data", fail):
+        result = _prepare_in_worker(node_data)
+
+    assert result == (None, [], ["line"], error)
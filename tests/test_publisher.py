@@ -1,9 +1,10 @@
+from typing import Optional
 from unittest import mock
 from unittest.mock import MagicMock, patch
 
 import pytest
 
-from molgenis.bbmri_eric.errors import EricWarning, ErrorReport
+from molgenis.bbmri_eric.errors import EricError, EricWarning, ErrorReport
 from molgenis.bbmri_eric.model import (
     MixedData,
     Node,
@@ -11,9 +12,12 @@ from molgenis.bbmri_eric.model import (
     QualityInfo,
     Source,
     Table,
+    TableMeta,
     TableType,
 )
 from molgenis.bbmri_eric.publisher import Publisher, PublishingState
+from molgenis.bbmri_eric.reference_graph import ReferenceGraph
+from molgenis.client import MolgenisRequestError
 
 
 @pytest.fixture
@@ -29,8 +33,15 @@ def publisher(session, printer, pid_service) -> Publisher:
     return Publisher(session, printer, pid_service)
 
 
-def test_publish(publisher, session):
+@pytest.fixture
+def reference_graph_init():
+    with patch("molgenis.bbmri_eric.publisher.ReferenceGraph") as reference_graph_mock:
+        yield reference_graph_mock
+
+
+def test_publish(publisher, session, reference_graph_init):
     publisher._delete_rows = MagicMock()
+    references = reference_graph_init.of.return_value
 
     state = PublishingState(
         nodes=[Node.of("NL"), Node.of("BE")],
@@ -51,21 +62,257 @@ def test_publish(publisher, session):
 
     publisher.publish(state)
 
-    session.upload_data.assert_called_with(state.data_to_publish)
+    session.upload_data.assert_not_called()
+    reference_graph_init.of.assert_called_once_with(state.data_to_publish)
     assert publisher._delete_rows.mock_calls == [
-        mock.call(state.data_to_publish.facts, state.existing_data.facts, state),
         mock.call(
-            state.data_to_publish.collections, state.existing_data.collections, state
+            state.data_to_publish.facts, state.existing_data.facts, state, references
+        ),
+        mock.call(
+            state.data_to_publish.collections,
+            state.existing_data.collections,
+            state,
+            references,
+        ),
+        mock.call(
+            state.data_to_publish.biobanks,
+            state.existing_data.biobanks,
+            state,
+            references,
         ),
-        mock.call(state.data_to_publish.biobanks, state.existing_data.biobanks, state),
         mock.call(
             state.data_to_publish.also_known_in,
             state.existing_data.also_known_in,
             state,
+            references,
+        ),
+        mock.call(
+            state.data_to_publish.networks,
+            state.existing_data.networks,
+            state,
+            references,
+        ),
+        mock.call(
+            state.data_to_publish.persons,
+            state.existing_data.persons,
+            state,
+            references,
         ),
-        mock.call(state.data_to_publish.networks, state.existing_data.networks, state),
-        mock.call(state.data_to_publish.persons, state.existing_data.persons, state),
     ]
+    assert publisher.pid_manager.flush.call_count == 7
+    publisher.pid_manager.discard.assert_not_called()
+
+
+def _create_state(
+    existing_rows: dict, references: Optional[dict] = None
+) -> PublishingState:
+    """
+    :param references: per table type the mref attributes and the table types they
+    refer to
+    """
+
+    def meta(table_type: TableType) -> TableMeta:
+        items = [
+            {"data": {"name": name, "type": "string", "idAttribute": i == 0}}
+            for i, name in enumerate(["id", "name", "national_node"])
+        ]
+        for name, ref_type in (references or dict()).get(table_type, {}).items():
+            items.append(
+                {
+                    "data": {
+                        "name": name,
+                        "type": "mref",
+                        "idAttribute": False,
+                        "refEntityType": {"data": {"id": ref_type.base_id}},
+                    }
+                }
+            )
+        return TableMeta(
+            meta={"id": table_type.base_id, "attributes": {"items": items}}
+        )
+
+    existing_data = MixedData.from_mixed_dict(
+        Source.PUBLISHED,
+        {
+            type_.value: Table.of(type_, meta(type_), existing_rows.get(type_, []))
+            for type_ in TableType.get_import_order()
+        },
+    )
+    return PublishingState(
+        nodes=[Node.of("NL")],
+        existing_data=existing_data,
+        eu_node_data=MagicMock(),
+        quality_info=MagicMock(),
+        report=MagicMock(),
+        diseases=MagicMock(),
+    )
+
+
+def test_upsert_data_uploads_changes(publisher, session):
+    existing_rows = [
+        {"id": "p1", "national_node": "NL"},
+        {"id": "p2", "national_node": "NL"},
+    ]
+    state = _create_state({TableType.PERSONS: existing_rows})
+    state.data_to_publish.persons.rows_by_id.add_segment(
+        {
+            "p1": {"id": "p1", "name": "same", "national_node": "NL"},
+            "p2": {"id": "p2", "name": "changed", "national_node": "NL"},
+            "p3": {"id": "p3", "name": "new", "national_node": "NL"},
+        }
+    )
+    published = _create_state(
+        {
+            TableType.PERSONS: [
+                {"id": "p1", "name": "same", "national_node": "NL"},
+                {"id": "p2", "name": "old", "national_node": "NL"},
+            ]
+        }
+    ).existing_data
+    session.get_published_data.return_value = published
+
+    publisher._upsert_data(state)
+
+    session.get_published_data.assert_called_once_with([Node.of("NL")])
+    uploaded = session.upload_data.call_args[0][0]
+    assert list(uploaded.persons.rows_by_id) == ["p3", "p2"]
+    assert all(not table.rows_by_id for table in uploaded.import_order[1:])
+
+
+def test_upsert_data_without_changes(publisher, session):
+    state = _create_state({TableType.PERSONS: [{"id": "p1", "national_node": "NL"}]})
+    state.data_to_publish.persons.rows_by_id.add_segment(
+        {"p1": {"id": "p1", "national_node": "NL"}}
+    )
+    session.get_published_data.return_value = state.existing_data
+
+    publisher._upsert_data(state)
+
+    session.upload_data.assert_not_called()
+
+
+def test_publish_keeps_rows_referenced_by_mref(publisher, session):
+    references = {TableType.BIOBANKS: {"network": TableType.NETWORKS}}
+    state = _create_state(
+        {
+            TableType.NETWORKS: [
+                {"id": "n1", "national_node": "NL"},
+                {"id": "n2", "national_node": "NL"},
+            ]
+        },
+        references,
+    )
+    state.quality_info = QualityInfo({}, {}, {}, {})
+    state.report = ErrorReport([Node.of("NL")])
+    state.data_to_publish.networks.rows_by_id.add_segment(
+        {"n1": {"id": "n1", "national_node": "NL"}}
+    )
+    state.data_to_publish.biobanks.rows_by_id.add_segment(
+        {"b1": {"id": "b1", "national_node": "NL", "network": ["n1", "n2"]}}
+    )
+    session.get_published_data.return_value = _create_state(
+        dict(), references
+    ).existing_data
+
+    def join_lists(data):
+        # like the CSV writer of the molgenis client
+        for table in data.import_order:
+            for row in table.rows_by_id.values():
+                for key, value in row.items():
+                    if isinstance(value, list):
+                        row[key] = ",".join(value)
+
+    session.upload_data.side_effect = join_lists
+
+    publisher.publish(state)
+
+    session.upload_data.assert_called_once()
+    session.delete_list.assert_not_called()
+    assert state.report.node_warnings[Node.of("NL")] == [
+        EricWarning(
+            "Prevented the deletion of a row that is still referenced: networks n2 "
+            "(referenced by b1)."
+        )
+    ]
+
+
+def test_publish_skips_completed_phases(publisher, session):
+    publisher._delete_rows = MagicMock()
+    state = _create_state(dict())
+    state.data_to_publish.persons.rows_by_id.add_segment({"p1": {"id": "p1"}})
+    checkpoint = MagicMock()
+    checkpoint.is_done.side_effect = lambda phase: phase in {
+        "upsert",
+        "delete:facts",
+    }
+
+    publisher.publish(state, checkpoint)
+
+    session.upload_data.assert_not_called()
+    assert publisher._delete_rows.call_count == 5
+    assert checkpoint.set_done.mock_calls == [
+        mock.call("delete:collections"),
+        mock.call("delete:biobanks"),
+        mock.call("delete:also_known_in"),
+        mock.call("delete:networks"),
+        mock.call("delete:persons"),
+    ]
+
+
+def test_publish_upload_error_discards_pids(publisher, session):
+    session.upload_data.side_effect = MolgenisRequestError("error")
+    state = _create_state(dict())
+    state.data_to_publish.persons.rows_by_id.add_segment({"p1": {"id": "p1"}})
+
+    with pytest.raises(EricError):
+        publisher.publish(state)
+
+    publisher.pid_manager.discard.assert_called_once()
+    publisher.pid_manager.flush.assert_not_called()
+
+
+def test_plan(publisher, session, pid_service):
+    existing_rows = [
+        {"id": "p1", "national_node": "NL"},
+        {"id": "p2", "national_node": "NL"},
+    ]
+    state = _create_state({TableType.PERSONS: existing_rows})
+    state.quality_info = QualityInfo(
+        biobanks={}, biobank_levels={}, collections={}, collection_levels={}
+    )
+    state.data_to_publish.persons.rows_by_id.add_segment(
+        {
+            "p1": {"id": "p1", "name": "changed", "national_node": "NL"},
+            "p3": {"id": "p3", "name": "new", "national_node": "NL"},
+        }
+    )
+    session.get_published_data.return_value = _create_state(
+        {TableType.PERSONS: [{"id": "p1", "name": "old", "national_node": "NL"}]}
+    ).existing_data
+
+    plans = publisher.plan(state)
+
+    assert [plan.table_type for plan in plans] == [
+        table.type for table in state.data_to_publish.import_order
+    ]
+    persons = plans[0]
+    assert (persons.inserted, persons.changed, persons.deleted) == (1, 1, 1)
+    assert persons.upload_bytes > 0
+    assert not any(plan.has_changes for plan in plans[1:])
+    session.upload_data.assert_not_called()
+    session.delete_list.assert_not_called()
+    pid_service.terminate_biobanks.assert_not_called()
+
+
+def test_plan_error(publisher, session):
+    session.get_published_data.side_effect = MolgenisRequestError("error")
+    state = _create_state({TableType.PERSONS: [{"id": "p1", "national_node": "NL"}]})
+    state.data_to_publish.persons.rows_by_id.add_segment({"p1": {"id": "p1"}})
+
+    with pytest.raises(EricError) as e:
+        publisher.plan(state)
+
+    assert str(e.value) == "Error retrieving the published rows"
 
 
 def test_delete_rows(publisher, pid_service, node_data: NodeData, session):
@@ -100,7 +347,9 @@ def test_delete_rows(publisher, pid_service, node_data: NodeData, session):
         "the quality info: biobanks undeletable_id."
     )
 
-    publisher._delete_rows(node_data.biobanks, existing_biobanks_table, state)
+    publisher._delete_rows(
+        node_data.biobanks, existing_biobanks_table, state, ReferenceGraph.of(node_data)
+    )
 
     publisher.pid_manager.terminate_biobanks.assert_called_with(["pid2"])
     session.delete_list.assert_called_with(
@@ -108,3 +357,63 @@ def test_delete_rows(publisher, pid_service, node_data: NodeData, session):
     )
 
     assert state.report.node_warnings[node_data.node] == [warning1, warning2]
+
+
+def test_delete_rows_referenced(publisher, session):
+    tables = {
+        type_.value: Table.of_empty(type_, MagicMock())
+        for type_ in TableType.get_import_order()
+    }
+    tables["networks"].meta.id = "eu_bbmri_eric_networks"
+    biobanks_meta = MagicMock()
+    biobanks_meta.references = {"network": "eu_bbmri_eric_networks"}
+    tables["biobanks"] = Table.of(
+        TableType.BIOBANKS,
+        biobanks_meta,
+        [{"id": "bbmri-eric:ID:BE_b1", "network": ["bbmri-eric:networkID:NL_n1"]}],
+    )
+    data = MixedData.from_mixed_dict(Source.TRANSFORMED, tables)
+    existing_networks = Table.of(
+        TableType.NETWORKS,
+        MagicMock(),
+        [{"id": "bbmri-eric:networkID:NL_n1", "national_node": "NL"}],
+    )
+    state: PublishingState = MagicMock()
+    state.quality_info = QualityInfo({}, {}, {}, {})
+    state.report = ErrorReport([Node.of("NL")])
+
+    publisher._delete_rows(
+        data.networks, existing_networks, state, ReferenceGraph.of(data)
+    )
+
+    assert not session.delete_list.called
+    assert state.report.node_warnings[Node.of("NL")] == [
+        EricWarning(
+            "Prevented the deletion of a row that is still referenced: networks "
+            "bbmri-eric:networkID:NL_n1 (referenced by bbmri-eric:ID:BE_b1)."
+        )
+    ]
+
+
+def test_upsert_data_compares_eu_rows(publisher, session):
+    state = _create_state({TableType.PERSONS: [{"id": "p1", "national_node": "NL"}]})
+    state.data_to_publish.persons.rows_by_id.add_segment(
+        {
+            "p1": {"id": "p1", "national_node": "NL"},
+            "eu1": {"id": "eu1", "name": "same", "national_node": "EU"},
+        }
+    )
+    published = _create_state(
+        {
+            TableType.PERSONS: [
+                {"id": "p1", "national_node": "NL"},
+                {"id": "eu1", "name": "same", "national_node": "EU"},
+            ]
+        }
+    ).existing_data
+    session.get_published_data.return_value = published
+
+    publisher._upsert_data(state)
+
+    session.get_published_data.assert_called_once_with([Node.of("EU"), Node.of("NL")])
+    session.upload_data.assert_not_called()
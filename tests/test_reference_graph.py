@@ -0,0 +1,84 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from molgenis.bbmri_eric.model import Node, NodeData, Source, Table, TableType
+from molgenis.bbmri_eric.reference_graph import Reference, ReferenceGraph
+
+
+@pytest.fixture
+def data() -> NodeData:
+    node = Node.of("NL")
+    references = {
+        TableType.NETWORKS: {"contact": TableType.PERSONS},
+        TableType.BIOBANKS: {
+            "contact": TableType.PERSONS,
+            "network": TableType.NETWORKS,
+            "country": None,
+        },
+        TableType.COLLECTIONS: {
+            "biobank": TableType.BIOBANKS,
+            "diagnosis_available": None,
+        },
+    }
+    rows = {
+        TableType.PERSONS: [{"id": "p1"}],
+        TableType.NETWORKS: [{"id": "n1", "contact": "p1"}],
+        TableType.BIOBANKS: [
+            {"id": "b1", "contact": "p1", "network": ["n1", "n2"], "country": "NL"},
+            {"id": "b2", "network": []},
+        ],
+        TableType.COLLECTIONS: [
+            {"id": "c1", "biobank": "b1", "diagnosis_available": ["urn:x"]}
+        ],
+    }
+
+    tables = dict()
+    for table_type in TableType.get_import_order():
+        meta = MagicMock()
+        meta.id = node.get_staging_id(table_type)
+        meta.references = {
+            attr: node.get_staging_id(ref_type) if ref_type else "eu_other_table"
+            for attr, ref_type in references.get(table_type, {}).items()
+        }
+        tables[table_type.value] = Table.of(table_type, meta, rows.get(table_type, []))
+    return NodeData.from_dict(node, Source.STAGING, tables)
+
+
+def test_get_references(data):
+    graph = ReferenceGraph.of(data)
+
+    assert graph.get_references(TableType.BIOBANKS, "b1") == [
+        Reference(TableType.BIOBANKS, "b1", "contact", TableType.PERSONS, "p1"),
+        Reference(TableType.BIOBANKS, "b1", "network", TableType.NETWORKS, "n1"),
+        Reference(TableType.BIOBANKS, "b1", "network", TableType.NETWORKS, "n2"),
+    ]
+    assert graph.get_references(TableType.BIOBANKS, "b2") == []
+
+
+def test_get_referrers(data):
+    graph = ReferenceGraph.of(data)
+
+    assert graph.get_referrers(TableType.PERSONS, "p1") == [
+        Reference(TableType.NETWORKS, "n1", "contact", TableType.PERSONS, "p1"),
+        Reference(TableType.BIOBANKS, "b1", "contact", TableType.PERSONS, "p1"),
+    ]
+    assert graph.is_referenced(TableType.BIOBANKS, "b1")
+    assert not graph.is_referenced(TableType.BIOBANKS, "b2")
+    assert not graph.is_referenced(TableType.COLLECTIONS, "c1")
+
+
+def test_get_referenced_row(data):
+    graph = ReferenceGraph.of(data)
+
+    reference = graph.get_references(TableType.COLLECTIONS, "c1")[0]
+
+    assert graph.get_referenced_row(reference) is data.biobanks.rows_by_id["b1"]
+
+
+def test_get_dangling_references(data):
+    graph = ReferenceGraph.of(data)
+
+    assert graph.get_dangling_references() == [
+        Reference(TableType.BIOBANKS, "b1", "network", TableType.NETWORKS, "n2")
+    ]
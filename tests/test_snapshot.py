@@ -0,0 +1,109 @@
+import pytest
+
+from molgenis.bbmri_eric.model import (
+    ExternalServerNode,
+    MixedData,
+    Node,
+    NodeData,
+    Source,
+    Table,
+    TableType,
+)
+from molgenis.bbmri_eric.snapshot import load_snapshot, save_snapshot
+from tests.conftest import create_table_meta
+
+
+@pytest.fixture
+def mixed_data() -> MixedData:
+    rows = {
+        TableType.PERSONS: [
+            {"id": "p1", "national_node": "NL", "first_name": "Jan"},
+            {"id": "p2", "national_node": "BE", "title": None},
+        ],
+        TableType.BIOBANKS: [
+            {"id": "b1", "national_node": "NL", "network": ["n1", "n2"]},
+            {"id": "b2", "national_node": "BE", "withdrawn": True},
+        ],
+        TableType.COLLECTIONS: [
+            {"id": "c1", "national_node": "NL", "age_low": 0, "age_high": 8.5},
+        ],
+    }
+    tables = {
+        type_.value: Table.of(
+            type_, create_table_meta(type_.base_id), rows.get(type_, [])
+        )
+        for type_ in TableType.get_import_order()
+    }
+    return MixedData.from_mixed_dict(Source.PUBLISHED, tables)
+
+
+def test_snapshot_mixed_data(mixed_data, tmp_path):
+    path = tmp_path / "mixed.snapshot"
+
+    save_snapshot(mixed_data, path)
+    loaded = load_snapshot(path)
+
+    assert isinstance(loaded, MixedData)
+    assert loaded.source == Source.PUBLISHED
+    for table, loaded_table in zip(mixed_data.import_order, loaded.import_order):
+        assert loaded_table.rows_by_id == table.rows_by_id
+        assert loaded_table.meta == table.meta
+
+
+def test_snapshot_node_data(node_data, tmp_path):
+    path = tmp_path / "node.snapshot"
+    node = ExternalServerNode("NL", "Netherlands", url="url.nl", token="secret")
+    tables = {
+        table.type.value: Table(
+            table.rows_by_id, create_table_meta(table.type.base_id), table.type
+        )
+        for table in node_data.import_order
+    }
+    node_data = NodeData.from_dict(node, Source.EXTERNAL_SERVER, tables)
+
+    save_snapshot(node_data, path)
+    loaded = load_snapshot(path)
+
+    assert isinstance(loaded, NodeData)
+    assert loaded.node.code == "NL"
+    assert loaded.node.url == "url.nl"
+    assert loaded.node.token is None
+    assert loaded.source == Source.EXTERNAL_SERVER
+    for table, loaded_table in zip(node_data.import_order, loaded.import_order):
+        assert loaded_table.rows_by_id == table.rows_by_id
+
+
+def test_load_snapshot_single_table(mixed_data, tmp_path):
+    path = tmp_path / "mixed.snapshot"
+    save_snapshot(mixed_data, path)
+
+    loaded = load_snapshot(path, table_types=[TableType.BIOBANKS])
+
+    assert loaded.biobanks.rows_by_id == mixed_data.biobanks.rows_by_id
+    assert len(loaded.persons.rows_by_id) == 0
+    assert loaded.persons.meta == mixed_data.persons.meta
+
+
+def test_load_snapshot_single_node(mixed_data, tmp_path):
+    path = tmp_path / "mixed.snapshot"
+    save_snapshot(mixed_data, path)
+
+    loaded = load_snapshot(path, node=Node.of("BE"))
+
+    assert isinstance(loaded, NodeData)
+    assert loaded.node == Node.of("BE")
+    assert loaded.persons.rows == [{"id": "p2", "national_node": "BE", "title": None}]
+    assert loaded.biobanks.rows == [
+        {"id": "b2", "national_node": "BE", "withdrawn": True}
+    ]
+    assert loaded.collections.rows == []
+
+
+def test_load_snapshot_invalid_file(tmp_path):
+    path = tmp_path / "invalid.snapshot"
+    path.write_bytes(b"not a snapshot, but long enough")
+
+    with pytest.raises(ValueError) as e:
+        load_snapshot(path)
+
+    assert str(e.value) == "file is not an ERIC snapshot"
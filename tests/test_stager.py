@@ -25,11 +25,28 @@ def test_stager():
     stager._get_source_data.return_value = source_data
     node = ExternalServerNode("NL", "NL", url="url")
 
-    stager.stage(node)
+    staged_data = stager.stage(node)
 
     stager._get_source_data.assert_called_with(node)
     stager._clear_staging_area.assert_called_with(node)
     stager._import_node.assert_called_with(source_data)
+    assert staged_data == stager._import_node.return_value
+
+
+def test_fetch():
+    session = MagicMock()
+    stager = Stager(session, Printer())
+    source_data = MagicMock()
+    stager._get_source_data = MagicMock(name="_get_source_data")
+    stager._get_source_data.return_value = source_data
+    node = ExternalServerNode("NL", "NL", url="url")
+
+    fetched_data = stager.fetch(node)
+
+    stager._get_source_data.assert_called_with(node)
+    assert fetched_data == source_data.convert_to_staging.return_value
+    session.delete.assert_not_called()
+    session.upload_data.assert_not_called()
 
 
 def test_get_source_data(external_server_init):
@@ -38,9 +55,12 @@ def test_get_source_data(external_server_init):
     source_session_mock_instance = external_server_init.return_value
     source_session_mock_instance.get_node_data.return_value = node_data
 
-    source_data = Stager(MagicMock(), Printer())._get_source_data(node)
+    session = MagicMock()
+    session.batch_size = 500
+
+    source_data = Stager(session, Printer())._get_source_data(node)
 
-    external_server_init.assert_called_with(node=node)
+    external_server_init.assert_called_with(node=node, batch_size=500)
     assert source_data == node_data
 
 
@@ -65,12 +85,16 @@ def test_check_tables(external_server_init):
     session = external_server_init.return_value
     session.get.return_value = []
     session.node = node
-    stager = Stager(MagicMock(), Printer())
+    eric_session = MagicMock()
+    stager = Stager(eric_session, Printer())
     stager._check_permissions = MagicMock()
 
-    warnings = stager.stage(node)
+    stager.stage(node)
+    warnings = stager.warnings
 
-    external_server_init.assert_called_with(node=node)
+    external_server_init.assert_called_with(
+        node=node, batch_size=eric_session.batch_size
+    )
 
     assert session.get.call_count == 6
 
@@ -104,6 +128,7 @@ def test_import_node(session, external_server_init):
     converted_data = MagicMock()
     node_data.convert_to_staging.return_value = converted_data
 
-    Stager(session, Printer())._import_node(node_data)
+    staged_data = Stager(session, Printer())._import_node(node_data)
 
     session.upload_data.assert_called_with(converted_data)
+    assert staged_data == converted_data
@@ -1,9 +1,18 @@
-from unittest.mock import MagicMock, call
+from copy import deepcopy
+from unittest.mock import MagicMock
 
 import pytest
 
 from molgenis.bbmri_eric.errors import EricWarning
-from molgenis.bbmri_eric.model import Node, QualityInfo, Table, TableType
+from molgenis.bbmri_eric.model import (
+    Node,
+    NodeData,
+    OntologyTable,
+    QualityInfo,
+    Source,
+    Table,
+    TableType,
+)
 from molgenis.bbmri_eric.transformer import Transformer
 
 
@@ -290,9 +299,82 @@ def test_map_categories(transformer):
     collection2 = MagicMock()
     node_data.collections.rows = [collection1, collection2]
     category_mapper = MagicMock()
+    category_mapper.map_many.return_value = [["oncology"], []]
     transformer.node_data = node_data
     transformer.category_mapper = category_mapper
 
     transformer._set_collection_categories()
 
-    category_mapper.map.assert_has_calls([call(collection1), call(collection2)])
+    category_mapper.map_many.assert_called_once_with([collection1, collection2])
+    collection1.__setitem__.assert_called_once_with("categories", ["oncology"])
+    collection2.__setitem__.assert_called_once_with("categories", [])
+
+
+def _create_node_data(node: Node, rows: dict) -> NodeData:
+    return NodeData.from_dict(
+        node,
+        Source.STAGING,
+        {
+            type_.value: Table.of(type_, MagicMock(), deepcopy(rows.get(type_, [])))
+            for type_ in TableType.get_import_order()
+        },
+    )
+
+
+@pytest.mark.parametrize("date_end", [None, "20200101"])
+def test_transform_fused(date_end):
+    node = Node("NL", "NL", date_end)
+    eu_node_data = _create_node_data(
+        Node.of("EU"),
+        {TableType.PERSONS: [{"id": "bbmri-eric:contactID:EU_p1", "name": "EU"}]},
+    )
+    rows = {
+        TableType.PERSONS: [
+            {"id": "bbmri-eric:contactID:NL_p1"},
+            {"id": "bbmri-eric:contactID:EU_p1"},
+            {"id": "bbmri-eric:contactID:EU_unknown"},
+        ],
+        TableType.NETWORKS: [{"id": "bbmri-eric:networkID:EU_unknown"}],
+        TableType.BIOBANKS: [
+            {"id": "b1", "name": "B1", "network": ["n1"]},
+            {
+                "id": "b2",
+                "name": "B2",
+                "network": [],
+                "collaboration_commercial": False,
+            },
+        ],
+        TableType.COLLECTIONS: [
+            {"id": "c1", "biobank": "b1", "network": ["n2"], "age_unit": "YEAR"},
+            {"id": "c2", "biobank": "b2", "network": ["n1"], "type": ["RD"]},
+        ],
+        TableType.FACTS: [{"id": "f1"}],
+    }
+    quality = QualityInfo(
+        biobanks={"b1": ["q1"]},
+        biobank_levels={"b1": ["eric"]},
+        collections={"c2": ["q2"]},
+        collection_levels={"c2": ["accredited"]},
+    )
+    existing_biobanks = Table.of(
+        TableType.BIOBANKS, MagicMock(), [{"id": "b1", "pid": "pid1"}]
+    )
+    diseases = OntologyTable.of(MagicMock(), [], "parentId")
+
+    results = []
+    for fused in [False, True]:
+        node_data = _create_node_data(node, rows)
+        warnings = Transformer(
+            node_data=node_data,
+            quality=quality,
+            printer=MagicMock(),
+            existing_biobanks=existing_biobanks,
+            eu_node_data=deepcopy(eu_node_data),
+            diseases=diseases,
+            fused=fused,
+        ).transform()
+        tables = [dict(table.rows_by_id) for table in node_data.import_order]
+        results.append((tables, warnings))
+
+    assert results[0] == results[1]
+    assert len(results[1][1]) == 2
@@ -22,3 +22,34 @@ def test_to_ordered_dict(rows):
     rows_by_id = utils.to_ordered_dict(rows)
     assert rows_by_id["collA"]["parent_collection"] == "collB"
     assert rows_by_id["collB"]["sub_collections"] == ["collA"]
+
+
+def test_segmented_dict():
+    first = {"a": 1, "b": 2}
+    second = {"c": 3, "a": 4}
+    expected = dict()
+    expected.update(first)
+    expected.update(second)
+
+    segmented = utils.SegmentedDict([first, second])
+
+    assert list(segmented.keys()) == list(expected.keys())
+    assert list(segmented.values()) == list(expected.values())
+    assert len(segmented) == 3
+    assert "c" in segmented
+    assert "d" not in segmented
+    assert segmented["a"] == 4
+    with pytest.raises(KeyError):
+        _ = segmented["d"]
+
+
+def test_segmented_dict_shares_segments():
+    segment = {"a": 1}
+    segmented = utils.SegmentedDict()
+    assert len(segmented) == 0
+
+    segmented.add_segment(segment)
+    segment["b"] = 2
+
+    assert len(segmented) == 2
+    assert segmented["b"] == 2
@@ -3,14 +3,16 @@ from unittest.mock import MagicMock
 
 import pytest
 
-from molgenis.bbmri_eric.errors import EricWarning
+from molgenis.bbmri_eric.errors import EricError, EricWarning
+from molgenis.bbmri_eric.model import Node, TableType
 from molgenis.bbmri_eric.printer import Printer
-from molgenis.bbmri_eric.validation import Validator
-
-
-@pytest.fixture
-def validator() -> Validator:
-    return Validator(MagicMock(), MagicMock())
+from molgenis.bbmri_eric.validation import (
+    StreamingValidator,
+    TableRules,
+    Validator,
+    Violation,
+    to_warning,
+)
 
 
 def test_validate_id(node_data):
@@ -137,8 +139,95 @@ def test_validate_id(node_data):
         ),
     ],
 )
-def test_validate_collection_ages(
-    validator: Validator, collection: dict, expected: List[EricWarning]
-):
-    validator._validate_ages(collection)
-    assert validator.warnings == expected
+def test_validate_collection_ages(collection: dict, expected: List[EricWarning]):
+    meta = MagicMock()
+    meta.id = "eu_bbmri_eric_NL_collections"
+    meta.hyperlinks = []
+    rules = TableRules.compile(TableType.COLLECTIONS, meta, Node("NL", "NL"))
+
+    violations = rules.check_references([collection], set())
+
+    assert [to_warning(violation) for _, violation in violations] == expected
+
+
+def test_table_rules():
+    meta = MagicMock()
+    meta.id = "eu_bbmri_eric_NL_biobanks"
+    meta.hyperlinks = ["url", "logo"]
+    rules = TableRules.compile(TableType.BIOBANKS, meta, Node("NL", "NL"))
+    rows = [
+        {"id": "bbmri-eric:ID:NL_1", "url": "invalid", "logo": "invalid"},
+        {"id": "bbmri-eric:ID:BE_2", "network": ["bbmri-eric:networkID:BE_1"]},
+        {"id": "bbmri-eric:ID:NL_3#", "url": "https://url.nl"},
+    ]
+    invalid_ids = {"bbmri-eric:networkID:BE_1"}
+
+    assert rules.check_ids(rows, invalid_ids, offset=10) == [
+        (
+            11,
+            Violation(
+                "id_prefix",
+                (
+                    "bbmri-eric:ID:BE_2",
+                    "eu_bbmri_eric_NL_biobanks",
+                    "bbmri-eric:ID:NL_",
+                ),
+            ),
+        ),
+        (
+            12,
+            Violation("id_chars", ("bbmri-eric:ID:NL_3#", "eu_bbmri_eric_NL_biobanks")),
+        ),
+    ]
+    assert invalid_ids == {
+        "bbmri-eric:networkID:BE_1",
+        "bbmri-eric:ID:BE_2",
+        "bbmri-eric:ID:NL_3#",
+    }
+    assert rules.check_hyperlinks(rows) == [
+        (
+            0,
+            Violation("hyperlink", ("Biobank", "bbmri-eric:ID:NL_1", "url", "invalid")),
+        ),
+        (
+            0,
+            Violation(
+                "hyperlink", ("Biobank", "bbmri-eric:ID:NL_1", "logo", "invalid")
+            ),
+        ),
+    ]
+    assert rules.check_references(rows, invalid_ids) == [
+        (
+            1,
+            Violation("reference", ("bbmri-eric:ID:BE_2", "bbmri-eric:networkID:BE_1")),
+        )
+    ]
+
+
+def test_streaming_validator():
+    meta = MagicMock()
+    meta.id = "eu_bbmri_eric_NL_biobanks"
+    meta.hyperlinks = ["url"]
+    validator = StreamingValidator(Node("NL", "NL"), max_errors=2)
+
+    validator.validate_page(
+        TableType.BIOBANKS,
+        meta,
+        [{"id": "bbmri-eric:ID:NL_1"}, {"id": "bbmri-eric:ID:BE_2"}],
+        0,
+    )
+    assert validator.error_count == 1
+    assert validator.invalid_ids == {"bbmri-eric:ID:BE_2"}
+
+    with pytest.raises(EricError) as e:
+        validator.validate_page(
+            TableType.BIOBANKS,
+            meta,
+            [{"id": "bbmri-eric:ID:NL_3", "url": "invalid"}, {"id": "invalid"}],
+            2,
+        )
+
+    assert str(e.value) == (
+        "Aborted retrieving the staging data of node NL: 3 invalid ids and "
+        "hyperlinks exceed the maximum of 2"
+    )